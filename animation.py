@@ -0,0 +1,231 @@
+import pygame as pg
+import os
+import sys
+import time
+
+# スプライトシートの1コマの大きさ(食らい判定の Fighter.rect と同じ)
+CELL_SIZE = (60, 120)
+# シートの透明色(この色の画素は描かない)
+COLORKEY = (255, 0, 255)
+# 状態ごとのアニメーション: (シートの行, コマ数, 1コマのティック数, ループするか)
+# ループしないものは最後のコマで止まる(攻撃・被弾は最後まで再生したら元の状態に戻る)
+ANIMATIONS = {
+    "idle": (0, 4, 12, True),
+    "walk": (1, 6, 5, True),
+    "jump": (2, 2, 8, False),
+    "attack": (3, 4, 3, False),
+    "hit": (4, 2, 6, False),
+}
+# 再生し終わるまで他の状態に切り替えないもの
+ONESHOT_STATES = ("attack", "hit")
+
+
+# =====================
+# 仮のスプライトシート
+# =====================
+def placeholder_sheet(color, table=ANIMATIONS, cell=CELL_SIZE):
+    """
+    キャラクターの絵がまだ無いときの仮シート(右向き)。
+    状態ごとに体の形を少しずつ変えた四角い人形を描く。
+    """
+    w, h = cell
+    cols = max(count for _, count, _, _ in table.values())
+    rows = max(row for row, _, _, _ in table.values()) + 1
+    sheet = pg.Surface((w * cols, h * rows))
+    sheet.fill(COLORKEY)
+    light = tuple(min(255, c + 120) for c in color)
+    for state, (row, count, _, _) in table.items():
+        for col in range(count):
+            x, y = col * w, row * h
+            body = color
+            bob = 0
+            legs = (14, 32)
+            arm = None
+            if state == "idle":
+                bob = (0, 1, 2, 1)[col % 4]
+            elif state == "walk":
+                bob = col % 2
+                stride = (-6, -3, 0, 6, 3, 0)[col % 6]
+                legs = (14 + stride, 32 - stride)
+            elif state == "jump":
+                bob = -4 if col == 0 else 0
+                legs = (16, 30)
+            elif state == "attack":
+                arm = (0, 12, 20, 12)[col % 4]
+            elif state == "hit":
+                body = light if col == 0 else color
+                bob = 3
+            # 頭・胴・脚・目(目は前 = 右側)
+            pg.draw.rect(sheet, body, (x + 16, y + 4 + bob, 28, 26))
+            pg.draw.rect(sheet, body, (x + 12, y + 32 + bob, 36, 52 - bob))
+            pg.draw.rect(sheet, body, (x + legs[0], y + 84, 12, 36))
+            pg.draw.rect(sheet, body, (x + legs[1], y + 84, 12, 36))
+            pg.draw.rect(sheet, (255, 255, 255), (x + 34, y + 12 + bob, 6, 6))
+            if arm is not None:
+                pg.draw.rect(sheet, light, (x + 40, y + 44, arm + 8, 10))
+    return sheet
+
+
+# =====================
+# テクスチャアトラス
+# =====================
+def cut(sheet, rect, colorkey):
+    """
+    シートの rect の範囲を、カラーキーを RLEACCEL で付けた単独の Surface として複製する。
+    """
+    frame = sheet.subsurface(rect).copy()
+    frame.set_colorkey(colorkey, pg.RLEACCEL)
+    return frame
+
+
+class SpriteAtlas:
+    """
+    1枚のスプライトシート(右向き)を、向きごとのコマに切り分けて持つ(左向きは読み込み時に
+    1回だけ左右反転したシートから切り出す。シート自体は切り出した後は持たない)。
+    各コマは単独の Surface で、カラーキーを RLEACCEL で付けてある。
+    subsurface のままだと RLE が効かず、blit が単独の RLE Surface の3倍ほど遅いため。
+    描画時の変換は不要。
+    """
+    def __init__(self, sheet, cell=CELL_SIZE, colorkey=COLORKEY):
+        if pg.display.get_surface():
+            sheet = sheet.convert()
+        flipped = pg.transform.flip(sheet, True, False)
+        self.cell = cell
+        w, h = cell
+        sheet_w = sheet.get_width()
+        self.cols = sheet_w // w
+        self.rows = sheet.get_height() // h
+        # (行, 列, 向き) -> コマ。反転したシートでは列が右から並ぶ
+        self.frames = {}
+        for row in range(self.rows):
+            for col in range(self.cols):
+                x, y = col * w, row * h
+                self.frames[row, col, 1] = cut(sheet, (x, y, w, h), colorkey)
+                self.frames[row, col, -1] = cut(flipped, (sheet_w - x - w, y, w, h), colorkey)
+
+    def frame(self, row, col, facing=1):
+        return self.frames[row, col, facing]
+
+    def track(self, row, count, ticks, facing=1):
+        """
+        1ティック1要素に展開したコマの並び(再生中はティック数で引くだけでよい)。
+        """
+        return tuple(self.frames[row, col, facing] for col in range(count) for _ in range(ticks))
+
+
+_atlases = {}
+
+
+def load_atlas(path=None, color=(0, 0, 255)):
+    """
+    キャラクター1人分のアトラス。path の画像が無ければ color の仮シートを使う。
+    同じキャラクターは1回だけ読み込んで共有する。
+    """
+    key = (path, tuple(color))
+    atlas = _atlases.get(key)
+    if atlas is None:
+        if path is not None and os.path.exists(path):
+            sheet = pg.image.load(path)
+        else:
+            sheet = placeholder_sheet(color)
+        atlas = SpriteAtlas(sheet)
+        _atlases[key] = atlas
+    return atlas
+
+
+# =====================
+# アニメーション
+# =====================
+class Animator:
+    """
+    Fighter の状態(待機・歩き・ジャンプ・攻撃・被弾)に合わせてコマを選ぶ。
+    Fighter.step() が毎ティック update() を呼び、戻り値をそのまま fighter.image にする。
+    状態ごとのコマ列は向きごとに展開済みなので、1ティックの処理は表を引くだけ。
+    """
+    def __init__(self, atlas, table=ANIMATIONS):
+        self.tracks = {}
+        for state, (row, count, ticks, loop) in table.items():
+            self.tracks[state] = ({1: atlas.track(row, count, ticks, 1),
+                                   -1: atlas.track(row, count, ticks, -1)}, loop)
+        self.state = "idle"
+        self.time = 0
+        self.oneshot = None
+
+    def play(self, state):
+        """
+        攻撃・被弾など一度きりのアニメーションを最初から再生する。
+        """
+        self.oneshot = state
+        self.state = state
+        self.time = 0
+
+    def update(self, fighter):
+        """
+        1ティック進めて、表示するコマを返す。
+        """
+        state = self.oneshot
+        if state is not None and self.time >= len(self.tracks[state][0][1]):
+            state = self.oneshot = None
+        if state is None:
+            if not fighter.on_ground:
+                state = "jump"
+            elif fighter.vx:
+                state = "walk"
+            else:
+                state = "idle"
+            if state != self.state:
+                self.state = state
+                self.time = 0
+        frames, loop = self.tracks[state]
+        frames = frames[fighter.facing]
+        t = self.time
+        self.time = t + 1
+        if t >= len(frames):
+            t = t % len(frames) if loop else len(frames) - 1
+        return frames[t]
+
+
+def attach(fighter, atlas):
+    """
+    fighter をアトラスのアニメーションで描くようにする。
+    """
+    fighter.animator = Animator(atlas)
+    fighter.image = fighter.animator.update(fighter)
+
+
+# =====================
+# 実行(1ティックの更新と描画のコスト)
+# =====================
+if __name__ == "__main__":
+    from engine import new_match, random_policy
+
+    # 使い方: python animation.py [ティック数]
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    ticks = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    pg.display.init()
+    screen = pg.display.set_mode((1000, 600))
+
+    start = time.perf_counter()
+    atlases = [load_atlas(None, (0, 0, 255)), load_atlas(None, (255, 0, 0))]
+    print(f"load: {(time.perf_counter() - start) * 1e3:.1f} ms "
+          f"({atlases[0].cols}x{atlases[0].rows} cells, both facings)")
+
+    match = new_match()
+    for f, atlas in zip((match.p1, match.p2), atlases):
+        attach(f, atlas)
+    policy = random_policy(0)
+    states = {}
+    start = time.perf_counter()
+    for _ in range(ticks):
+        if match.step(policy(match, match.p1, match.p2), policy(match, match.p2, match.p1)):
+            match.reset()
+        states[match.p1.animator.state] = states.get(match.p1.animator.state, 0) + 1
+    step_us = (time.perf_counter() - start) / ticks * 1e6
+
+    start = time.perf_counter()
+    for _ in range(ticks):
+        for f in match.fighters:
+            screen.blit(f.image, f.rect)
+    blit_us = (time.perf_counter() - start) / ticks * 1e6
+    print(f"match.step with animation: {step_us:.2f} us/tick, blit 2 fighters: {blit_us:.2f} us")
+    print(f"P1 states: {states}")
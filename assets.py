@@ -0,0 +1,230 @@
+import pygame as pg
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+# 縮小・変換済みの画素を置く場所(スクリプトと同じフォルダ)
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".asset_cache")
+# キャッシュの画素形式(32bit のディスプレイ形式 XRGB8888 のリトルエンディアン並び)
+CACHE_FORMAT = "BGRA"
+CACHE_HEADER = struct.Struct("<4sII")
+CACHE_MAGIC = b"KKA1"
+
+
+# =====================
+# ディスクキャッシュ
+# =====================
+def cache_path(path, size, cache_dir=CACHE_DIR):
+    """
+    元画像のパス・更新時刻・ファイルサイズ・縮小後サイズから決まるキャッシュファイル名。
+    元画像が変わると別のファイル名になるので古いキャッシュは使われない。
+    """
+    st = os.stat(path)
+    key = f"{os.path.abspath(path)}|{st.st_mtime_ns}|{st.st_size}|{size[0]}x{size[1]}"
+    return os.path.join(cache_dir, hashlib.sha1(key.encode()).hexdigest() + ".raw")
+
+
+def read_cached(path, size, cache_dir=CACHE_DIR):
+    """
+    キャッシュがあればメモリマップした画素を直接参照する Surface を返す。無ければ None。
+    空・途中で切れた・形式の違うキャッシュは消して None を返す(次の書き込みで作り直す)。
+    mmap は Surface が参照されなくなった時点で閉じられる。
+    """
+    try:
+        cached = cache_path(path, size, cache_dir)
+        f = open(cached, "rb")
+    except OSError:
+        return None
+    mm = None
+    try:
+        with f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, w, h = CACHE_HEADER.unpack_from(mm)
+        if magic == CACHE_MAGIC and (w, h) == tuple(size) and len(mm) == CACHE_HEADER.size + w * h * 4:
+            return pg.image.frombuffer(memoryview(mm)[CACHE_HEADER.size:], (w, h), CACHE_FORMAT)
+    except (OSError, ValueError, struct.error):
+        # 0 バイトのファイルは mmap が ValueError、ヘッダより短いと unpack が struct.error
+        pass
+    if mm is not None:
+        mm.close()
+    try:
+        os.remove(cached)
+    except OSError:
+        pass
+    return None
+
+
+def write_cached(path, size, surf, cache_dir=CACHE_DIR):
+    """
+    縮小済みの Surface の画素をキャッシュに書く。一時ファイルに書いてから os.replace で
+    差し替えるので、途中で落ちても書きかけのキャッシュが読まれることはない。
+    """
+    tmp = None
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        dst = cache_path(path, size, cache_dir)
+        tmp = f"{dst}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(CACHE_HEADER.pack(CACHE_MAGIC, *size))
+            f.write(pg.image.tobytes(surf, CACHE_FORMAT))
+        os.replace(tmp, dst)
+    except OSError as e:
+        print(f"[asset cache error] {path} : {e}")
+        if tmp is not None:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+
+def decode(path, size, cache_dir=CACHE_DIR):
+    """
+    画像を (Surface, キャッシュから読んだか) として読み込む。
+    キャッシュが無ければ JPEG を展開・縮小してキャッシュに書く。
+    """
+    cached = read_cached(path, size, cache_dir)
+    if cached is not None:
+        return cached, True
+    surf = pg.transform.scale(pg.image.load(path), size)
+    write_cached(path, size, surf, cache_dir)
+    return surf, False
+
+
+# =====================
+# アセット管理
+# =====================
+class AssetManager:
+    """
+    背景画像などを名前(key)で管理する。
+    load(): その場で読み込む / preload(): 裏のスレッドで読み込みを始める /
+    get(): 読み込み済みなら Surface、まだなら None を返す(待たない) /
+    wait(): 読み込み終わるまで待って Surface を返す。
+    ディスプレイ形式への convert() は必ず get()/wait() を呼んだメインスレッドで行う。
+    """
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.sources = {}     # key -> (path, size)
+        self.surfaces = {}    # key -> convert 済みの Surface
+        self.decoded = {}     # key -> スレッドが読み終えた(まだ convert していない) Surface
+        self.errors = {}      # key -> 例外
+        self.timings = {}     # key -> (秒, キャッシュから読んだか)
+        self.cond = threading.Condition()
+        self.thread = None
+
+    def _decode(self, key):
+        path, size = self.sources[key]
+        start = time.perf_counter()
+        surf, from_cache = decode(path, size, self.cache_dir)
+        self.timings[key] = (time.perf_counter() - start, from_cache)
+        return surf
+
+    def _finish(self, key, surf):
+        """
+        読み込んだ Surface をディスプレイ形式に変換して登録する(メインスレッドで呼ぶ)。
+        """
+        self.surfaces[key] = surf.convert() if pg.display.get_surface() else surf.copy()
+        return self.surfaces[key]
+
+    def load(self, key, path, size):
+        """
+        その場で読み込んで Surface を返す。
+        """
+        self.sources[key] = (path, size)
+        return self._finish(key, self._decode(key))
+
+    def preload(self, items):
+        """
+        [(key, path, size), ...] を裏のスレッドで順に読み込み始める(登録済みの key は飛ばす)。
+        """
+        keys = []
+        for key, path, size in items:
+            if key in self.sources:
+                continue
+            self.sources[key] = (path, size)
+            keys.append(key)
+        self.thread = threading.Thread(target=self._worker, args=(keys,), daemon=True)
+        self.thread.start()
+
+    def _worker(self, keys):
+        for key in keys:
+            try:
+                result = self._decode(key)
+            except Exception as e:
+                with self.cond:
+                    self.errors[key] = e
+                    self.cond.notify_all()
+                continue
+            with self.cond:
+                self.decoded[key] = result
+                self.cond.notify_all()
+
+    def get(self, key):
+        """
+        読み込み済みなら Surface を、まだなら None を返す。
+        """
+        surf = self.surfaces.get(key)
+        if surf is not None:
+            return surf
+        with self.cond:
+            result = self.decoded.pop(key, None)
+        if result is None:
+            return None
+        return self._finish(key, result)
+
+    def wait(self, key):
+        """
+        読み込みが終わるまで待って Surface を返す。
+        裏で読み込んでいない key はその場で読み込む。
+        """
+        surf = self.get(key)
+        if surf is not None:
+            return surf
+        with self.cond:
+            if self.thread is not None and self.thread.is_alive():
+                self.cond.wait_for(lambda: key in self.decoded or key in self.errors
+                                   or not self.thread.is_alive())
+            error = self.errors.pop(key, None)
+        if error is not None:
+            raise error
+        surf = self.get(key)
+        if surf is None:
+            surf = self._finish(key, self._decode(key))
+        return surf
+
+    def progress(self):
+        """
+        (読み込み済みの数, 登録された数)。
+        """
+        with self.cond:
+            done = len(self.surfaces) + len(self.decoded) + len(self.errors)
+        return done, len(self.sources)
+
+
+# =====================
+# 実行(コールド/ウォーム起動の読み込み時間を比較)
+# =====================
+if __name__ == "__main__":
+    import shutil
+    import tempfile
+
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    pg.display.init()
+    pg.display.set_mode((1000, 600))
+
+    files = sys.argv[1:] or ["ダウンロード (1).jpg", "Tryfog.jpg", "ダウンロード.jpg",
+                             "3Dオリジナル背景作品 格闘ゲーム用背景.jpg"]
+    tmp = tempfile.mkdtemp()
+    try:
+        for label in ("cold", "warm"):
+            assets = AssetManager(tmp)
+            start = time.perf_counter()
+            for i, f in enumerate(files):
+                assets.load(i, f, (1000, 600))
+            print(f"{label}: {time.perf_counter() - start:.3f}s for {len(files)} images")
+    finally:
+        shutil.rmtree(tmp)
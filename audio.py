@@ -0,0 +1,140 @@
+import pygame as pg
+import os
+import threading
+
+# チャンネル割り当て(予約したチャンネルは find_channel() などで横取りされない)
+MUSIC_CHANNELS = (0, 1)  # BGM のクロスフェード用に2本
+SFX_CHANNELS = {
+    "hit": (2, 3, 4),
+    "ko": (5,),
+    "menu": (6,),
+}
+NUM_CHANNELS = 8
+RESERVED_CHANNELS = 7
+
+# BGM 切り替え時のフェード時間(ms)
+CROSSFADE_MS = 600
+
+
+# =====================
+# 音声管理
+# =====================
+class AudioManager:
+    """
+    BGM と効果音をまとめて管理する。
+    BGM は裏のスレッドで Sound として展開しておき、専用の2チャンネルでクロスフェードする
+    (pg.mixer.music.load のように切り替え時にメインスレッドで MP3 を展開しない)。
+    効果音は1回だけ読み込んだ Sound を、種類ごとに予約したチャンネルで鳴らす。
+    ミキサーが使えない環境ではすべて何もしない。
+    """
+    def __init__(self, volume=0.5):
+        self.enabled = pg.mixer.get_init() is not None
+        self.volume = volume
+        self.music = {}        # 名前 -> 展開済みの Sound
+        self.sfx = {}          # 名前 -> Sound
+        self.failed = set()    # 読み込みに失敗した名前(エラー表示は1回だけ)
+        self.current = None    # 再生中(または再生待ち)の BGM 名
+        self.pending = None    # 読み込み待ちで再生できていない BGM 名
+        self.music_slot = 0
+        self.sfx_next = {}
+        self.lock = threading.Lock()
+        if self.enabled:
+            pg.mixer.set_num_channels(NUM_CHANNELS)
+            pg.mixer.set_reserved(RESERVED_CHANNELS)
+
+    def preload_music(self, tracks):
+        """
+        {名前: パス} の BGM を裏のスレッドで展開し始める。
+        """
+        if not self.enabled:
+            return
+        thread = threading.Thread(target=self._load_music, args=(dict(tracks),), daemon=True)
+        thread.start()
+
+    def _load_music(self, tracks):
+        for name, path in tracks.items():
+            try:
+                sound = pg.mixer.Sound(path)
+            except Exception as e:
+                # ファイルが無いのは同梱していないだけなので黙って無音にする
+                if os.path.exists(path):
+                    print(f"[BGM load error] {path} : {e}")
+                with self.lock:
+                    self.failed.add(name)
+                continue
+            with self.lock:
+                self.music[name] = sound
+
+    def load_sfx(self, sounds):
+        """
+        {名前: パス} の効果音を読み込む。ファイルが無ければ黙ってその効果音を鳴らさない
+        (あるのに読めないときだけエラーを表示する)。
+        """
+        if not self.enabled:
+            return
+        for name, path in sounds.items():
+            if not os.path.exists(path):
+                continue
+            try:
+                self.sfx[name] = pg.mixer.Sound(path)
+            except Exception as e:
+                print(f"[SE load error] {path} : {e}")
+
+    def play_music(self, name):
+        """
+        BGM を切り替える。まだ展開中なら展開が終わった時点(update())で鳴らす。
+        """
+        if not self.enabled or name == self.current:
+            return
+        self.current = name
+        self.pending = name
+        self.update()
+
+    def update(self):
+        """
+        毎フレーム呼ぶ。展開待ちだった BGM の準備ができていれば再生を始める。
+        """
+        if self.pending is None:
+            return
+        with self.lock:
+            sound = self.music.get(self.pending)
+            if sound is None:
+                if self.pending in self.failed:
+                    self.pending = None
+                return
+        self.pending = None
+
+        old = pg.mixer.Channel(MUSIC_CHANNELS[self.music_slot])
+        self.music_slot = 1 - self.music_slot
+        new = pg.mixer.Channel(MUSIC_CHANNELS[self.music_slot])
+        old.fadeout(CROSSFADE_MS)
+        new.set_volume(self.volume)
+        new.play(sound, loops=-1, fade_ms=CROSSFADE_MS)
+
+    def play_sfx(self, name):
+        """
+        効果音を鳴らす。種類ごとの予約チャンネルが全部使用中なら順番に上書きする。
+        """
+        sound = self.sfx.get(name)
+        if sound is None:
+            return
+        channels = SFX_CHANNELS[name]
+        for index in channels:
+            ch = pg.mixer.Channel(index)
+            if not ch.get_busy():
+                break
+        else:
+            i = self.sfx_next.get(name, 0)
+            ch = pg.mixer.Channel(channels[i])
+            self.sfx_next[name] = (i + 1) % len(channels)
+        ch.set_volume(self.volume)
+        ch.play(sound)
+
+    def set_volume(self, volume):
+        """
+        音量(0.0〜1.0)を変更する。BGM・効果音の両方に効く。
+        """
+        self.volume = volume
+        if not self.enabled:
+            return
+        pg.mixer.Channel(MUSIC_CHANNELS[self.music_slot]).set_volume(volume)
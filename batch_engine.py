@@ -0,0 +1,242 @@
+import numpy as np
+import sys
+import time
+
+from engine import (
+    FLOOR, SIM_HZ, IN_LEFT, IN_RIGHT, IN_JUMP, IN_ATTACK, DEFAULT_RULES,
+)
+
+# ファイターの大きさ・初期位置(engine.new_match と同じ)
+FIGHTER_W, FIGHTER_H = 60, 120
+START_X = (200, 700)
+
+# 観測ベクトルの並び(1プレイヤーあたり)
+FIGHTER_OBS = ("x", "y", "vx", "vy", "on_ground", "facing", "hp")
+OBS_SIZE = 2 * len(FIGHTER_OBS) + 2  # 2人分 + 残り時間 + 生存中の攻撃数
+
+
+# =====================
+# バッチシミュレータ(NumPy の配列で N 試合を同時に進める)
+# =====================
+class BatchMatch:
+    """
+    N 試合分のファイター・攻撃を配列(構造体の配列ではなく配列の構造体)で持ち、
+    engine.Match と同じルールで全試合をまとめて1ティック進める。
+    Gym 風に reset() / step(actions) で観測・報酬・終了フラグを返す。
+
+    actions: shape (N, 2) の入力ビット(engine.IN_* の組み合わせ)
+    auto_reset: True なら終了した試合は step() の最後に自動で初期状態に戻す
+    """
+    def __init__(self, n, rules=DEFAULT_RULES, auto_reset=True):
+        self.n = n
+        self.rules = rules
+        self.auto_reset = auto_reset
+
+        # 攻撃は1ティックに1人1発までなので、1人あたり寿命ぶんの枠があれば足りる
+        self.slots = max(1, rules.attack_life)
+        self.cap = rules.attack_cap
+        self.atk_w, self.atk_h = rules.attack_size
+
+        # ファイター (N, 2)
+        self.x = np.zeros((n, 2), np.int32)
+        self.y = np.zeros((n, 2), np.int32)
+        self.vx = np.zeros((n, 2), np.int32)
+        self.vy = np.zeros((n, 2), np.int32)
+        self.on_ground = np.zeros((n, 2), bool)
+        self.facing = np.zeros((n, 2), np.int32)
+        self.hp = np.zeros((n, 2), np.int32)
+
+        # 攻撃 (N, 2, slots) -- 2 は発射したプレイヤー(owner)
+        shape = (n, 2, self.slots)
+        self.ax = np.zeros(shape, np.int32)
+        self.ay = np.zeros(shape, np.int32)
+        self.avx = np.zeros(shape, np.int32)
+        self.life = np.zeros(shape, np.int32)
+        self.alive = np.zeros(shape, bool)
+        self.head = np.zeros((n, 2), np.int32)
+
+        self.tick = np.zeros(n, np.int32)
+        self.done = np.zeros(n, bool)
+
+        self._rows = np.arange(n)
+        self.reset()
+
+    def reset(self, mask=None):
+        """
+        試合を初期状態に戻して観測を返す。mask を渡すとその試合だけ戻す。
+        """
+        if mask is None:
+            mask = np.ones(self.n, bool)
+        self.x[mask] = START_X
+        self.y[mask] = FLOOR - FIGHTER_H
+        self.vx[mask] = 0
+        self.vy[mask] = 0
+        self.on_ground[mask] = True
+        self.facing[mask] = 1
+        self.hp[mask] = self.rules.max_hp
+        self.alive[mask] = False
+        self.life[mask] = 0
+        self.head[mask] = 0
+        self.tick[mask] = 0
+        self.done[mask] = False
+        return self.observe()
+
+    def _spawn(self, pressed):
+        """
+        攻撃ボタンが押された試合・プレイヤーの前方に攻撃を出す。
+        """
+        rules = self.rules
+        if self.cap < self.slots:
+            # 1人あたりの同時攻撃数の上限(engine.AttackPool と同じ)
+            pressed = pressed & (self.alive.sum(axis=2) < self.cap)
+        for p in (0, 1):
+            rows = self._rows[pressed[:, p]]
+            if rows.size == 0:
+                continue
+            slot = self.head[rows, p]
+            right = self.facing[rows, p] == 1
+            self.ax[rows, p, slot] = np.where(right, self.x[rows, p] + FIGHTER_W,
+                                              self.x[rows, p] - self.atk_w)
+            self.ay[rows, p, slot] = self.y[rows, p] + FIGHTER_H // 2 - self.atk_h // 2
+            self.avx[rows, p, slot] = np.where(right, rules.attack_speed, -rules.attack_speed)
+            self.life[rows, p, slot] = rules.attack_life
+            self.alive[rows, p, slot] = True
+            self.head[rows, p] = (slot + 1) % self.slots
+
+    def _move_fighters(self, actions):
+        """
+        Fighter.step と同じ移動・ジャンプ・重力・地面判定。
+        """
+        rules = self.rules
+        left = (actions & IN_LEFT) != 0
+        right = (actions & IN_RIGHT) != 0
+        jump = ((actions & IN_JUMP) != 0) & self.on_ground
+
+        self.vx[:] = 0
+        self.vx[left] = -rules.move_speed
+        self.facing[left] = -1
+        self.vx[right] = rules.move_speed
+        self.facing[right] = 1
+
+        self.vy[jump] = -rules.jump_speed
+        self.on_ground[jump] = False
+
+        self.vy += rules.gravity
+        self.x += self.vx
+        self.y += self.vy
+
+        landed = self.y + FIGHTER_H >= FLOOR
+        self.y[landed] = FLOOR - FIGHTER_H
+        self.vy[landed] = 0
+        self.on_ground[landed] = True
+
+    def _move_attacks(self):
+        """
+        Attack.update と同じ横移動と寿命処理。
+        """
+        alive = self.alive
+        self.ax += np.where(alive, self.avx, 0)
+        self.life -= alive
+        alive &= self.life > 0
+
+    def _hits(self):
+        """
+        攻撃と相手ファイターの矩形の重なりを調べ、当たった攻撃を消してダメージ数を返す。
+        返り値: shape (N, 2) の被弾回数
+        """
+        # owner 0 の攻撃は player 1 に、owner 1 の攻撃は player 0 に当たる
+        tx = self.x[:, ::-1, None]
+        ty = self.y[:, ::-1, None]
+        hit = (self.alive
+               & (self.ax < tx + FIGHTER_W) & (self.ax + self.atk_w > tx)
+               & (self.ay < ty + FIGHTER_H) & (self.ay + self.atk_h > ty))
+        self.alive &= ~hit
+        # (owner ごとの命中数) を (被弾側ごと) に並べ替える
+        return hit.sum(axis=2)[:, ::-1]
+
+    def step(self, actions):
+        """
+        全試合を1ティック進める。
+        返り値: (観測 (N, OBS_SIZE), 報酬 (N, 2), 終了 (N,), info)
+        info["winner"]: 終了した試合の勝者(0=P1, 1=P2, -1=引き分け、進行中は -2)
+        info["ko"]: KO で終わったかどうか
+        """
+        actions = np.asarray(actions, np.int32).reshape(self.n, 2)
+        active = ~self.done
+        actions = np.where(active[:, None], actions, 0)
+
+        self._spawn(((actions & IN_ATTACK) != 0) & active[:, None])
+
+        self.tick += active
+        prev_hp = self.hp.copy()
+
+        # 終了済みの試合(auto_reset=False のとき)は状態を動かさない
+        frozen = self.done.copy()
+        if frozen.any():
+            state = (self.x, self.y, self.vx, self.vy, self.on_ground,
+                     self.ax, self.life, self.alive)
+            keep = [arr[frozen].copy() for arr in state]
+
+        self._move_fighters(actions)
+        self._move_attacks()
+        hits = self._hits()
+
+        if frozen.any():
+            for arr, saved in zip(state, keep):
+                arr[frozen] = saved
+            hits[frozen] = 0
+        self.hp -= hits * self.rules.damage
+
+        ko = (self.hp <= 0).any(axis=1)
+        finished = active & (ko | (self.tick >= self.rules.match_ticks))
+
+        # 報酬: 与えたダメージ - 受けたダメージ(最大HPで正規化) + 勝敗 ±1
+        taken = (prev_hp - self.hp) / self.rules.max_hp
+        rewards = (taken[:, ::-1] - taken).astype(np.float32)
+        winner = np.full(self.n, -2, np.int32)
+        winner[finished] = np.where(self.hp[finished, 0] > self.hp[finished, 1], 0,
+                                    np.where(self.hp[finished, 1] > self.hp[finished, 0], 1, -1))
+        rewards[winner == 0] += (1.0, -1.0)
+        rewards[winner == 1] += (-1.0, 1.0)
+
+        self.done |= finished
+        info = {"winner": winner, "ko": ko & finished, "ticks": self.tick.copy()}
+        if self.auto_reset and finished.any():
+            self.reset(finished)
+        return self.observe(), rewards, finished, info
+
+    def observe(self):
+        """
+        試合ごとの観測ベクトル (N, OBS_SIZE) を返す。
+        """
+        obs = np.empty((self.n, OBS_SIZE), np.float32)
+        k = len(FIGHTER_OBS)
+        for p in (0, 1):
+            obs[:, p * k:(p + 1) * k] = np.stack(
+                (self.x[:, p], self.y[:, p], self.vx[:, p], self.vy[:, p],
+                 self.on_ground[:, p], self.facing[:, p], self.hp[:, p]), axis=1)
+        obs[:, -2] = np.maximum(0, self.rules.match_ticks - self.tick) / SIM_HZ
+        obs[:, -1] = self.alive.sum(axis=(1, 2))
+        return obs
+
+
+# =====================
+# 実行(ランダム入力での速度計測)
+# =====================
+if __name__ == "__main__":
+    # 使い方: python batch_engine.py [試合数] [ティック数] [seed]
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 4096
+    ticks = int(sys.argv[2]) if len(sys.argv) > 2 else 600
+    seed = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+
+    rng = np.random.default_rng(seed)
+    env = BatchMatch(n)
+    finished = 0
+    start = time.perf_counter()
+    for _ in range(ticks):
+        actions = rng.integers(0, 8, (n, 2)) | np.where(rng.random((n, 2)) < 0.1, IN_ATTACK, 0)
+        _, _, done, _ = env.step(actions)
+        finished += int(done.sum())
+    elapsed = time.perf_counter() - start
+    print(f"{n} matches x {ticks} ticks in {elapsed:.2f}s "
+          f"({n * ticks / elapsed:.0f} match-ticks/s, {finished} finished)")
@@ -0,0 +1,471 @@
+import os
+
+# 画面・音声なしで動かす(pygame の import より前に設定する)
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+import pygame as pg
+
+# 結果の保存先(compare の比較元は bench.py run --out で保存したもの)
+BENCH_OUT = "bench_results.json"
+# これ以上遅くなったら劣化とみなす割合
+REGRESSION_THRESHOLD = 0.10
+# 1回の計測に使う最低時間(秒)と繰り返し回数
+MIN_TIME = 0.2
+REPEAT = 5
+# バトル系のベンチマークは毎回同じ内容になるよう、このティック数ごとに試合を最初に戻す
+BATTLE_CYCLE = 600
+
+BENCHMARKS = {}
+
+
+def bench(name):
+    """
+    ベンチマークの登録。関数は準備をしてから「1回分の処理」を行う関数を返す。
+    """
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def measure(fn, min_time=MIN_TIME, repeat=REPEAT):
+    """
+    fn を min_time 秒以上かかる回数まとめて呼び、それを repeat 回繰り返す。
+    1回あたりの時間(マイクロ秒)の中央値・最小値を返す。
+    """
+    fn()
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / repeat or loops >= 1 << 20:
+            break
+        loops *= 2
+    times = [elapsed / loops]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        times.append((time.perf_counter() - start) / loops)
+    return {"us": statistics.median(times) * 1e6, "min_us": min(times) * 1e6, "loops": loops}
+
+
+def battle_cycle(match):
+    """
+    ランダム入力で match を1ティック進める関数を返す。BATTLE_CYCLE ティックごとに
+    開始時の状態と同じ乱数列に戻すので、何回呼んでも同じ内容の繰り返しになる。
+    """
+    from engine import random_policy
+
+    start = bytearray(match.state_size())
+    match.save_state(start)
+    state = {}
+
+    def restart():
+        match.load_state(start)
+        state["policies"] = (random_policy(1), random_policy(2))
+
+    def step():
+        if match.tick >= BATTLE_CYCLE:
+            restart()
+        policy1, policy2 = state["policies"]
+        if match.step(policy1(match, match.p1, match.p2), policy2(match, match.p2, match.p1)):
+            restart()
+    restart()
+    return step
+
+
+_game = None
+
+
+def game_instance():
+    """
+    ベンチマークで共有する Game(初回のみ作る。画面・フォント・音声の初期化もここで行われる)。
+    """
+    global _game
+    if _game is None:
+        import kakutou_koukaton
+        _game = kakutou_koukaton.Game()
+    return _game
+
+
+def python_startup(code):
+    """
+    別プロセスの Python で code を実行する関数(起動時間の計測用)。
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    def run():
+        subprocess.run([sys.executable, "-c", code], cwd=here, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return run
+
+
+# =====================
+# 起動
+# =====================
+@bench("startup.import")
+def bench_import():
+    """
+    別プロセスで kakutou_koukaton を import するまでの時間(Python 自体の起動を含む)。
+    """
+    return python_startup("import kakutou_koukaton")
+
+
+@bench("startup.first_frame")
+def bench_first_frame():
+    """
+    別プロセスで import してからタイトル画面の最初のフレームを出すまでの時間。
+    """
+    return python_startup("import kakutou_koukaton as k; k.Game().run(frames=1)")
+
+
+# =====================
+# 描画
+# =====================
+def battle_frame(dirty, screens=None):
+    """
+    screens: ステージの横幅(画面何枚分か)。与えるとその幅に引き伸ばした背景とカメラで描く
+    """
+    import kakutou_koukaton as k
+    from animation import attach, load_atlas
+    from engine import WIDTH, HEIGHT, new_match
+    from render import BattleRenderer, Camera
+
+    game = game_instance()
+    match = new_match()
+    for f in (match.p1, match.p2):
+        attach(f, load_atlas(*k.FIGHTER_SHEETS[f.name]))
+    bg = k.ASSETS.wait(("stage", 0))
+    camera = None
+    if screens is not None:
+        width = WIDTH * screens
+        bg = pg.transform.scale(bg, (width, HEIGHT))
+        match.set_stage(width)
+        camera = Camera(WIDTH, width)
+        camera.follow(match.fighters.sprites(), snap=True)
+    renderer = BattleRenderer(game.screen, dirty)
+    step = battle_cycle(match)
+
+    def frame():
+        step()
+        game.hud.sync_time(match)
+        if camera is not None:
+            camera.follow(match.fighters.sprites())
+        renderer.draw(bg, (match.fighters, match.attacks), 1.0,
+                      game.hud, k.P1_KEYS_TEXT, k.P2_KEYS_TEXT, camera=camera)
+    return frame
+
+
+@bench("render.battle_frame_full")
+def bench_battle_full():
+    """
+    1ティック進めて背景・スプライト・HUD を全画面描き直す。
+    """
+    return battle_frame(False)
+
+
+@bench("render.battle_frame_dirty")
+def bench_battle_dirty():
+    """
+    1ティック進めて変化した矩形だけ描き直す(ゲームの既定)。
+    """
+    return battle_frame(True)
+
+
+@bench("render.stage_1x")
+def bench_stage_1x():
+    """
+    画面1枚分の幅のステージをカメラ付きで全画面描き直す(render.stage_4x と比べる用)。
+    """
+    return battle_frame(False, 1)
+
+
+@bench("render.stage_4x")
+def bench_stage_4x():
+    """
+    画面4枚分の幅のステージ。背景は映す範囲だけ切り出すので render.stage_1x と同じくらいになるはず。
+    """
+    return battle_frame(False, 4)
+
+
+@bench("render.hud")
+def bench_hud():
+    import kakutou_koukaton as k
+
+    game = game_instance()
+    hud = k.HUD()
+
+    def frame():
+        hud.draw_top(game.screen)
+        hud.draw_bottom_controls(game.screen, k.P1_KEYS_TEXT, k.P2_KEYS_TEXT)
+    return frame
+
+
+@bench("render.pause")
+def bench_pause():
+    game = game_instance()
+    game.pause_menu.open(game.screen.copy())
+
+    def frame():
+        game.pause_menu.draw(game.screen)
+        pg.display.update()
+    return frame
+
+
+@bench("render.settings")
+def bench_settings():
+    game = game_instance()
+    game.settings_menu.open(game.screen.copy())
+
+    def frame():
+        game.settings_menu.draw(game.screen)
+        pg.display.update()
+    return frame
+
+
+@bench("render.title")
+def bench_title():
+    import kakutou_koukaton as k
+
+    game = game_instance()
+
+    def frame():
+        k.draw_title(game.screen)
+        pg.display.update()
+    return frame
+
+
+@bench("render.select")
+def bench_select():
+    import kakutou_koukaton as k
+
+    game = game_instance()
+    k.ASSETS.wait(("stage", 0))
+
+    def frame():
+        k.draw_select(game.screen, 0)
+        pg.display.update()
+    return frame
+
+
+@bench("render.particles_500")
+def bench_particles():
+    """
+    500 個のパーティクルを1ティック進めて描く(ParticleSystem.update + draw)。
+    """
+    from particles import ParticleSystem, PARTICLE_HZ
+
+    game = game_instance()
+    ps = ParticleSystem(seed=0)
+    # 寿命を延ばして常に 500 個生きている状態で測る
+    for i in range(10):
+        ps.emit("ko", (100 + i * 80, 300), 50 / ps.scale)
+    ps.life[:ps.live] = 30000
+    ps.max_life[:ps.live] = 30000
+
+    def frame():
+        ps.update(1 / PARTICLE_HZ)
+        ps.draw(game.screen)
+    return frame
+
+
+# =====================
+# シミュレーション
+# =====================
+def fighters_update(n):
+    from engine import Fighter, P1_KEYS
+
+    rng = random.Random(0)
+    fighters = [Fighter(rng.randrange(0, 900), (0, 0, 255), P1_KEYS) for _ in range(n)]
+    inputs = [rng.getrandbits(3) for _ in range(256)]
+
+    def tick():
+        for i, f in enumerate(fighters):
+            f.step(inputs[i & 255])
+    return tick
+
+
+@bench("sim.fighter_update_2")
+def bench_fighters_2():
+    return fighters_update(2)
+
+
+@bench("sim.fighter_update_256")
+def bench_fighters_256():
+    return fighters_update(256)
+
+
+@bench("sim.match_tick")
+def bench_match_tick():
+    """
+    engine.Match.step 1回(ランダム入力、攻撃・当たり判定込み)。
+    """
+    from engine import new_match
+
+    return battle_cycle(new_match())
+
+
+def attack_collision(m):
+    """
+    2人のファイターと m 個の攻撃の当たり判定(Match.step の判定部分と同じ手順)。
+    """
+    from collision import CollisionWorld
+    from engine import Attack, new_match
+
+    rng = random.Random(0)
+    match = new_match()
+    attacks = []
+    for i in range(m):
+        atk = Attack(match.p1 if i % 2 == 0 else match.p2)
+        atk.rect.x = rng.randrange(0, 1000)
+        atk.rect.y = rng.randrange(300, 560)
+        attacks.append(atk)
+    world = CollisionWorld()
+
+    def tick():
+        world.begin()
+        world.registry.clear()
+        for team, f in enumerate((match.p1, match.p2)):
+            for r in f.hurtboxes():
+                world.add_hurtbox(r, team, f)
+        for atk in attacks:
+            team = 0 if atk.owner is match.p1 else 1
+            for r in atk.hitboxes():
+                world.add_hitbox(r, team, atk, atk.owner)
+        world.detect()
+    return tick
+
+
+@bench("collision.attacks_8")
+def bench_collision_8():
+    return attack_collision(8)
+
+
+@bench("collision.attacks_60")
+def bench_collision_60():
+    return attack_collision(60)
+
+
+@bench("collision.attacks_1000")
+def bench_collision_1000():
+    return attack_collision(1000)
+
+
+# =====================
+# 実行・比較
+# =====================
+def run(names=None, min_time=MIN_TIME, repeat=REPEAT, exact=False):
+    """
+    names に一致する(exact=False なら名前に含む)ベンチマークを計測する。
+    """
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if names and not (name in names if exact else any(n in name for n in names)):
+            continue
+        results[name] = measure(setup(), min_time, repeat)
+        print(f"{name:<28} {results[name]['us']:>12.1f} us")
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "pygame": pg.version.ver,
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def compare(baseline, current, threshold=REGRESSION_THRESHOLD):
+    """
+    baseline と current を比べて表示し、(threshold 以上遅くなったベンチマーク名のリスト,
+    baseline にあって current に無いベンチマーク名のリスト) を返す。
+    他の処理の割り込みに左右されにくいよう、繰り返しの中の最小値で比べる。
+    """
+    regressions = []
+    print(f"{'benchmark (min us)':<28} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, cur in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            print(f"{name:<28} {'-':>12} {cur['min_us']:>12.1f}      new")
+            continue
+        change = cur["min_us"] / base["min_us"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        elif change < -threshold:
+            flag = "  faster"
+        print(f"{name:<28} {base['min_us']:>12.1f} {cur['min_us']:>12.1f} {change:>+7.1%}{flag}")
+    # 名前が変わった・途中で落ちたなどで計測されなかったものも見逃さない
+    missing = [name for name in baseline["results"] if name not in current["results"]]
+    for name in missing:
+        print(f"{name:<28} {baseline['results'][name]['min_us']:>12.1f} {'-':>12}  MISSING")
+    return regressions, missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description="描画・シミュレーション・当たり判定のベンチマーク")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_run = sub.add_parser("run", help="計測して JSON に保存する")
+    p_run.add_argument("names", nargs="*", help="名前にこの文字列を含むものだけ計測する")
+    p_run.add_argument("--out", default=BENCH_OUT)
+    p_run.add_argument("--min-time", type=float, default=MIN_TIME)
+    p_run.add_argument("--repeat", type=int, default=REPEAT)
+
+    p_cmp = sub.add_parser("compare", help="保存した結果と比べて劣化を報告する(劣化があれば終了コード 1)")
+    p_cmp.add_argument("baseline")
+    p_cmp.add_argument("current", nargs="?", help="省略するとその場で計測する")
+    p_cmp.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    p_cmp.add_argument("--min-time", type=float, default=MIN_TIME)
+    p_cmp.add_argument("--repeat", type=int, default=REPEAT)
+
+    sub.add_parser("list", help="ベンチマークの一覧")
+
+    args = parser.parse_args()
+    if args.command == "list":
+        for name in BENCHMARKS:
+            print(name)
+        return
+
+    if args.command == "run":
+        data = run(args.names, args.min_time, args.repeat)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        print(f"saved to {args.out}")
+        return
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if args.current:
+        with open(args.current, encoding="utf-8") as f:
+            current = json.load(f)
+    else:
+        current = run(list(baseline["results"]), args.min_time, args.repeat, exact=True)
+        print()
+    regressions, missing = compare(baseline, current, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+    if missing:
+        print(f"{len(missing)} missing: {', '.join(missing)}")
+    if regressions or missing:
+        sys.exit(1)
+    print("no regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,444 @@
+import asyncio
+import socket
+import struct
+import sys
+import threading
+import time
+
+# 観戦配信の待ち受けアドレス(localhost のみ)
+BROADCAST_HOST = "127.0.0.1"
+BROADCAST_PORT = 50700
+# このティック数ごとに全員へキーフレーム(差分でない全状態)を送る
+KEYFRAME_INTERVAL = 60
+# 送信待ちがこのバイト数を超えたクライアントにはフレームを送らない(追いついたらキーフレームから再開)
+CLIENT_BUFFER_LIMIT = 64 * 1024
+# クライアントごとの OS の送信バッファ(大きいと詰まったことに気づくまで遅れが溜まる)
+CLIENT_SNDBUF = 16 * 1024
+
+# フレーム: 種類, ペイロードのバイト数 / ペイロードは varint の並び
+FRAME_HEADER = struct.Struct("<BH")
+KIND_KEY = 1
+KIND_DELTA = 2
+# 状態の並び(すべて整数)
+# 先頭: tick, ステージ番号, 残り時間(1/100 秒), P1 の勝ち数, P2 の勝ち数
+# ファイター × 2: x, y, 幅, 高さ, hp, 向き / 攻撃の数 / 攻撃ごと: x, y, 幅, 高さ, P1 の攻撃か
+HEADER_FIELDS = 5
+FIGHTER_FIELDS = 6
+ATTACK_FIELDS = 5
+
+
+def state_fields(match, hud, stage):
+    """
+    配信する試合状態を整数のリストにする(メインスレッドで毎ティック呼ぶ)。
+    """
+    fields = [match.tick, stage, int(hud.match_time * 100), hud.p1_wins, hud.p2_wins]
+    for f in (match.p1, match.p2):
+        r = f.rect
+        fields += (r.x, r.y, r.width, r.height, f.hp, f.facing)
+    fields.append(len(match.attacks))
+    p1 = match.p1
+    for atk in match.attacks:
+        r = atk.rect
+        fields += (r.x, r.y, r.width, r.height, atk.owner is p1)
+    return fields
+
+
+def split_fields(fields):
+    """
+    state_fields() の並びを (先頭, [ファイター, ファイター], [攻撃, ...]) に分ける。
+    """
+    pos = HEADER_FIELDS
+    fighters = []
+    for _ in range(2):
+        fighters.append(fields[pos:pos + FIGHTER_FIELDS])
+        pos += FIGHTER_FIELDS
+    count = fields[pos]
+    pos += 1
+    attacks = [fields[pos + i * ATTACK_FIELDS:pos + (i + 1) * ATTACK_FIELDS] for i in range(count)]
+    return fields[:HEADER_FIELDS], fighters, attacks
+
+
+# =====================
+# 符号化(キーフレームと差分)
+# =====================
+def write_varint(out, value):
+    # 負の数も短くなるように zigzag にしてから 7 ビットずつ
+    value = value << 1 if value >= 0 else (-value << 1) - 1
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data, pos):
+    value = shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        value |= (b & 0x7F) << shift
+        if b < 0x80:
+            return (value >> 1 if not value & 1 else -((value + 1) >> 1)), pos
+        shift += 7
+
+
+def encode_key(fields):
+    """
+    キーフレーム: 要素数と全要素。
+    """
+    out = bytearray()
+    write_varint(out, len(fields))
+    for v in fields:
+        write_varint(out, v)
+    return FRAME_HEADER.pack(KIND_KEY, len(out)) + out
+
+
+def encode_delta(fields, prev):
+    """
+    差分フレーム: 要素数、前のフレームから変わった要素のビットマップ、変わった要素の差。
+    前のフレームに無い要素(攻撃が増えた分)は 0 からの差にする。
+    """
+    n = len(fields)
+    mask = bytearray((n + 7) // 8)
+    diffs = bytearray()
+    prev_n = len(prev)
+    for i, v in enumerate(fields):
+        d = v - (prev[i] if i < prev_n else 0)
+        if d:
+            mask[i >> 3] |= 1 << (i & 7)
+            write_varint(diffs, d)
+    out = bytearray()
+    write_varint(out, n)
+    out += mask
+    out += diffs
+    return FRAME_HEADER.pack(KIND_DELTA, len(out)) + out
+
+
+def decode(kind, payload, prev):
+    """
+    フレームのペイロードから状態の並びを復元する(差分は prev に当てる)。
+    """
+    n, pos = read_varint(payload, 0)
+    if kind == KIND_KEY:
+        fields = []
+        for _ in range(n):
+            v, pos = read_varint(payload, pos)
+            fields.append(v)
+        return fields
+    if prev is None:
+        raise ValueError("delta frame without a keyframe")
+    mask = payload[pos:pos + (n + 7) // 8]
+    pos += len(mask)
+    fields = list(prev[:n]) + [0] * (n - len(prev))
+    for i in range(n):
+        if mask[i >> 3] & (1 << (i & 7)):
+            d, pos = read_varint(payload, pos)
+            fields[i] += d
+    return fields
+
+
+# =====================
+# 配信サーバー
+# =====================
+class Spectator:
+    """
+    接続中の観戦クライアント1つ分の送信状態と統計。
+    """
+    def __init__(self, writer):
+        self.writer = writer
+        self.address = writer.get_extra_info("peername")
+        self.need_key = True
+        self.connected = time.perf_counter()
+        self.disconnected = None
+        self.bytes = 0
+        self.frames = 0
+        self.keyframes = 0
+        self.dropped = 0
+
+
+class BroadcastServer:
+    """
+    試合状態を毎ティック、localhost の観戦クライアントへ配信する。
+    asyncio のループは別スレッドで動き、publish() は状態を整数に写してループに渡すだけなので
+    試合を待たせない。送信が詰まったクライアントにはそのフレームを送らずに数え、
+    追いついたらキーフレームから送り直す(他のクライアントには影響しない)。
+    """
+    def __init__(self, host=BROADCAST_HOST, port=BROADCAST_PORT,
+                 keyframe_interval=KEYFRAME_INTERVAL, buffer_limit=CLIENT_BUFFER_LIMIT,
+                 sndbuf=CLIENT_SNDBUF):
+        self.host = host
+        self.port = port
+        self.keyframe_interval = keyframe_interval
+        self.buffer_limit = buffer_limit
+        self.sndbuf = sndbuf
+        self.clients = []
+        self.finished = []     # 切断したクライアント(統計用)
+        self.prev = None
+        self.since_key = 0
+        self.published = 0
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.ready = threading.Event()
+        self.error = None
+
+    def start(self):
+        """
+        待ち受けを始める(使えるようになるまで待つ)。失敗したら OSError。
+        """
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        self.ready.wait()
+        if self.error is not None:
+            raise self.error
+
+    def _run(self):
+        loop = self.loop = asyncio.new_event_loop()
+        try:
+            self.server = loop.run_until_complete(
+                asyncio.start_server(self._serve, self.host, self.port))
+        except OSError as e:
+            self.error = e
+            self.ready.set()
+            return
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.ready.set()
+        loop.run_forever()
+        self.server.close()
+        for client in self.clients:
+            client.writer.close()
+        loop.run_until_complete(self.server.wait_closed())
+        loop.close()
+
+    async def _serve(self, reader, writer):
+        sock = writer.get_extra_info("socket")
+        if sock is not None and self.sndbuf:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.sndbuf)
+        client = Spectator(writer)
+        self.clients.append(client)
+        try:
+            # 観戦側からは何も送られてこない。切断されるまで待つ
+            while await reader.read(1024):
+                pass
+        except ConnectionError:
+            pass
+        finally:
+            self._drop(client)
+            writer.close()
+
+    def _drop(self, client):
+        if client in self.clients:
+            self.clients.remove(client)
+            client.disconnected = time.perf_counter()
+            self.finished.append(client)
+
+    def publish(self, match, hud, stage):
+        """
+        今のティックの状態を配信する(メインスレッドから呼ぶ)。
+        """
+        if self.loop is None or self.error is not None:
+            return
+        self.published += 1
+        self.loop.call_soon_threadsafe(self._fanout, state_fields(match, hud, stage))
+
+    def _fanout(self, fields):
+        prev = self.prev
+        self.prev = fields
+        self.since_key += 1
+        periodic = prev is None or self.since_key >= self.keyframe_interval
+        if periodic:
+            self.since_key = 0
+        key = delta = None
+        for client in list(self.clients):
+            transport = client.writer.transport
+            if transport.is_closing():
+                self._drop(client)
+                continue
+            if transport.get_write_buffer_size() > self.buffer_limit:
+                client.dropped += 1
+                client.need_key = True
+                continue
+            if periodic or client.need_key:
+                if key is None:
+                    key = encode_key(fields)
+                data = key
+                client.need_key = False
+                client.keyframes += 1
+            else:
+                if delta is None:
+                    delta = encode_delta(fields, prev)
+                data = delta
+            client.writer.write(data)
+            client.bytes += len(data)
+            client.frames += 1
+
+    def close(self):
+        if self.loop is not None and self.thread is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.thread = None
+
+    def stats(self):
+        """
+        クライアントごと(切断したものも含む)の送信量と帯域(バイト/秒)。
+        """
+        now = time.perf_counter()
+        rows = []
+        for client in self.finished + list(self.clients):
+            end = client.disconnected if client.disconnected is not None else now
+            elapsed = max(1e-9, end - client.connected)
+            rows.append({"address": client.address, "connected": client.disconnected is None,
+                         "frames": client.frames,
+                         "keyframes": client.keyframes, "dropped": client.dropped,
+                         "bytes": client.bytes, "bytes_per_s": client.bytes / elapsed})
+        return rows
+
+    def summary(self):
+        lines = [f"broadcast on {self.host}:{self.port}: {self.published} ticks, "
+                 f"{len(self.clients)} spectators"]
+        for s in self.stats():
+            lines.append(f"  {s['address'][0]}:{s['address'][1]}  {s['bytes_per_s'] / 1024:.1f} KiB/s  "
+                         f"{s['frames']} frames ({s['keyframes']} key)  {s['dropped']} dropped"
+                         + ("" if s["connected"] else "  (disconnected)"))
+        return "\n".join(lines)
+
+
+# =====================
+# 観戦クライアント
+# =====================
+class SpectatorClient:
+    """
+    配信サーバーにつないでフレームを読み続け、最新の状態だけを残す(asyncio のループは別スレッド)。
+    つながらない・切れたときは retry 秒ごとにつなぎ直す。
+    """
+    def __init__(self, host=BROADCAST_HOST, port=BROADCAST_PORT, retry=0.5):
+        self.host = host
+        self.port = port
+        self.retry = retry
+        self.lock = threading.Lock()
+        self.fields = None
+        self.serial = 0       # 受け取ったフレーム数(新しい状態が来たかの判定用)
+        self.bytes = 0
+        self.connected = False
+        self.loop = None
+        self.thread = None
+
+    def start(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.task = self.loop.create_task(self._receive())
+        try:
+            self.loop.run_until_complete(self.task)
+        except asyncio.CancelledError:
+            pass
+        self.loop.close()
+
+    async def _receive(self):
+        while True:
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+            except OSError:
+                await asyncio.sleep(self.retry)
+                continue
+            self.connected = True
+            fields = None
+            try:
+                while True:
+                    header = await reader.readexactly(FRAME_HEADER.size)
+                    kind, size = FRAME_HEADER.unpack(header)
+                    payload = await reader.readexactly(size)
+                    fields = decode(kind, payload, fields)
+                    with self.lock:
+                        self.fields = fields
+                        self.serial += 1
+                        self.bytes += len(header) + size
+            except (asyncio.IncompleteReadError, ConnectionError):
+                pass
+            finally:
+                self.connected = False
+                writer.close()
+            await asyncio.sleep(self.retry)
+
+    def latest(self):
+        """
+        (受け取ったフレーム数, 最新の状態の並び)。まだ何も届いていなければ状態は None。
+        """
+        with self.lock:
+            return self.serial, self.fields
+
+    def close(self):
+        if self.thread is not None:
+            self.loop.call_soon_threadsafe(self.task.cancel)
+            self.thread.join()
+            self.thread = None
+
+
+def parse_address(text, default_port=BROADCAST_PORT):
+    """
+    "host:port" / "port" / "host" を (host, port) にする。
+    """
+    if not text:
+        return BROADCAST_HOST, default_port
+    host, _, port = text.rpartition(":")
+    if not host:
+        return (BROADCAST_HOST, int(port)) if port.isdigit() else (port, default_port)
+    return host, int(port)
+
+
+# =====================
+# 実行(localhost で配信し、読まないクライアントがいても他が遅れないか確認)
+# =====================
+if __name__ == "__main__":
+    from engine import new_match, random_policy, MATCH_TIME
+
+    class _Hud:
+        match_time = MATCH_TIME
+        p1_wins = 0
+        p2_wins = 0
+
+    # 使い方: python broadcast.py [観戦クライアント数] [ティック数]
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    ticks = int(sys.argv[2]) if len(sys.argv) > 2 else 3000
+
+    # 詰まったクライアントがすぐ分かるよう、送信待ちの上限を小さくしておく
+    server = BroadcastServer(port=0, buffer_limit=4096)
+    server.start()
+    clients = [SpectatorClient(port=server.port) for _ in range(n)]
+    for c in clients:
+        c.start()
+    # 受信しないクライアント(受信バッファを小さくして詰まらせる)
+    stalled = socket.socket()
+    stalled.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    stalled.connect(("127.0.0.1", server.port))
+    while len(server.clients) < n + 1:
+        time.sleep(0.01)
+
+    match = new_match()
+    hud = _Hud()
+    policy = random_policy(0)
+    worst = 0.0
+    start = time.perf_counter()
+    for i in range(ticks):
+        if match.step(policy(match, match.p1, match.p2), policy(match, match.p2, match.p1)):
+            hud.p1_wins += 1
+            match.reset()
+        hud.match_time = match.match_time
+        t = time.perf_counter()
+        server.publish(match, hud, 0)
+        worst = max(worst, time.perf_counter() - t)
+        time.sleep(max(0.0, start + (i + 1) / 600 - time.perf_counter()))
+    expected = state_fields(match, hud, 0)
+    time.sleep(0.3)
+
+    key = len(encode_key(expected))
+    print(f"{ticks} ticks, publish() worst {worst * 1e6:.0f} us, keyframe {key} bytes")
+    print(server.summary())
+    ok = all(c.latest()[1] == expected for c in clients)
+    print("spectators in sync" if ok else "SPECTATOR MISMATCH")
+    for c in clients:
+        c.close()
+    stalled.close()
+    server.close()
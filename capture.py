@@ -0,0 +1,226 @@
+import pygame as pg
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+
+# 画面を写しておくバッファの数(書き出しが追いつかずに全部埋まったら、そのフレームは捨てる)
+CAPTURE_SLOTS = 8
+# 書き出し形式: "png"(連番 PNG)/ "ffmpeg"(生の画素をパイプで ffmpeg に渡して動画にする)
+CAPTURE_FORMATS = ("png", "ffmpeg")
+DEFAULT_FORMAT = "ffmpeg"
+CAPTURE_FPS = 60
+# ffmpeg に渡すエンコード設定(速さ優先。画質を上げるなら -crf を下げる)
+FFMPEG_OPTIONS = ("-c:v", "libx264", "-preset", "ultrafast", "-crf", "23", "-pix_fmt", "yuv420p")
+
+
+def raw_format(surface):
+    """
+    Surface の画素をそのまま ffmpeg に渡せるときの -pix_fmt(変換が要るなら None)。
+    """
+    if surface.get_bytesize() != 4 or surface.get_pitch() != surface.get_width() * 4:
+        return None
+    masks = surface.get_masks()[:3]
+    if sys.byteorder == "little":
+        return {(0xFF0000, 0xFF00, 0xFF): "bgr0", (0xFF, 0xFF00, 0xFF0000): "rgb0"}.get(masks)
+    return {(0xFF0000, 0xFF00, 0xFF): "0rgb", (0xFF, 0xFF00, 0xFF0000): "0bgr"}.get(masks)
+
+
+# =====================
+# 画面の録画
+# =====================
+class FrameCapture:
+    """
+    表示したフレームを、あらかじめ確保した Surface のリングに写し、裏のスレッドで書き出す。
+    capture() は空いている Surface に画面を blit するだけ(フレームごとに Surface を作らない)。
+    書き出しが追いつかず空きが無いときは、ゲームを待たせずにそのフレームを捨てて数える。
+    捨てた分は次に記録できたフレームを同じ数だけ繰り返して書くので、動画の長さは実際の時間とずれない。
+    """
+    def __init__(self, out_dir, fmt=DEFAULT_FORMAT, slots=CAPTURE_SLOTS, fps=CAPTURE_FPS):
+        self.out_dir = out_dir
+        self.fmt = fmt
+        self.slots = slots
+        self.fps = fps
+        self.surfaces = []
+        self.free = []
+        self.queue = deque()     # (枠の番号, フレーム番号, 書く回数)
+        self.cond = threading.Condition()
+        self.thread = None
+        self.pipe = None
+        self.path = None
+        self.closed = False
+        self.error = None
+
+        # 統計
+        self.captured = 0
+        self.dropped = 0
+        self.written = 0
+        # 出力のフレーム番号(捨てたフレームの分も進める)と、まだ埋めていない捨てたフレームの数
+        self.frames = 0
+        self.pending = 0
+        self.last_slot = None
+
+    @property
+    def active(self):
+        return self.thread is not None
+
+    def start(self, screen):
+        """
+        screen と同じ大きさ・画素形式のバッファを確保して書き出しスレッドを始める。
+        """
+        if self.active:
+            return
+        size = screen.get_size()
+        if len(self.surfaces) != self.slots or self.surfaces[0].get_size() != size:
+            self.surfaces = [pg.Surface(size, 0, screen) for _ in range(self.slots)]
+        self.free = list(range(self.slots))
+        self.queue.clear()
+        self.captured = self.dropped = self.written = 0
+        self.frames = self.pending = 0
+        self.last_slot = None
+        self.closed = False
+        self.error = None
+
+        if self.fmt == "ffmpeg" and shutil.which("ffmpeg") is None:
+            print("[capture] ffmpeg not found, writing PNG frames instead")
+            self.fmt = "png"
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        os.makedirs(self.out_dir, exist_ok=True)
+        if self.fmt == "ffmpeg":
+            self.path = os.path.join(self.out_dir, f"{stamp}.mp4")
+            pix_fmt = raw_format(self.surfaces[0]) or "rgb24"
+            w, h = size
+            cmd = ["ffmpeg", "-loglevel", "error", "-y", "-f", "rawvideo", "-pix_fmt", pix_fmt,
+                   "-s", f"{w}x{h}", "-r", str(self.fps), "-i", "-", *FFMPEG_OPTIONS, self.path]
+            self.pipe = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+        else:
+            self.path = os.path.join(self.out_dir, stamp)
+            os.makedirs(self.path, exist_ok=True)
+        self.thread = threading.Thread(target=self._worker, daemon=True)
+        self.thread.start()
+
+    def capture(self, screen):
+        """
+        今の画面を1フレーム分記録する(空きが無ければ捨てる)。記録したら True。
+        """
+        with self.cond:
+            if not self.free:
+                self.dropped += 1
+                self.pending += 1
+                return False
+            slot = self.free.pop()
+        self.surfaces[slot].blit(screen, (0, 0))
+        with self.cond:
+            repeat = 1 + self.pending
+            self.queue.append((slot, self.frames, repeat))
+            self.last_slot = slot
+            self.frames += repeat
+            self.pending = 0
+            self.captured += 1
+            self.cond.notify()
+        return True
+
+    def stop(self):
+        """
+        記録をやめる。溜まっているフレームを書き終えるまで待つ。
+        """
+        if not self.active:
+            return
+        with self.cond:
+            # 最後に捨てたフレームの分は最後に記録したフレームで埋める(もう上書きされない)
+            if self.pending and self.last_slot is not None:
+                self.queue.append((self.last_slot, self.frames, self.pending))
+                self.frames += self.pending
+                self.pending = 0
+            self.closed = True
+            self.cond.notify()
+        self.thread.join()
+        self.thread = None
+        if self.pipe is not None:
+            try:
+                self.pipe.stdin.close()
+            except OSError:
+                pass
+            self.pipe.wait()
+            self.pipe = None
+        print(self.summary())
+
+    def _worker(self):
+        while True:
+            with self.cond:
+                while not self.queue and not self.closed:
+                    self.cond.wait()
+                if not self.queue:
+                    return
+                slot, frame, repeat = self.queue.popleft()
+            try:
+                if self.error is None:
+                    self._write(self.surfaces[slot], frame, repeat)
+                    self.written += repeat
+            except (OSError, pg.error) as e:
+                # 書き出せなくなったら以降のフレームは捨てる(ゲームは止めない)
+                self.error = e
+                print(f"[capture error] {e}")
+            with self.cond:
+                self.free.append(slot)
+
+    def _write(self, surface, frame, repeat=1):
+        """
+        surface を frame 番目から repeat フレーム分書く(2回目以降は捨てたフレームの穴埋め)。
+        """
+        if self.pipe is not None:
+            data = surface.get_buffer() if raw_format(surface) else pg.image.tobytes(surface, "RGB")
+            for _ in range(repeat):
+                self.pipe.stdin.write(data)
+        else:
+            first = os.path.join(self.path, f"{frame:06d}.png")
+            pg.image.save(surface, first)
+            for i in range(1, repeat):
+                shutil.copyfile(first, os.path.join(self.path, f"{frame + i:06d}.png"))
+
+    def stats(self):
+        return {"captured": self.captured, "dropped": self.dropped, "written": self.written,
+                "frames": self.frames,
+                "queued": len(self.queue), "format": self.fmt, "path": self.path}
+
+    def summary(self):
+        total = self.captured + self.dropped
+        rate = self.dropped / total * 100 if total else 0.0
+        return (f"capture: {self.captured} captured, {self.dropped} dropped ({rate:.1f}%), "
+                f"{self.written} frames written -> {self.path}")
+
+
+# =====================
+# 実行(1フレームあたりのメインスレッドのコストと、書き出しの速さ)
+# =====================
+if __name__ == "__main__":
+    import tempfile
+
+    # 使い方: python capture.py [フレーム数] [png|ffmpeg]
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    fmt = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_FORMAT
+    pg.display.init()
+    screen = pg.display.set_mode((1000, 600))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cap = FrameCapture(tmp, fmt)
+        cap.start(screen)
+        worst = 0.0
+        total = 0.0
+        start = time.perf_counter()
+        for i in range(frames):
+            screen.fill((i % 256, 80, 160))
+            pg.draw.rect(screen, (255, 255, 255), (i * 3 % 940, 300, 60, 120))
+            t = time.perf_counter()
+            cap.capture(screen)
+            t = time.perf_counter() - t
+            worst = max(worst, t)
+            total += t
+            # 60fps のフレーム間隔(この間に書き出しスレッドが動く)
+            time.sleep(max(0.0, start + (i + 1) / 60 - time.perf_counter()))
+        cap.stop()
+        print(f"capture() per frame: mean {total / frames * 1e6:.0f} us, worst {worst * 1e6:.0f} us")
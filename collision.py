@@ -0,0 +1,166 @@
+import random
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:  # NumPy が無くても Python の総当たりで動く
+    np = None
+
+# 攻撃判定数 × 食らい判定数がこれ未満なら NumPy を使わず Python で総当たりする
+# (数十個程度までは配列を作るコストの方が大きい。python collision.py で計測)
+VECTORIZE_MIN = 2000
+
+
+# =====================
+# 当たりイベント
+# =====================
+class HitEvent:
+    """
+    攻撃判定(hitbox)が食らい判定(hurtbox)に当たったことを表す。
+    attacker: 攻撃側の持ち主 / target: 食らった側の持ち主 / move: 技(1技1ヒットの単位)
+    """
+    __slots__ = ("attacker", "target", "move", "hitbox", "hurtbox")
+
+    def __init__(self, attacker, target, move, hitbox, hurtbox):
+        self.attacker = attacker
+        self.target = target
+        self.move = move
+        self.hitbox = hitbox
+        self.hurtbox = hurtbox
+
+
+# =====================
+# 当たり判定
+# =====================
+class CollisionWorld:
+    """
+    1ティック分の攻撃判定・食らい判定を集めて、当たりをまとめて調べる。
+    begin() → add_hitbox()/add_hurtbox() → detect() の順に呼ぶ。
+    同じチーム同士は当たらない。1つの技は同じ相手に1回しか当たらない
+    (技が終わったら end_move() で記録を消す)。
+    判定の数が多いときは x 方向のソート(sweep and prune)で候補を絞り、
+    NumPy でまとめて矩形の重なりを調べる。
+    """
+    def __init__(self):
+        # 攻撃判定: (x0, y0, x1, y1, team, move, owner)
+        self.hitboxes = []
+        # 食らい判定: (x0, y0, x1, y1, team, owner)
+        self.hurtboxes = []
+        # move -> すでに当てた相手(owner)の集合
+        self.registry = {}
+
+    def begin(self):
+        self.hitboxes.clear()
+        self.hurtboxes.clear()
+
+    def add_hitbox(self, rect, team, move, owner):
+        self.hitboxes.append((rect.left, rect.top, rect.right, rect.bottom, team, move, owner))
+
+    def add_hurtbox(self, rect, team, owner):
+        self.hurtboxes.append((rect.left, rect.top, rect.right, rect.bottom, team, owner))
+
+    def end_move(self, move):
+        """
+        技が終わったら呼ぶ(1技1ヒットの記録を消す)。
+        """
+        self.registry.pop(move, None)
+
+    def detect(self, vectorize=None):
+        """
+        当たった (攻撃判定, 食らい判定) の組を HitEvent のリストで返す。
+        並びは攻撃判定の追加順 → 食らい判定の追加順で、呼び出し方によらず同じになる。
+        vectorize: None なら判定数に応じて自動で選ぶ
+        """
+        if not self.hitboxes or not self.hurtboxes:
+            return []
+        if vectorize is None:
+            vectorize = np is not None and len(self.hitboxes) * len(self.hurtboxes) >= VECTORIZE_MIN
+        pairs = self._pairs_numpy() if vectorize else self._pairs_python()
+
+        events = []
+        for hi, ui in pairs:
+            _, _, _, _, _, move, attacker = self.hitboxes[hi]
+            target = self.hurtboxes[ui][5]
+            done = self.registry.setdefault(move, set())
+            if target in done:
+                continue
+            done.add(target)
+            events.append(HitEvent(attacker, target, move, hi, ui))
+        return events
+
+    def _pairs_python(self):
+        pairs = []
+        for hi, (hx0, hy0, hx1, hy1, hteam, _, _) in enumerate(self.hitboxes):
+            for ui, (ux0, uy0, ux1, uy1, uteam, _) in enumerate(self.hurtboxes):
+                if hteam != uteam and hx0 < ux1 and hx1 > ux0 and hy0 < uy1 and hy1 > uy0:
+                    pairs.append((hi, ui))
+        return pairs
+
+    def _pairs_numpy(self):
+        hit = np.array([b[:5] for b in self.hitboxes], np.int64)
+        hurt = np.array([b[:5] for b in self.hurtboxes], np.int64)
+        hx0, hy0, hx1, hy1, hteam = hit.T
+        ux0, uy0, ux1, uy1, uteam = hurt.T
+
+        # 広域判定: 食らい判定を左端でソートし、各攻撃判定と x 方向に重なりうる範囲を二分探索
+        order = np.argsort(ux0, kind="stable")
+        sx0 = ux0[order]
+        wmax = int((ux1 - ux0).max())
+        lo = np.searchsorted(sx0, hx0 - wmax, side="right")
+        hi = np.searchsorted(sx0, hx1, side="left")
+        counts = np.maximum(hi - lo, 0)
+        total = int(counts.sum())
+        if total == 0:
+            return []
+
+        # 候補の組を展開
+        hit_idx = np.repeat(np.arange(len(hit)), counts)
+        starts = np.repeat(lo, counts)
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        hurt_idx = order[starts + offsets]
+
+        # 詳細判定: 矩形の重なりとチーム
+        ok = ((hx0[hit_idx] < ux1[hurt_idx]) & (hx1[hit_idx] > ux0[hurt_idx])
+              & (hy0[hit_idx] < uy1[hurt_idx]) & (hy1[hit_idx] > uy0[hurt_idx])
+              & (hteam[hit_idx] != uteam[hurt_idx]))
+        hit_idx = hit_idx[ok]
+        hurt_idx = hurt_idx[ok]
+        keys = np.lexsort((hurt_idx, hit_idx))
+        return list(zip(hit_idx[keys].tolist(), hurt_idx[keys].tolist()))
+
+
+# =====================
+# 実行(判定数ごとの速度比較)
+# =====================
+if __name__ == "__main__":
+    import pygame as pg
+
+    # 使い方: python collision.py [繰り返し回数]
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    rng = random.Random(0)
+    print(f"{'boxes':>6} {'python us':>10} {'numpy us':>10} {'auto us':>10} {'hits':>6}")
+    for n in (2, 5, 10, 25, 50, 100, 250, 500):
+        world = CollisionWorld()
+        # 半分を攻撃判定、半分を食らい判定にして画面内に散らばらせる
+        boxes = [(pg.Rect(rng.randrange(0, 1000), rng.randrange(0, 600),
+                          rng.randrange(20, 60), rng.randrange(20, 120)), i % 2)
+                 for i in range(n)]
+        results = {}
+        for label, vec in (("python", False), ("numpy", True), ("auto", None)):
+            if vec and np is None:
+                results[label] = (float("nan"), 0)
+                continue
+            start = time.perf_counter()
+            for _ in range(repeat):
+                world.begin()
+                world.registry.clear()
+                for i, (r, team) in enumerate(boxes):
+                    if i < n // 2:
+                        world.add_hitbox(r, team, i, team)
+                    else:
+                        world.add_hurtbox(r, team, i)
+                events = world.detect(vec)
+            results[label] = ((time.perf_counter() - start) / repeat * 1e6, len(events))
+        print(f"{n:>6} {results['python'][0]:>10.1f} {results['numpy'][0]:>10.1f} "
+              f"{results['auto'][0]:>10.1f} {results['auto'][1]:>6}")
@@ -0,0 +1,417 @@
+import sys
+import threading
+import time
+from array import array
+
+from engine import FLOOR, IN_LEFT, IN_RIGHT, IN_JUMP, IN_ATTACK, random_policy
+
+# 難易度: (読む深さ, 1回の思考の時間予算(秒), 何ティックごとに考え直すか)
+# 深さは1手 PLY_TICKS ティックの行動を何手先まで読むか。予算内に読み切れなければ
+# 読み切れた一番深い結果を使う(予算は下の ROOT_BEAM で絞った探索が深さまで届く長さ)
+CPU_LEVELS = {
+    "easy": (1, 0.003, 15),
+    "normal": (2, 0.004, 8),
+    "hard": (3, 0.016, 6),
+}
+DEFAULT_LEVEL = "normal"
+# 1手の長さ(ティック)。攻撃はその手の最初のティックにだけ押す
+PLY_TICKS = 6
+# 1手で選べる行動
+ACTIONS = (
+    0,
+    IN_ATTACK,
+    IN_LEFT,
+    IN_RIGHT,
+    IN_LEFT | IN_ATTACK,
+    IN_RIGHT | IN_ATTACK,
+    IN_JUMP,
+)
+# 反復深化の深さ 2 以降は、1つ浅い読みで良かった最初の行動をこの数だけ、良い順に読む
+ROOT_BEAM = 3
+# 思考スレッドはこの局面数ごとに GIL を手放す(メインスレッドを切り替え間隔の 5ms まで待たせないように)
+YIELD_NODES = 4
+# 1回の思考にかかった時間を何件分残すか
+CPU_SAMPLES = 600
+
+# 簡易シミュレーションでのファイターの大きさ(engine.Fighter の rect と同じ)
+FIGHTER_W, FIGHTER_H = 60, 120
+
+
+def fighter_profile(character):
+    """
+    簡易シミュレーションに使う能力値と攻撃ボタンの技(発生・硬直・ダメージ・飛び道具・攻撃判定)。
+    """
+    m = character.attack
+    if 1 in m.spawn:
+        startup = m.spawn.index(1)
+    else:
+        startup = next(i for i, box in enumerate(m.hitbox) if box is not None)
+    return (character.move_speed, character.jump_speed, character.gravity,
+            m.frames, startup, m.lock[startup], m.damage, m.projectile, m.hitbox[startup])
+
+
+def snapshot(match, me, enemy):
+    """
+    思考用に試合状態をタプルに写す(メインスレッドで呼ぶ。以降 match は触らない)。
+    ファイター: [x, y, vy, 地上か, 向き, hp, 技の残りティック, 技の経過ティック]
+    攻撃: (x, y, vx, 寿命, 自分の攻撃か, ダメージ, 幅, 高さ)
+    """
+    fighters = []
+    for f in (me, enemy):
+        move = f.move
+        busy = move.frames - f.move_frame if move is not None else 0
+        fighters.append((f.rect.x, f.rect.y, f.vy, f.on_ground, f.facing, f.hp,
+                         busy, f.move_frame if move is not None else 0))
+    shots = tuple((atk.rect.x, atk.rect.y, atk.vx, atk.life, atk.owner is me,
+                   atk.damage, atk.rect.width, atk.rect.height) for atk in match.attacks)
+    # 相手の入力は分からないので、今の横移動が続くものとして読む
+    enemy_bits = IN_LEFT if enemy.vx < 0 else IN_RIGHT if enemy.vx > 0 else 0
+    return (tuple(fighters), shots, fighter_profile(me.character),
+            fighter_profile(enemy.character), enemy_bits, match.stage_width)
+
+
+# =====================
+# 簡易シミュレーション
+# =====================
+def _overlap(x, y, w, h, f):
+    return x < f[0] + FIGHTER_W and x + w > f[0] and y < f[1] + FIGHTER_H and y + h > f[1]
+
+
+def simulate(a, b, shots, bits_a, bits_b, pa, pb, ticks, width=None):
+    """
+    自分(a)と相手(b)を ticks ティック進める。a, b はリスト(書き換える)、shots は新しいリストを返す。
+    移動・ジャンプ・重力・攻撃の発生と飛び道具の移動・命中・ステージの端(width)だけを
+    engine と同じ数値で真似る(当たり判定の掃引・攻撃の上限・2人の距離の制限は省く)。
+    """
+    for tick in range(ticks):
+        for f, bits, p, enemy, mine in ((a, bits_a, pa, b, True), (b, bits_b, pb, a, False)):
+            if tick:
+                bits &= ~IN_ATTACK
+            if bits & IN_ATTACK and not f[6]:
+                f[6] = p[3]
+                f[7] = 0
+            if f[6]:
+                if f[7] == p[4]:
+                    projectile = p[7]
+                    if projectile is not None:
+                        speed, life, w, h = projectile
+                        x = f[0] + FIGHTER_W if f[4] == 1 else f[0] - w
+                        shots.append((x, f[1] + (FIGHTER_H - h) // 2, speed * f[4], life,
+                                      mine, p[6], w, h))
+                    elif p[8] is not None:
+                        dx, dy, w, h = p[8]
+                        x = f[0] + FIGHTER_W + dx if f[4] == 1 else f[0] - dx - w
+                        if _overlap(x, f[1] + dy, w, h, enemy):
+                            enemy[5] -= p[6]
+                if p[5]:
+                    bits = 0
+                f[6] -= 1
+                f[7] += 1
+
+            vx = 0
+            if bits & IN_LEFT:
+                vx = -p[0]
+                f[4] = -1
+            if bits & IN_RIGHT:
+                vx = p[0]
+                f[4] = 1
+            if bits & IN_JUMP and f[3]:
+                f[2] = -p[1]
+                f[3] = False
+            f[2] += p[2]
+            f[0] += vx
+            f[1] += f[2]
+            if width is not None:
+                f[0] = min(max(f[0], 0), width - FIGHTER_W)
+            if f[1] + FIGHTER_H >= FLOOR:
+                f[1] = FLOOR - FIGHTER_H
+                f[2] = 0
+                f[3] = True
+
+        moved = []
+        for x, y, vx, life, mine, damage, w, h in shots:
+            x += vx
+            life -= 1
+            if life <= 0:
+                continue
+            target = b if mine else a
+            if _overlap(x, y, w, h, target):
+                target[5] -= damage
+                continue
+            moved.append((x, y, vx, life, mine, damage, w, h))
+        shots = moved
+    return shots
+
+
+def evaluate(a, b, shots, pa):
+    """
+    自分から見た局面の良さ。HP 差を最優先に、攻撃が届く距離で相手を向いているほど高くする。
+    """
+    score = (a[5] - b[5]) * 10.0
+    dx = b[0] - a[0]
+    projectile = pa[7]
+    if projectile is not None:
+        reach = projectile[0] * projectile[1] * 0.6
+    else:
+        reach = FIGHTER_W + pa[8][0] + pa[8][2] * 0.5
+    score -= abs(abs(dx) - reach) * 0.02
+    if (dx > 0) == (a[4] > 0):
+        score += 1.0
+    # 向かってくる相手の攻撃(近いほど危ない)
+    for x, y, vx, life, mine, damage, w, h in shots:
+        if not mine and (a[0] - x) * vx > 0 and y < a[1] + FIGHTER_H and y + h > a[1]:
+            score -= damage * max(0.0, 1.0 - abs(a[0] - x) / 400)
+    return score
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+def search(state, depth, deadline=None, ply=PLY_TICKS, roots=ACTIONS):
+    """
+    深さ depth まで行動の組み合わせを読み、(一番良い最初の行動, 読んだ局面数, 最初の行動ごとの評価) を返す。
+    最初の行動は roots だけを読む(評価は roots と同じ順)。2手目からは全部の行動を読む。
+    deadline(time.perf_counter() の値)を過ぎたら SearchTimeout を投げる。
+    """
+    fighters, shots, pa, pb, enemy_bits, width = state
+    nodes = 0
+
+    def value(a, b, shots, d):
+        nonlocal nodes
+        nodes += 1
+        if deadline is not None:
+            if time.perf_counter() > deadline:
+                raise SearchTimeout
+            if not nodes % YIELD_NODES:
+                time.sleep(0)
+        if d == 0 or a[5] <= 0 or b[5] <= 0:
+            return evaluate(a, b, shots, pa)
+        best = None
+        for action in ACTIONS:
+            na, nb = a[:], b[:]
+            ns = simulate(na, nb, list(shots), action, enemy_bits, pa, pb, ply, width)
+            v = value(na, nb, ns, d - 1)
+            if best is None or v > best:
+                best = v
+        return best
+
+    root_a, root_b = list(fighters[0]), list(fighters[1])
+    best_action, best = 0, None
+    scores = []
+    for action in roots:
+        na, nb = root_a[:], root_b[:]
+        ns = simulate(na, nb, list(shots), action, enemy_bits, pa, pb, ply, width)
+        v = value(na, nb, ns, depth - 1)
+        scores.append(v)
+        if best is None or v > best:
+            best_action, best = action, v
+    return best_action, nodes, scores
+
+
+def decide(state, depth, deadline=None):
+    """
+    反復深化: 深さ 1 から順に読み、時間切れになったら読み切れた一番深い結果を返す。
+    深さ 1 は全部の最初の行動を読み、以降は1つ浅い読みで評価の高かった ROOT_BEAM 個だけを
+    良い順に読む(前の読みの最善手を先に読むので、深い読みの途中で切れても損が少ない)。
+    (行動, 読み切れた深さ, 局面数, 時間切れになったか)。深さ 1 も読めなければ行動は None。
+    """
+    action = None
+    done = 0
+    nodes = 0
+    roots = ACTIONS
+    for d in range(1, depth + 1):
+        try:
+            a, n, scores = search(state, d, deadline, roots=roots)
+        except SearchTimeout:
+            return action, done, nodes, True
+        action, done = a, d
+        nodes += n
+        # 評価の高い順(同点なら元の順)に並べ直して次の深さで読む分を絞る
+        order = sorted(range(len(roots)), key=lambda i: -scores[i])
+        roots = tuple(roots[i] for i in order[:ROOT_BEAM])
+    return action, done, nodes, False
+
+
+# =====================
+# CPU プレイヤー
+# =====================
+class CPUPlayer:
+    """
+    試合の状態から入力ビットを決める CPU。policy(match, me, enemy) と同じ形で呼べる。
+    threaded=True なら思考は別スレッドで行い、呼び出しは直前に決まった入力を返すだけなので
+    メインループを待たせない。思考には依頼した時刻から budget 秒の期限があり、間に合わなければ
+    読み切れた深さの結果、それも無ければ前回の入力をそのまま使う。
+    threaded=False は期限なしでその場で考える(表示なしの試合・動作確認用。結果は毎回同じ)。
+    """
+    def __init__(self, level=DEFAULT_LEVEL, threaded=True, size=CPU_SAMPLES):
+        self.set_level(level)
+        self.threaded = threaded
+        self.cond = threading.Condition()
+        self.request = None
+        self.decision = 0
+        self.last_think = None
+        self.closed = False
+        self.thread = None
+
+        # 思考ごとの時間と読み切れた深さ
+        self.size = size
+        self.times = array("d", bytes(8 * size))
+        self.depths = array("B", bytes(size))
+        self.count = 0
+        self.timeouts = 0     # 期限までに最深まで読めなかった
+        self.fallbacks = 0    # 深さ 1 も読めず、前回の入力を使った
+        self.dropped = 0      # 前の依頼を考え始める前に次の依頼が来た
+        self.nodes = 0
+
+    def set_level(self, level):
+        self.level = level
+        self.depth, self.budget, self.every = CPU_LEVELS[level]
+
+    def start(self):
+        if self.threaded and self.thread is None:
+            self.closed = False
+            self.thread = threading.Thread(target=self._worker, daemon=True)
+            self.thread.start()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def think(self, match, me, enemy):
+        """
+        今の試合状態で次の入力を考えるよう依頼する(threaded なら結果を待たずに戻る)。
+        """
+        state = snapshot(match, me, enemy)
+        if not self.threaded:
+            self._decide(state, None, time.perf_counter())
+            return
+        if self.thread is None:
+            self.start()
+        with self.cond:
+            if self.request is not None:
+                self.dropped += 1
+            self.request = (state, time.perf_counter())
+            self.cond.notify()
+
+    def input(self):
+        """
+        今のティックの入力ビット。攻撃は新しく決まった入力で1回だけ押す。
+        """
+        with self.cond:
+            bits = self.decision
+            self.decision = bits & ~IN_ATTACK
+        return bits
+
+    def __call__(self, match, me, enemy):
+        if self.last_think is None or not 0 <= match.tick - self.last_think < self.every:
+            self.last_think = match.tick
+            self.think(match, me, enemy)
+        return self.input()
+
+    def reset(self):
+        """
+        試合の開始時・ポーズ時に呼ぶ(古い状態での思考結果を使わない)。
+        """
+        with self.cond:
+            self.request = None
+            self.decision = 0
+        self.last_think = None
+
+    def _worker(self):
+        while True:
+            with self.cond:
+                while self.request is None and not self.closed:
+                    self.cond.wait()
+                if self.closed:
+                    return
+                state, posted = self.request
+                self.request = None
+            self._decide(state, posted + self.budget, posted)
+
+    def _decide(self, state, deadline, posted):
+        action, depth, nodes, timeout = decide(state, self.depth, deadline)
+        elapsed = time.perf_counter() - posted
+        with self.cond:
+            if action is not None:
+                self.decision = action
+            else:
+                self.fallbacks += 1
+            slot = self.count % self.size
+            self.times[slot] = elapsed
+            self.depths[slot] = depth
+            self.count += 1
+            self.timeouts += timeout
+            self.nodes += nodes
+
+    def percentiles(self, qs=(50, 95, 99)):
+        """
+        思考を依頼してから入力が決まるまでの時間のパーセンタイル(秒)。
+        """
+        values = sorted(self.times[:min(self.count, self.size)])
+        if not values:
+            return [0.0 for _ in qs]
+        return [values[min(len(values) - 1, int(len(values) * q / 100))] for q in qs]
+
+    def mean_depth(self):
+        n = min(self.count, self.size)
+        return sum(self.depths[:n]) / n if n else 0.0
+
+    def stats(self):
+        p50, p95, p99 = self.percentiles()
+        return {"level": self.level, "decisions": self.count, "p50_ms": p50 * 1e3,
+                "p95_ms": p95 * 1e3, "p99_ms": p99 * 1e3, "mean_depth": self.mean_depth(),
+                "timeouts": self.timeouts, "fallbacks": self.fallbacks,
+                "dropped": self.dropped, "nodes": self.nodes}
+
+    def summary(self):
+        if not self.count:
+            return f"cpu ({self.level}): no decisions"
+        s = self.stats()
+        return (f"cpu ({self.level}, {s['decisions']} decisions): p50 {s['p50_ms']:.2f} ms  "
+                f"p95 {s['p95_ms']:.2f} ms  p99 {s['p99_ms']:.2f} ms  depth {s['mean_depth']:.2f}  "
+                f"timeouts {s['timeouts']}  fallbacks {s['fallbacks']}  dropped {s['dropped']}")
+
+
+# =====================
+# 実行(難易度ごとの強さと思考時間)
+# =====================
+if __name__ == "__main__":
+    from engine import new_match
+
+    # 使い方: python cpu.py [試合数]
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    depths = {}
+    for level in CPU_LEVELS:
+        wins = 0
+        worst = 0.0
+        cpu = CPUPlayer(level)
+        for i in range(n):
+            match = new_match()
+            cpu.reset()
+            policy = random_policy(i)
+            while True:
+                # メインループ側の呼び出しにかかる時間(思考を待たないので数 us のはず)
+                start = time.perf_counter()
+                in1 = cpu(match, match.p1, match.p2)
+                worst = max(worst, time.perf_counter() - start)
+                in2 = policy(match, match.p2, match.p1)
+                if match.step(in1, in2):
+                    break
+                # 考え直すティックの後だけ1フレーム分待つ(その間に思考スレッドが動く。
+                # 毎ティック待つと1試合に実時間で90秒かかる)
+                if match.tick % cpu.every == 1:
+                    time.sleep(1 / 60)
+            wins += match.winner() == "P1"
+        cpu.close()
+        print(f"{level:>6}: {wins}/{n} wins vs random, worst call {worst * 1e6:.0f} us")
+        print(f"        {cpu.summary()}")
+        depths[level] = cpu.mean_depth()
+    # 難易度が上がるほど実際に深く読めていること(予算が足りないと名目の深さまで届かない)
+    levels = list(CPU_LEVELS)
+    for easier, harder in zip(levels, levels[1:]):
+        assert depths[harder] > depths[easier], f"{harder} does not search deeper than {easier}"
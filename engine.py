@@ -0,0 +1,775 @@
+import pygame as pg
+import hashlib
+import random
+import struct
+import sys
+import time
+
+from collision import CollisionWorld
+from moves import character_from_rules
+
+# =====================
+# 定数(表示なしでも使うゲームルール)
+# =====================
+WIDTH, HEIGHT = 1000, 600
+FLOOR = HEIGHT - 50
+
+# マッチ時間(秒) -- 90秒
+MATCH_TIME = 90
+
+# 固定タイムステップ(シミュレーションは描画速度に関係なく SIM_HZ で進む)
+SIM_HZ = 60
+SIM_DT = 1.0 / SIM_HZ
+
+# 1ティック分の入力(ビットフラグ)。IN_ATTACK はそのティックに押された瞬間のみ立てる
+IN_LEFT = 1
+IN_RIGHT = 2
+IN_JUMP = 4
+IN_ATTACK = 8
+# IN_ATTACK と一緒に立てるコマンド技の番号(0 は攻撃ボタンの技、n は COMMAND_MOVES[n - 1])。
+# キャラクターにその名前の技が無ければ攻撃ボタンの技になる
+IN_COMMAND_SHIFT = 4
+IN_COMMAND_MASK = 3 << IN_COMMAND_SHIFT
+COMMAND_MOVES = ("uppercut", "fireball", "hurricane")
+# 1ティックの入力が使うビット数(リプレイ・ロールバックの入力の幅)
+INPUT_BITS = 6
+
+# ステージの横幅を決めた試合(Match.set_stage)での開始位置(ステージ中央からのずれ)と、
+# 2人が同時に画面に入るように保つ左端から右端までの最大の幅
+START_OFFSETS = (-300, 200)
+MAX_SEPARATION = WIDTH
+
+# 攻撃(飛び道具)の色
+ATTACK_COLOR = (255, 0, 0)
+
+# 試合状態のスナップショット形式(Match.save_state / load_state)
+# ヘッダ: tick, 攻撃の数 /
+# ファイター: x, y, vx, vy, hp, facing, on_ground, 技の番号(-1 は技なし), 技の経過ティック, 技がもう当たったか /
+# 攻撃: x, y, vx, life, P1 の攻撃か, 技の番号
+SNAP_HEADER = struct.Struct("<ii")
+SNAP_FIGHTER = struct.Struct("<6ibbhb")
+SNAP_ATTACK = struct.Struct("<4ibb")
+
+# デフォルトのキー割り当て
+P1_KEYS = {
+    "left": pg.K_a,
+    "right": pg.K_d,
+    "jump": pg.K_w,
+    "down": pg.K_s,
+    "attack": pg.K_f
+}
+P2_KEYS = {
+    "left": pg.K_LEFT,
+    "right": pg.K_RIGHT,
+    "jump": pg.K_UP,
+    "down": pg.K_DOWN,
+    "attack": pg.K_RCTRL
+}
+
+
+def command_bits(name):
+    """
+    コマンド名(inputs.COMMANDS の名前)を入力ビットにする。技の表に無い名前なら 0。
+    """
+    if name not in COMMAND_MOVES:
+        return 0
+    return (COMMAND_MOVES.index(name) + 1) << IN_COMMAND_SHIFT
+
+
+def command_move(character, bits):
+    """
+    攻撃を押したティックの入力 bits で出す技(コマンドの技が無ければ攻撃ボタンの技)。
+    """
+    code = (bits & IN_COMMAND_MASK) >> IN_COMMAND_SHIFT
+    if not code:
+        return character.attack
+    return character.by_name.get(COMMAND_MOVES[code - 1], character.attack)
+
+
+# =====================
+# ルール定義
+# =====================
+class Rules:
+    """
+    移動速度・ジャンプ・重力・HP・攻撃・マッチ時間などの数値ルール。
+    速度はすべて1ティックあたりのピクセル数。
+    max_attacks: 1人が同時に出しておける攻撃の数(None なら飛び道具の寿命ぶん = 実質無制限)
+    """
+    def __init__(self, move_speed=6, jump_speed=20, gravity=1, max_hp=100,
+                 attack_speed=12, attack_life=30, attack_size=(40, 20),
+                 damage=5, match_time=MATCH_TIME, max_attacks=None):
+        self.move_speed = move_speed
+        self.jump_speed = jump_speed
+        self.gravity = gravity
+        self.max_hp = max_hp
+        self.attack_speed = attack_speed
+        self.attack_life = attack_life
+        self.attack_size = attack_size
+        self.damage = damage
+        self.match_time = match_time
+        self.max_attacks = max_attacks
+
+    @property
+    def match_ticks(self):
+        """
+        マッチの長さ(ティック数)。
+        """
+        return int(round(self.match_time * SIM_HZ))
+
+    @property
+    def attack_cap(self):
+        """
+        rules の数値の攻撃だけを使うときの1人あたりの同時攻撃数の上限。
+        """
+        return self.attack_limit(self.attack_life)
+
+    def attack_limit(self, life):
+        """
+        寿命 life ティックの飛び道具を撃つときの1人あたりの同時攻撃数の上限。
+        攻撃は1ティックに1発までなので寿命ぶんを超えることはない。
+        """
+        limit = max(1, life)
+        if self.max_attacks is None:
+            return limit
+        return max(0, min(self.max_attacks, limit))
+
+
+DEFAULT_RULES = Rules()
+
+
+# =====================
+# ファイタークラス
+# =====================
+class Fighter(pg.sprite.Sprite):
+    """
+    プレイヤー用ファイター。移動、ジャンプ、HP、出している技を管理する。
+    keys: dict で "left","right","jump","down","attack" のキーコードを渡す
+    ("down" はコマンド入力の認識にだけ使う)
+    character: moves.Character(能力値と技の表)。None なら rules の数値から作る
+    """
+    def __init__(self, x, color, keys, name="Fighter", rules=DEFAULT_RULES, character=None):
+        super().__init__()
+        self.image = pg.Surface((60, 120))
+        self.image.fill(color)
+        self.rect = self.image.get_rect()
+        self.rect.bottomleft = (x, FLOOR)
+        # 描画補間用の前ティック位置
+        self.prev_pos = self.rect.topleft
+
+        self.vx = 0
+        self.vy = 0
+        self.on_ground = True
+        # 直前のティックで着地したか(砂ぼこりなどの演出用)
+        self.landed = False
+
+        self.rules = rules
+        self.character = character if character is not None else character_from_rules(rules)
+        self.hp = self.character.max_hp
+        self.keys = keys
+        # ステージの横幅(端から出られない)。None なら壁なし
+        self.stage_width = None
+        self.facing = 1  # 1 = 右向き, -1 = 左向き
+        self.name = name
+        # 表示用のアニメーション(animation.Animator)。None なら単色の四角のまま
+        self.animator = None
+
+        # 出している技(moves.MoveTable)と、技を出してからのティック数
+        self.move = None
+        self.move_frame = 0
+        self.strike = Strike(self)
+
+    def start_move(self, move):
+        """
+        技を最初のティックから始める。
+        """
+        self.move = move
+        self.move_frame = 0
+        self.play("attack")
+
+    def hurtboxes(self):
+        """
+        食らい判定の矩形。
+        """
+        return (self.rect,)
+
+    def play(self, state):
+        """
+        攻撃・被弾など一度きりのアニメーションを始める(アニメーションが無ければ何もしない)。
+        """
+        if self.animator is not None:
+            self.animator.play(state)
+
+    def read_input(self, key_lst):
+        """
+        押されているキー(pg.key.get_pressed() 等)を入力ビットに変換する。
+        攻撃は押した瞬間の判定なので含めない。
+        """
+        bits = 0
+        if key_lst[self.keys["left"]]:
+            bits |= IN_LEFT
+        if key_lst[self.keys["right"]]:
+            bits |= IN_RIGHT
+        if key_lst[self.keys["jump"]]:
+            bits |= IN_JUMP
+        return bits
+
+    def update(self, key_lst):
+        """
+        キー状態から1ティック分の移動を行う。
+        """
+        self.step(self.read_input(key_lst))
+
+    def step(self, bits):
+        """
+        入力ビットに応じて移動・ジャンプ処理を行い、重力と地面判定を適用する。
+        1回の呼び出しが1シミュレーションティック(SIM_DT 秒)に相当する。
+        """
+        c = self.character
+        self.prev_pos = self.rect.topleft
+        self.vx = 0
+
+        # 動けない技の途中は移動・ジャンプの入力を無視する
+        move = self.move
+        if move is not None and move.lock[self.move_frame]:
+            bits = 0
+
+        if bits & IN_LEFT:
+            self.vx = -c.move_speed
+            self.facing = -1
+        if bits & IN_RIGHT:
+            self.vx = c.move_speed
+            self.facing = 1
+
+        if bits & IN_JUMP and self.on_ground:
+            self.vy = -c.jump_speed
+            self.on_ground = False
+
+        # 簡易重力
+        self.vy += c.gravity
+
+        # 位置更新
+        self.rect.x += self.vx
+        self.rect.y += self.vy
+
+        # ステージの端
+        if self.stage_width is not None:
+            if self.rect.left < 0:
+                self.rect.left = 0
+            elif self.rect.right > self.stage_width:
+                self.rect.right = self.stage_width
+
+        # 地面判定
+        self.landed = False
+        if self.rect.bottom >= FLOOR:
+            self.rect.bottom = FLOOR
+            self.vy = 0
+            self.landed = not self.on_ground
+            self.on_ground = True
+
+        # 見た目だけなので試合の結果には影響しない
+        if self.animator is not None:
+            self.image = self.animator.update(self)
+
+
+# =====================
+# 近接技の攻撃判定
+# =====================
+class Strike:
+    """
+    近接技の攻撃判定。ファイターごとに1つを使い回し、技の表の hitbox の位置に置く。
+    当たり判定では技1回分の単位(同じ相手に1回しか当たらない)として使う。
+    """
+    __slots__ = ("owner", "rect")
+
+    def __init__(self, owner):
+        self.owner = owner
+        self.rect = pg.Rect(0, 0, 0, 0)
+
+    @property
+    def damage(self):
+        return self.owner.move.damage
+
+    def place(self, box):
+        """
+        box(前方向のずれ, 上からのずれ, 幅, 高さ)をファイターの向きに合わせて置く。
+        """
+        dx, dy, w, h = box
+        f = self.owner.rect
+        r = self.rect
+        r.size = (w, h)
+        r.top = f.top + dy
+        if self.owner.facing == 1:
+            r.left = f.right + dx
+        else:
+            r.right = f.left - dx
+        return r
+
+
+# =====================
+# 攻撃クラス
+# =====================
+_attack_images = {}
+
+
+def attack_image(size, color=ATTACK_COLOR):
+    """
+    攻撃の種類(大きさ・色)ごとに1枚だけ作って共有する画像。書き換えないこと。
+    """
+    key = (tuple(size), tuple(color))
+    image = _attack_images.get(key)
+    if image is None:
+        image = pg.Surface(key[0])
+        image.fill(color)
+        _attack_images[key] = image
+    return image
+
+
+class Attack(pg.sprite.Sprite):
+    """
+    簡易な飛び道具/パンチ用スプライト。
+    owner: 発射元の Fighter オブジェクト(味方判定に使用)
+    life: 生存フレーム(寿命)
+    vx: 横速度
+    move: 撃った技(moves.MoveTable。大きさ・速さ・寿命・ダメージは技の表から)
+    AttackPool で使い回すときは launch() で撃ち直す。
+    """
+    def __init__(self, fighter, move=None):
+        super().__init__()
+        self.rect = pg.Rect(0, 0, 0, 0)
+        self.launch(fighter, move)
+
+    def launch(self, fighter, move=None):
+        """
+        fighter の前方から撃ち出した状態にする(move を省略すると攻撃ボタンの技)。
+        """
+        if move is None:
+            move = fighter.character.attack
+        speed, life, w, h = move.projectile
+        self.image = attack_image((w, h))
+        self.rect.size = (w, h)
+
+        # 発射時の位置をファイターの前方に設定
+        if fighter.facing == 1:
+            self.rect.midleft = fighter.rect.midright
+            self.vx = speed
+        else:
+            self.rect.midright = fighter.rect.midleft
+            self.vx = -speed
+
+        self.life = life
+        self.move = move
+        self.damage = move.damage
+        self.owner = fighter
+        self.prev_pos = self.rect.topleft
+
+    def hitboxes(self):
+        """
+        攻撃判定の矩形。
+        """
+        return (self.rect,)
+
+    def update(self):
+        """
+        横移動し、寿命が尽きたら削除する(1ティック分)。
+        """
+        self.prev_pos = self.rect.topleft
+        self.rect.x += self.vx
+        self.life -= 1
+        if self.life <= 0:
+            self.kill()
+
+
+# =====================
+# 攻撃のプール
+# =====================
+class AttackPool:
+    """
+    消えた Attack を捨てずに取っておき、次の発射で使い回す。
+    capacity: 同時に生きていられる攻撃の総数 / per_fighter: 1人あたりの上限
+    上限を超える発射は acquire() が None を返して無視される。
+    """
+    def __init__(self, capacity, per_fighter):
+        self.capacity = capacity
+        self.per_fighter = per_fighter
+        self.free = []
+        self.owners = {}     # Fighter -> 生きている攻撃の数
+        self.live = 0
+        self.peak = 0
+        self.created = 0
+        self.refused = 0
+
+    def acquire(self, fighter, move=None):
+        """
+        fighter の攻撃(技 move の飛び道具)を1つ撃ち出して返す。上限に達していれば None。
+        """
+        count = self.owners.get(fighter, 0)
+        if count >= self.per_fighter or self.live >= self.capacity:
+            self.refused += 1
+            return None
+        if self.free:
+            atk = self.free.pop()
+            atk.launch(fighter, move)
+        else:
+            atk = Attack(fighter, move)
+            self.created += 1
+        self.owners[fighter] = count + 1
+        self.live += 1
+        if self.live > self.peak:
+            self.peak = self.live
+        return atk
+
+    def available(self, fighter):
+        """
+        fighter が今攻撃を撃てるか(acquire() が None を返さないか)。
+        """
+        return self.owners.get(fighter, 0) < self.per_fighter and self.live < self.capacity
+
+    def release(self, atk):
+        """
+        消えた攻撃を返却する(グループからの削除は呼び出し側で行う)。
+        """
+        self.owners[atk.owner] -= 1
+        self.live -= 1
+        self.free.append(atk)
+
+    def stats(self):
+        """
+        プールの使用状況(上限の見積もり用)。
+        """
+        return {"live": self.live, "free": len(self.free), "peak": self.peak,
+                "created": self.created, "refused": self.refused,
+                "capacity": self.capacity, "per_fighter": self.per_fighter}
+
+
+# =====================
+# マッチ(表示なしで進められる試合状態)
+# =====================
+class Match:
+    """
+    2人のファイター・攻撃・残りティック数をまとめた試合状態。
+    step() に各プレイヤーの入力ビットを渡すと1ティック進む。
+    表示・画像・時計に依存しないので、同じ入力列からは常に同じ結果になる。
+    """
+    def __init__(self, p1, p2, rules=DEFAULT_RULES):
+        self.p1 = p1
+        self.p2 = p2
+        self.rules = rules
+        self.fighters = pg.sprite.Group(p1, p2)
+        self.attacks = pg.sprite.Group()
+        # 上限はキャラクターの技の表の飛び道具の寿命から決める(rules.attack_life で切り詰めない)
+        cap = max(rules.attack_limit(f.character.projectile_life) for f in (p1, p2))
+        self.pool = AttackPool(2 * cap, cap)
+        self.world = CollisionWorld()
+        self.tick = 0
+        # ステージの横幅(set_stage)。None なら壁も距離の制限もない
+        self.stage_width = None
+        # 直前のティックで攻撃が当たったファイター(効果音・エフェクト用)
+        self.hits = []
+        # 区間ごとの時間計測(profiler.FrameProfiler。None なら測らない)
+        self.profiler = None
+
+    def reset(self):
+        """
+        次の試合に向けて HP・攻撃・時間を戻す(位置はそのまま)。
+        """
+        for f in (self.p1, self.p2):
+            f.hp = f.character.max_hp
+            f.move = None
+        for atk in self.attacks:
+            self.pool.release(atk)
+        self.attacks.empty()
+        self.world.registry.clear()
+        self.reset_timer()
+
+    def reset_timer(self):
+        self.tick = 0
+
+    def set_stage(self, width):
+        """
+        横幅 width のステージで試合を始める。ファイターを中央寄りの開始位置に置き、以降は
+        ステージの端と2人の距離(MAX_SEPARATION)で画面の外に出られないようにする。
+        None なら壁なしに戻す(位置は変えない)。
+        """
+        self.stage_width = width
+        for f in (self.p1, self.p2):
+            f.stage_width = width
+        if width is None:
+            return
+        for f, offset in zip((self.p1, self.p2), START_OFFSETS):
+            f.rect.bottomleft = (width // 2 + offset, FLOOR)
+            f.prev_pos = f.rect.topleft
+            f.vx = f.vy = 0
+            f.on_ground = True
+
+    def limit_separation(self):
+        """
+        2人の左端から右端までが MAX_SEPARATION を超えたら、離れる向きに動いた方を押し戻す
+        (両方なら半分ずつ)。カメラが2人を同時に映せるようにするため。
+        """
+        p1, p2 = self.p1, self.p2
+        left, right = (p1, p2) if p1.rect.x <= p2.rect.x else (p2, p1)
+        over = right.rect.right - left.rect.left - MAX_SEPARATION
+        if over <= 0:
+            return
+        if left.vx < 0 and right.vx > 0:
+            left.rect.x += over // 2
+            right.rect.x -= over - over // 2
+        elif left.vx < 0:
+            left.rect.x += over
+        else:
+            right.rect.x -= over
+
+    def can_attack(self, fighter):
+        """
+        次のティックで攻撃ボタンの技を出せるか(技の途中でなく、飛び道具なら上限に達していない)。
+        """
+        if fighter.move is not None:
+            return False
+        return fighter.character.attack.projectile is None or self.pool.available(fighter)
+
+    @property
+    def match_time(self):
+        """
+        残り時間(秒)。
+        """
+        return max(0, self.rules.match_ticks - self.tick) / SIM_HZ
+
+    def step(self, in1, in2):
+        """
+        1ティック進める。試合が終わったら True を返す。
+        """
+        p1, p2 = self.p1, self.p2
+        self.hits = []
+
+        # 技の開始と飛び道具の発射(技の途中で攻撃を押しても次の技は出ない)
+        pool = self.pool
+        for f, bits in ((p1, in1), (p2, in2)):
+            if bits & IN_ATTACK and f.move is None:
+                f.start_move(command_move(f.character, bits))
+            move = f.move
+            if move is not None and move.spawn[f.move_frame]:
+                atk = pool.acquire(f, move)
+                if atk is not None:
+                    self.attacks.add(atk)
+
+        self.tick += 1
+
+        p1.step(in1)
+        p2.step(in2)
+        if self.stage_width is not None:
+            self.limit_separation()
+        world = self.world
+        for atk in self.attacks.sprites():
+            atk.update()
+            if not atk.alive():
+                world.end_move(atk)
+                pool.release(atk)
+        prof = self.profiler
+        if prof:
+            prof.mark("sim")
+
+        # 攻撃判定(チームで味方の攻撃を除外し、当たった攻撃は消す)
+        world.begin()
+        for team, f in enumerate((p1, p2)):
+            for r in f.hurtboxes():
+                world.add_hurtbox(r, team, f)
+        for atk in self.attacks:
+            team = 0 if atk.owner is p1 else 1
+            for r in atk.hitboxes():
+                world.add_hitbox(r, team, atk, atk.owner)
+        for team, f in enumerate((p1, p2)):
+            move = f.move
+            if move is not None:
+                box = move.hitbox[f.move_frame]
+                if box is not None:
+                    world.add_hitbox(f.strike.place(box), team, f.strike, f)
+
+        for ev in world.detect():
+            ev.target.hp -= ev.move.damage
+            if isinstance(ev.move, Attack):
+                # 飛び道具は当たったら消える(近接技は技が終わるまで判定が残る)
+                ev.move.kill()
+                world.end_move(ev.move)
+                pool.release(ev.move)
+            ev.target.play("hit")
+            self.hits.append(ev.target)
+
+        # 技を1ティック進め、終わったら次の技を出せるようにする
+        for f in (p1, p2):
+            if f.move is not None:
+                f.move_frame += 1
+                if f.move_frame >= f.move.frames:
+                    f.move = None
+                    world.end_move(f.strike)
+        if prof:
+            prof.mark("collision")
+
+        return self.is_over()
+
+    def is_ko(self):
+        return self.p1.hp <= 0 or self.p2.hp <= 0
+
+    def is_over(self):
+        """
+        終了条件: HPが0か時間切れ
+        """
+        return self.is_ko() or self.tick >= self.rules.match_ticks
+
+    def winner(self):
+        """
+        勝者判定("P1" / "P2" / "Draw")。
+        """
+        if self.p1.hp > self.p2.hp:
+            return "P1"
+        elif self.p2.hp > self.p1.hp:
+            return "P2"
+        return "Draw"
+
+    def state_size(self):
+        """
+        save_state() に必要なバッファの大きさ(攻撃が上限まで出ている場合)。
+        """
+        return SNAP_HEADER.size + 2 * SNAP_FIGHTER.size + self.pool.capacity * SNAP_ATTACK.size
+
+    def save_state(self, buf):
+        """
+        試合状態を buf(state_size() 以上の bytearray)に書き込む。新しいオブジェクトは作らない。
+        残り時間は tick から決まるので tick だけ保存する。
+        """
+        p1 = self.p1
+        registry = self.world.registry
+        SNAP_HEADER.pack_into(buf, 0, self.tick, len(self.attacks))
+        pos = SNAP_HEADER.size
+        for f in (p1, self.p2):
+            r = f.rect
+            move = f.move
+            SNAP_FIGHTER.pack_into(buf, pos, r.x, r.y, f.vx, f.vy, f.hp, f.facing, f.on_ground,
+                                   -1 if move is None else move.index, f.move_frame,
+                                   bool(registry.get(f.strike)))
+            pos += SNAP_FIGHTER.size
+        for atk in self.attacks:
+            r = atk.rect
+            SNAP_ATTACK.pack_into(buf, pos, r.x, r.y, atk.vx, atk.life, atk.owner is p1,
+                                  atk.move.index)
+            pos += SNAP_ATTACK.size
+
+    def load_state(self, buf):
+        """
+        save_state() で保存した状態に戻す。攻撃はプールから取り直して同じ順に並べる。
+        """
+        p1, p2 = self.p1, self.p2
+        tick, count = SNAP_HEADER.unpack_from(buf, 0)
+        self.tick = tick
+        self.hits = []
+        pos = SNAP_HEADER.size
+        registry = self.world.registry
+        for f, enemy in ((p1, p2), (p2, p1)):
+            (f.rect.x, f.rect.y, f.vx, f.vy, f.hp, f.facing,
+             on_ground, move, f.move_frame, hit) = SNAP_FIGHTER.unpack_from(buf, pos)
+            f.on_ground = bool(on_ground)
+            f.prev_pos = f.rect.topleft
+            f.move = None if move < 0 else f.character.moves[move]
+            registry.pop(f.strike, None)
+            if hit:
+                registry[f.strike] = {enemy}
+            pos += SNAP_FIGHTER.size
+
+        pool = self.pool
+        for atk in self.attacks:
+            pool.release(atk)
+        self.attacks.empty()
+        for _ in range(count):
+            x, y, vx, life, mine, move = SNAP_ATTACK.unpack_from(buf, pos)
+            pos += SNAP_ATTACK.size
+            owner = p1 if mine else p2
+            atk = pool.acquire(owner, owner.character.moves[move])
+            atk.rect.x = x
+            atk.rect.y = y
+            atk.vx = vx
+            atk.life = life
+            atk.prev_pos = atk.rect.topleft
+            self.attacks.add(atk)
+
+    def state_hash(self):
+        """
+        試合状態のハッシュ(決定性の確認・リグレッション検出用)。
+        技の途中のファイターと攻撃ボタン以外の技の飛び道具だけ技の状態も含める
+        (技を使う前に記録したリプレイのハッシュと同じ値になるように)。
+        """
+        h = hashlib.sha1()
+        h.update(struct.pack("<i", self.tick))
+        for f in (self.p1, self.p2):
+            h.update(struct.pack("<6ib", f.rect.x, f.rect.y, f.vx, f.vy,
+                                 f.hp, f.facing, f.on_ground))
+            if f.move is not None:
+                h.update(struct.pack("<bh", f.move.index, f.move_frame))
+        for atk in self.attacks:
+            h.update(struct.pack("<4ib", atk.rect.x, atk.rect.y, atk.vx,
+                                 atk.life, atk.owner is self.p1))
+            if atk.move.index:
+                h.update(struct.pack("<b", atk.move.index))
+        return h.hexdigest()
+
+
+def new_match(rules=DEFAULT_RULES, characters=(None, None)):
+    """
+    デフォルト配置の P1/P2 で新しい試合を作る。
+    characters: (P1, P2) の moves.Character。None の方は rules の数値から作る
+    """
+    p1 = Fighter(200, (0, 0, 255), P1_KEYS, name="P1", rules=rules, character=characters[0])
+    p2 = Fighter(700, (255, 0, 0), P2_KEYS, name="P2", rules=rules, character=characters[1])
+    return Match(p1, p2, rules)
+
+
+def random_policy(seed):
+    """
+    乱数で入力を決める簡易ポリシー(seed が同じなら同じ入力列になる)。
+    policy(match, me, enemy) -> 入力ビット
+    """
+    rng = random.Random(seed)
+
+    def policy(match, me, enemy):
+        bits = rng.getrandbits(3)
+        if rng.random() < 0.1:
+            bits |= IN_ATTACK
+        return bits
+    return policy
+
+
+def run_match(policy1, policy2, rules=DEFAULT_RULES):
+    """
+    1試合を最後まで表示なしで進め、終了した Match を返す。
+    """
+    match = new_match(rules)
+    while True:
+        in1 = policy1(match, match.p1, match.p2)
+        in2 = policy2(match, match.p2, match.p1)
+        if match.step(in1, in2):
+            break
+    return match
+
+
+# =====================
+# 実行(表示なしで試合を回す)
+# =====================
+if __name__ == "__main__":
+    # 使い方: python engine.py [試合数] [seed]
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+
+    total = hashlib.sha1()
+    ticks = 0
+    peak = created = 0
+    start = time.perf_counter()
+    for i in range(n):
+        match = run_match(random_policy(seed * 2 * n + 2 * i),
+                          random_policy(seed * 2 * n + 2 * i + 1))
+        total.update(match.state_hash().encode())
+        ticks += match.tick
+        stats = match.pool.stats()
+        peak = max(peak, stats["peak"])
+        created += stats["created"]
+    elapsed = time.perf_counter() - start
+    print(f"{n} matches, {ticks} ticks, {elapsed:.2f}s "
+          f"({ticks / elapsed:.0f} ticks/s)  hash={total.hexdigest()}")
+    print(f"attack pool: peak {peak} live, {created} created")
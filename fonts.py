@@ -0,0 +1,101 @@
+import pygame as pg
+from collections import OrderedDict
+
+# 文字列描画キャッシュの上限(これを超えたら古いものから捨てる)
+TEXT_CACHE_SIZE = 256
+
+
+# =====================
+# フォント登録(同じパス・サイズのフォントは1回だけ読み込む)
+# =====================
+_fonts = {}
+
+
+def get_font(path, size):
+    """
+    (path, size) ごとに1つだけ pg.font.Font を作って使い回す。
+    path が None のときはデフォルトフォント。
+    """
+    key = (path, size)
+    font = _fonts.get(key)
+    if font is None:
+        font = pg.font.Font(path, size)
+        _fonts[key] = font
+    return font
+
+
+# =====================
+# 文字列描画キャッシュ(LRU)
+# =====================
+class TextCache:
+    """
+    (フォント, 文字列, 色, アンチエイリアス) ごとに render() 結果の Surface を保持する。
+    毎フレーム同じ文字列を描く場合は2回目以降 Surface を作らない。
+    """
+    def __init__(self, maxsize=TEXT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, color, antialias=True):
+        key = (font, text, tuple(color), antialias)
+        surf = self.cache.get(key)
+        if surf is not None:
+            self.cache.move_to_end(key)
+            self.hits += 1
+            return surf
+        self.misses += 1
+        surf = font.render(text, antialias, color)
+        self.cache[key] = surf
+        if len(self.cache) > self.maxsize:
+            self.cache.popitem(last=False)
+        return surf
+
+    def clear(self):
+        self.cache.clear()
+
+
+TEXT_CACHE = TextCache()
+
+
+def render_text(font, text, color, antialias=True):
+    """
+    キャッシュ付きの font.render()。
+    返した Surface は共有されるので、書き換えないこと。
+    """
+    return TEXT_CACHE.render(font, text, color, antialias)
+
+
+# =====================
+# 数字グリフの事前描画(タイマー・勝利数用)
+# =====================
+class DigitAtlas:
+    """
+    "0"〜"9" を1回だけ描画しておき、数値は数字ごとの blit だけで描く。
+    prefix を渡すと "Time: " のような固定の前置きも一緒に描く。
+    """
+    def __init__(self, font, color, prefix="", antialias=True):
+        self.glyphs = [font.render(str(d), antialias, color) for d in range(10)]
+        self.prefix = font.render(prefix, antialias, color) if prefix else None
+        self.height = font.get_height()
+
+    def width(self, number):
+        w = self.prefix.get_width() if self.prefix else 0
+        for ch in str(number):
+            w += self.glyphs[int(ch)].get_width()
+        return w
+
+    def draw(self, surface, number, pos):
+        """
+        pos(左上)から数値を描画し、描いた範囲の Rect を返す。number は0以上の整数。
+        """
+        x, y = pos
+        if self.prefix:
+            surface.blit(self.prefix, (x, y))
+            x += self.prefix.get_width()
+        for ch in str(number):
+            glyph = self.glyphs[int(ch)]
+            surface.blit(glyph, (x, y))
+            x += glyph.get_width()
+        return pg.Rect(pos[0], y, x - pos[0], self.height)
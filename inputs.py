@@ -0,0 +1,352 @@
+import pygame as pg
+import sys
+import time
+from array import array
+from collections import deque
+
+# 入力バッファに記録するボタン(ビット)。キー割り当て(engine.P1_KEYS 等)の名前と対応させる
+BTN_LEFT = 1
+BTN_RIGHT = 2
+BTN_UP = 4
+BTN_DOWN = 8
+BTN_ATTACK = 16
+BUTTON_KEYS = {"left": BTN_LEFT, "right": BTN_RIGHT, "jump": BTN_UP,
+               "down": BTN_DOWN, "attack": BTN_ATTACK}
+DIRECTION_MASK = BTN_LEFT | BTN_RIGHT | BTN_UP | BTN_DOWN
+# 記録の中の「押した」印(ボタンのビットと重ならない位置)
+PRESSED = 0x80
+
+# 1人分のリングバッファに残すイベント数(押す・離すで1つずつ)
+INPUT_RING_SIZE = 64
+# 先行入力: 攻撃を押してからこの秒数のうちに撃てるようになれば撃つ
+BUFFER_WINDOW = 0.1
+# コマンド入力: 方向と方向、最後の方向と攻撃の間をこの秒数以内に入れる
+COMMAND_WINDOW = 0.25
+# コマンド: (名前, 方向の並び)。方向はテンキー表記で向いている側が 6
+# (1 2 3 = 下の段、4 5 6 = 中段、7 8 9 = 上の段)。最後に攻撃を押すと成立する
+# 先に並べたものが優先(623 の途中に 23 が含まれるので 623 を先に調べる)
+COMMANDS = (
+    ("uppercut", (6, 2, 3)),
+    ("fireball", (2, 3, 6)),
+    ("hurricane", (2, 1, 4)),
+)
+# 入力から画面に出るまでの時間を何件分残すか
+LATENCY_SAMPLES = 600
+
+
+def direction(held, facing):
+    """
+    押されている方向キーをテンキー表記の方向にする(facing = 1 なら右が前)。
+    左右・上下の同時押しは打ち消し合う。
+    """
+    h = (1 if held & BTN_RIGHT else 0) - (1 if held & BTN_LEFT else 0)
+    v = (1 if held & BTN_UP else 0) - (1 if held & BTN_DOWN else 0)
+    return 5 + h * facing + 3 * v
+
+
+# =====================
+# 入力バッファ
+# =====================
+class InputBuffer:
+    """
+    1人分のキーの押す・離すを、時刻付きで固定長のリングバッファに記録する。
+    handle_event() でイベントを書き込み、drain() でまだ読んでいない分をまとめて取り出す。
+    読まないうちに size 件を超えると古いものから上書きされる(overflow に数える)。
+    時刻は time.perf_counter() の秒(イベントをキューから取り出した時刻)。
+    """
+    def __init__(self, keys, size=INPUT_RING_SIZE):
+        self.size = size
+        self.buttons = {key: BUTTON_KEYS[name] for name, key in keys.items() if name in BUTTON_KEYS}
+        self.times = array("d", bytes(8 * size))
+        self.codes = array("B", bytes(size))
+        self.count = 0       # これまでに書き込んだイベント数
+        self.cursor = 0      # drain() で読んだところ
+        self.held = 0
+        self.overflow = 0
+
+    def push(self, button, pressed, t):
+        slot = self.count % self.size
+        self.times[slot] = t
+        self.codes[slot] = button | (PRESSED if pressed else 0)
+        self.count += 1
+        if pressed:
+            self.held |= button
+        else:
+            self.held &= ~button
+
+    def handle_event(self, event, t=None):
+        """
+        自分のキーの KEYDOWN/KEYUP なら記録して True を返す。
+        """
+        button = self.buttons.get(getattr(event, "key", None))
+        if button is None:
+            return False
+        if event.type not in (pg.KEYDOWN, pg.KEYUP):
+            return False
+        pressed = event.type == pg.KEYDOWN
+        self.push(button, pressed, time.perf_counter() if t is None else t)
+        return True
+
+    def drain(self):
+        """
+        前回から増えたイベントを [(時刻, ボタン, 押したか), ...] で返す(古い順)。
+        """
+        first = self.cursor
+        if self.count - first > self.size:
+            self.overflow += self.count - first - self.size
+            first = self.count - self.size
+        self.cursor = self.count
+        events = []
+        for i in range(first, self.count):
+            slot = i % self.size
+            code = self.codes[slot]
+            events.append((self.times[slot], code & ~PRESSED, bool(code & PRESSED)))
+        return events
+
+    def recent(self, n=None):
+        """
+        残っている直近 n 件(読んだかどうかに関係なく。確認・デバッグ用)。
+        """
+        n = min(self.count, self.size) if n is None else min(n, self.count, self.size)
+        events = []
+        for i in range(self.count - n, self.count):
+            slot = i % self.size
+            code = self.codes[slot]
+            events.append((self.times[slot], code & ~PRESSED, bool(code & PRESSED)))
+        return events
+
+    def clear(self):
+        """
+        読んでいないイベントと押しっぱなしの状態を捨てる(ポーズ・試合終了時)。
+        """
+        self.cursor = self.count
+        self.held = 0
+
+
+# =====================
+# コマンド入力の認識
+# =====================
+class CommandRecognizer:
+    """
+    方向の並び + 攻撃(波動拳の 236+P など)を認識する。
+    コマンドごとに「何番目の方向まで入ったか」と「最後に進んだ時刻」だけを持つ状態機械で、
+    イベント1つにつきコマンド数ぶんの比較しかしない(履歴を見返さないのでフレームあたり一定)。
+    """
+    def __init__(self, commands=COMMANDS, window=COMMAND_WINDOW):
+        self.names = [name for name, _ in commands]
+        self.motions = [motion for _, motion in commands]
+        self.window = window
+        self.progress = [0] * len(commands)
+        self.last = [0.0] * len(commands)
+        self.held = 0
+        self.direction = 5
+
+    def feed(self, events, facing):
+        """
+        InputBuffer.drain() のイベントを渡す。成立したコマンドの [(名前, 時刻), ...] を返す。
+        """
+        found = []
+        motions = self.motions
+        progress = self.progress
+        last = self.last
+        window = self.window
+        for t, button, pressed in events:
+            if pressed:
+                self.held |= button
+            else:
+                self.held &= ~button
+
+            if button & DIRECTION_MASK:
+                d = direction(self.held, facing)
+                if d == self.direction:
+                    continue
+                self.direction = d
+                for i, motion in enumerate(motions):
+                    step = progress[i]
+                    if step and t - last[i] > window:
+                        step = 0
+                    if step < len(motion) and motion[step] == d:
+                        progress[i] = step + 1
+                        last[i] = t
+                    elif motion[0] == d:
+                        # 最初の方向が入り直したらそこからやり直す
+                        progress[i] = 1
+                        last[i] = t
+                    # それ以外の方向は無視する(623 を 6→3→2→3 と入れても成立させる)
+            elif button == BTN_ATTACK and pressed:
+                for i, motion in enumerate(motions):
+                    if progress[i] == len(motion) and t - last[i] <= window:
+                        found.append((self.names[i], t))
+                        break
+                for i in range(len(progress)):
+                    progress[i] = 0
+        return found
+
+    def reset(self):
+        for i in range(len(self.progress)):
+            self.progress[i] = 0
+        self.held = 0
+        self.direction = 5
+
+
+# =====================
+# 入力遅延の計測
+# =====================
+class LatencyStats:
+    """
+    キーを押してから、その入力を反映したティックが画面に出るまでの時間を集める。
+    入力がティックで使われたら add_input(押した時刻)、画面を更新したら presented() を呼ぶ。
+    押した時刻はイベントを取り出した時刻なので、clock.tick() の待ち中に押した分は短めに出る。
+    """
+    def __init__(self, size=LATENCY_SAMPLES):
+        self.size = size
+        self.samples = array("d", bytes(8 * size))
+        self.count = 0
+        self.pending = []
+
+    def add_input(self, t):
+        self.pending.append(t)
+
+    def presented(self, now=None):
+        if not self.pending:
+            return
+        if now is None:
+            now = time.perf_counter()
+        for t in self.pending:
+            self.samples[self.count % self.size] = now - t
+            self.count += 1
+        self.pending.clear()
+
+    def values(self):
+        return sorted(self.samples[:min(self.count, self.size)])
+
+    def percentiles(self, qs=(50, 95, 99)):
+        """
+        入力遅延のパーセンタイル(秒)。
+        """
+        values = self.values()
+        if not values:
+            return [0.0 for _ in qs]
+        return [values[min(len(values) - 1, int(len(values) * q / 100))] for q in qs]
+
+    def histogram(self, step=1 / 120, bins=8):
+        """
+        step 秒刻みの件数(最後の区間はそれ以上すべて)。
+        """
+        counts = [0] * bins
+        for v in self.values():
+            counts[min(bins - 1, int(v / step))] += 1
+        return counts
+
+    def summary(self):
+        n = min(self.count, self.size)
+        if not n:
+            return "input latency: no samples"
+        p50, p95, p99 = (v * 1e3 for v in self.percentiles())
+        return (f"input latency ({n} inputs): p50 {p50:.1f} ms  p95 {p95:.1f} ms  "
+                f"p99 {p99:.1f} ms  max {self.values()[-1] * 1e3:.1f} ms")
+
+    def clear(self):
+        self.count = 0
+        self.pending.clear()
+
+
+# =====================
+# プレイヤーごとの入力
+# =====================
+class PlayerInput:
+    """
+    InputBuffer・CommandRecognizer と、先行入力で待っている攻撃をまとめたもの。
+    tick() を1ティックに1回呼ぶと、このティックで攻撃を出すか・その攻撃で成立したコマンド・
+    成立したコマンドを返す(先行入力で持ち越した攻撃もコマンドを持ったまま出る)。
+    """
+    def __init__(self, keys, window=BUFFER_WINDOW):
+        self.buffer = InputBuffer(keys)
+        self.commands = CommandRecognizer()
+        self.window = window
+        self.attacks = deque()   # 撃てるのを待っている攻撃 [押した時刻, 成立したコマンド名か None]
+
+    def handle_event(self, event, t=None):
+        return self.buffer.handle_event(event, t)
+
+    def tick(self, now, facing, can_attack=True, latency=None):
+        """
+        (攻撃するか, 出す攻撃で成立したコマンド名か None, [(コマンド名, 時刻), ...]) を返す。
+        can_attack が False の間(攻撃の上限に達しているなど)は押した攻撃を window 秒まで持ち越す。
+        """
+        events = self.buffer.drain()
+        attacks = self.attacks
+        for t, button, pressed in events:
+            if not pressed:
+                continue
+            if button == BTN_ATTACK:
+                attacks.append([t, None])
+            elif latency is not None:
+                latency.add_input(t)
+        found = self.commands.feed(events, facing) if events else []
+        # コマンドは最後の攻撃ボタンと同じ時刻で成立するので、その攻撃に付ける
+        for name, t in found:
+            for attack in attacks:
+                if attack[0] == t:
+                    attack[1] = name
+
+        while attacks and now - attacks[0][0] > self.window:
+            attacks.popleft()
+        if attacks and can_attack:
+            t, command = attacks.popleft()
+            if latency is not None:
+                latency.add_input(t)
+            return True, command, found
+        return False, None, found
+
+    def clear(self):
+        self.buffer.clear()
+        self.commands.reset()
+        self.attacks.clear()
+
+
+# =====================
+# 実行(1フレームあたりのコスト)
+# =====================
+if __name__ == "__main__":
+    from engine import IN_ATTACK, IN_LEFT, IN_RIGHT, command_bits, new_match
+    from moves import character_path, load_character
+
+    # 使い方: python inputs.py [フレーム数]
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    keys = {"left": pg.K_a, "right": pg.K_d, "jump": pg.K_w, "down": pg.K_s, "attack": pg.K_f}
+    # 236+攻撃(右向き)を 1 フレームに 1 イベントずつ入れ続け、P1(空手家)の入力として試合に流す
+    # (試合が終わったら次の試合にする。終わった後のティックは数えない)
+    script = [pg.event.Event(t, key=k) for t, k in (
+        (pg.KEYDOWN, pg.K_s), (pg.KEYDOWN, pg.K_d), (pg.KEYUP, pg.K_s),
+        (pg.KEYDOWN, pg.K_f), (pg.KEYUP, pg.K_d), (pg.KEYUP, pg.K_f))]
+    player = PlayerInput(keys)
+    latency = LatencyStats()
+    karateka = load_character(character_path("karateka"))
+    match = new_match(characters=(karateka, None))
+    found = matches = 0
+    elapsed = 0.0
+    t = 0.0
+    for i in range(frames):
+        t += 1 / 60
+        start = time.perf_counter()
+        player.handle_event(script[i % len(script)], t)
+        fire, command, commands = player.tick(t, match.p1.facing, match.can_attack(match.p1),
+                                              latency)
+        elapsed += time.perf_counter() - start
+        found += len(commands)
+        latency.presented(t + 1 / 60)
+        held = player.buffer.held
+        bits = (IN_RIGHT if held & BTN_RIGHT else 0) | (IN_LEFT if held & BTN_LEFT else 0)
+        if match.step(bits | (IN_ATTACK | command_bits(command) if fire else 0), 0):
+            matches += 1
+            match = new_match(characters=(karateka, None))
+    print(f"{frames} frames: {elapsed / frames * 1e6:.2f}us per frame (input only), "
+          f"{found} fireballs, {matches} matches finished")
+
+    player = PlayerInput(keys)
+    start = time.perf_counter()
+    for i in range(frames):
+        player.tick(i / 60, 1)
+    print(f"no input: {(time.perf_counter() - start) / frames * 1e6:.2f}us per frame")
+    print(latency.summary())
@@ -1,18 +1,38 @@
 import pygame as pg
+import argparse
 import sys
 import os
+import time
+
+from engine import (
+    WIDTH, HEIGHT, FLOOR, MATCH_TIME, SIM_DT, IN_ATTACK, command_bits, new_match, attack_image,
+)
+from render import BattleRenderer, Camera, CompositionCache, darken
+from fonts import get_font, render_text, DigitAtlas
+from assets import AssetManager
+from audio import AudioManager
+from scenes import Scene, SceneManager
+from replay import InputRecorder, Replay
+from inputs import PlayerInput, LatencyStats
+from moves import load_character, character_path
+from cpu import CPUPlayer, CPU_LEVELS
+from capture import FrameCapture, CAPTURE_FORMATS, DEFAULT_FORMAT
+from broadcast import BroadcastServer, SpectatorClient, BROADCAST_PORT, parse_address, split_fields
+from animation import attach, load_atlas
+from particles import ParticleSystem, PARTICLE_QUALITY
+from profiler import FrameProfiler, ProfilerOverlay
 
 # =====================
 # 定数・初期設定
 # =====================
-WIDTH, HEIGHT = 1000, 600
-FLOOR = HEIGHT - 50
-
 TITLE = 0
 SELECT = 1
 BATTLE = 2
 PAUSED = 3
 SETTINGS = 4
+RESULT = 5
+REPLAY = 6
+SPECTATE = 7
 
 # OS判定して適切なフォントパスを設定
 import platform
@@ -23,172 +43,123 @@ elif platform.system() == "Darwin":  # macOS
 else:  # Linux等
     FONT_PATH = None  # システムデフォルトフォントを使用
 
-# BGMファイル(プロジェクト内の相対パス)
-MENU_BGM = "sound/bgm/menu-bgm.mp3"
-BATTLE_BGM = "sound/bgm/vhs-tape.mp3"
+# 画像・音声などはスクリプトと同じフォルダからの相対パスで置く
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-# マッチ時間(秒) -- 90秒
-MATCH_TIME = 90
 
-# カレントディレクトリをスクリプトの場所に
-try:
-    os.chdir(os.path.dirname(os.path.abspath(__file__)))
-except Exception:
-    pass
+def data_path(name):
+    return os.path.join(BASE_DIR, name)
 
-pg.init()
-pg.mixer.init()
-screen = pg.display.set_mode((WIDTH, HEIGHT))
-pg.display.set_caption("こうかとん ファイター")
-clock = pg.time.Clock()
 
-# フォント
-FONT_BIG = pg.font.Font(None, 80)
-FONT_MED = pg.font.Font(None, 36)
-FONT_SMALL = pg.font.Font(None, 24)
+# BGMファイル
+MENU_BGM = data_path("sound/bgm/menu-bgm.mp3")
+BATTLE_BGM = data_path("sound/bgm/vhs-tape.mp3")
 
+# 効果音ファイル(無ければ鳴らさない)
+SFX_FILES = {
+    "hit": data_path("sound/se/hit.wav"),
+    "ko": data_path("sound/se/ko.wav"),
+    "menu": data_path("sound/se/menu.wav"),
+}
 
-# =====================
-# ユーティリティ関数
-# =====================
-def safe_load_and_play_bgm(path, volume=0.5, loops=-1):
-    """
-    BGMを安全にロードして再生する(ファイルが無くてもクラッシュさせない)。
-    """
-    try:
-        pg.mixer.music.load(path)
-        pg.mixer.music.set_volume(volume)
-        pg.mixer.music.play(loops)
-    except Exception as e:
-        print(f"[BGM load error] {path} : {e}")
+# タイトル画面の背景
+TITLE_FILE = data_path("ダウンロード (1).jpg")
+
+# 試合結果を表示する時間(秒)
+RESULT_TIME = 2.0
+
+# 操作説明(下部)
+P1_KEYS_TEXT = "P1: A/D Move  W Jump  S Down  F Attack"
+P2_KEYS_TEXT = "P2: ←/→ Move  ↑ Jump  ↓ Down  RCTRL Attack"
+
+# 描画フレームレート上限
+FPS = 60
+# 1フレームで消化する経過時間の上限(極端な処理落ち時に追いつこうとして固まるのを防ぐ)
+MAX_FRAME_TIME = 0.25
+# バトル画面を変化した矩形だけ描き直す(False で毎フレーム全画面を描き直す)
+DIRTY_RENDERING = True
+
+# 試合ごとの入力を記録する(バグ報告の再現用。python replay.py で検証できる)
+RECORD_REPLAYS = True
+REPLAY_DIR = data_path("replays")
+
+# 処理時間のオーバーレイを切り替えるキー
+PROFILER_KEY = pg.K_F3
+# バトル画面の録画を始める・止めるキーと、録画の保存先
+CAPTURE_KEY = pg.K_F9
+CAPTURE_DIR = data_path("captures")
+
+# フォントの大きさ(フォント自体は Game が pg.font を初期化したあと、最初に使うときに作る)
+FONT_BIG = 80
+FONT_MED = 36
+FONT_SMALL = 24
+
+
+# 暗くした背景など、毎フレーム同じ静的な画面の合成結果
+BACKDROPS = CompositionCache()
 
 
 # =====================
 # 画像読み込み
 # =====================
-TITLE_BG = pg.transform.scale(
-    pg.image.load("ダウンロード (1).jpg").convert(),
-    (WIDTH, HEIGHT)
-)
+# 縮小済みの画素はディスクにキャッシュされ、2回目以降の起動では JPEG を展開しない
+# (読み込みは Game の起動時に裏で始める)
+ASSETS = AssetManager()
 
 # =====================
 # ステージ定義
 # =====================
+def fit_width(source_size):
+    """
+    元画像 source_size を縦横比を変えずに画面の高さに合わせたときの横幅(画面より狭くはしない)。
+    """
+    w, h = source_size
+    return max(WIDTH, round(w * HEIGHT / h))
+
+
+# width: ステージの横幅(背景はこの幅 x 画面の高さで読み込む)。画面より広いとカメラが横に追う。
+# 背景が引き伸ばされないよう、元画像(括弧内の大きさ)を高さに合わせた幅にする
 STAGES = [
     {
         "name": "境内",
-        "bg": pg.transform.scale(
-            pg.image.load("Tryfog.jpg").convert(),
-            (WIDTH, HEIGHT)
-        )
+        "file": data_path("Tryfog.jpg"),
+        "width": fit_width((735, 412))
     },
     {
         "name": "稽古場",
-        "bg": pg.transform.scale(
-            pg.image.load("ダウンロード.jpg").convert(),
-            (WIDTH, HEIGHT)
-        )
+        "file": data_path("ダウンロード.jpg"),
+        "width": fit_width((735, 412))
     },
     {
         "name": "繁華街(夜)",
-        "bg": pg.transform.scale(
-            pg.image.load("3Dオリジナル背景作品 格闘ゲーム用背景.jpg").convert(),
-            (WIDTH, HEIGHT)
-        )
+        "file": data_path("3Dオリジナル背景作品 格闘ゲーム用背景.jpg"),
+        "width": fit_width((736, 414))
     }
 ]
 
+# キャラクターごとのスプライトシート(行 = 状態、列 = コマ。animation.ANIMATIONS の並び)と、
+# シートが無いときの仮シートの色
+FIGHTER_SHEETS = {
+    "P1": (data_path("image/p1_sheet.png"), (0, 0, 255)),
+    "P2": (data_path("image/p2_sheet.png"), (255, 0, 0)),
+}
+# 使うキャラクター(characters/ の JSON の名前。--p1 / --p2 で変えられる)
+FIGHTER_CHARACTERS = {"P1": "kouka", "P2": "kouka"}
 
-# =====================
-# ファイタークラス
-# =====================
-class Fighter(pg.sprite.Sprite):
-    """
-    プレイヤー用ファイター。移動、ジャンプ、HPを管理する。
-    keys: dict で "left","right","jump","attack" のキーコードを渡す
-    """
-    def __init__(self, x, color, keys, name="Fighter"):
-        super().__init__()
-        self.image = pg.Surface((60, 120))
-        self.image.fill(color)
-        self.rect = self.image.get_rect()
-        self.rect.bottomleft = (x, FLOOR)
-
-        self.vx = 0
-        self.vy = 0
-        self.on_ground = True
-
-        self.hp = 100
-        self.keys = keys
-        self.facing = 1  # 1 = 右向き, -1 = 左向き
-        self.name = name
-
-    def update(self, key_lst):
-        """
-        入力に応じて移動・ジャンプ処理を行い、重力と地面判定を適用する。
-        """
-        self.vx = 0
-
-        if key_lst[self.keys["left"]]:
-            self.vx = -6
-            self.facing = -1
-        if key_lst[self.keys["right"]]:
-            self.vx = 6
-            self.facing = 1
 
-        if key_lst[self.keys["jump"]] and self.on_ground:
-            self.vy = -20
-            self.on_ground = False
 
-        # 簡易重力
-        self.vy += 1
-
-        # 位置更新
-        self.rect.x += self.vx
-        self.rect.y += self.vy
-
-        # 地面判定
-        if self.rect.bottom >= FLOOR:
-            self.rect.bottom = FLOOR
-            self.vy = 0
-            self.on_ground = True
-
-
-# =====================
-# 攻撃クラス
-# =====================
-class Attack(pg.sprite.Sprite):
+def stage_bg(index):
     """
-    簡易な飛び道具/パンチ用スプライト。
-    owner: 発射元の Fighter オブジェクト(味方判定に使用)
-    life: 生存フレーム(寿命)
-    vx: 横速度
+    ステージ背景を返す。まだ読み込み中なら None。
     """
-    def __init__(self, fighter):
-        super().__init__()
-        self.image = pg.Surface((40, 20))
-        self.image.fill((255, 0, 0))
-        self.rect = self.image.get_rect()
-
-        # 発射時の位置をファイターの前方に設定
-        if fighter.facing == 1:
-            self.rect.midleft = fighter.rect.midright
-            self.vx = 12
-        else:
-            self.rect.midright = fighter.rect.midleft
-            self.vx = -12
+    return ASSETS.get(("stage", index))
 
-        self.life = 30
-        self.owner = fighter
 
-    def update(self):
-        """
-        横移動し、寿命が尽きたら削除する。
-        """
-        self.rect.x += self.vx
-        self.life -= 1
-        if self.life <= 0:
-            self.kill()
+def stage_view(index):
+    """
+    ステージの中央の、画面1枚分の範囲(選択画面の背景に使う)。
+    """
+    return pg.Rect((STAGES[index]["width"] - WIDTH) // 2, 0, WIDTH, HEIGHT)
 
 
 # =====================
@@ -206,41 +177,56 @@ class HUD:
         self.pause_rect = pg.Rect(WIDTH - 110, 70, 100, 40)
         # 音量
         self.volume = 0.5
+        # スコア・タイマーの数字は事前描画したグリフを並べて描く
+        self.p1_digits = DigitAtlas(get_font(None, FONT_MED), (255, 255, 255), "P1 Wins: ")
+        self.p2_digits = DigitAtlas(get_font(None, FONT_MED), (255, 255, 255), "P2 Wins: ")
+        self.time_digits = DigitAtlas(get_font(None, FONT_MED), (255, 255, 255), "Time: ")
+        self.time_digits_red = DigitAtlas(get_font(None, FONT_MED), (255, 0, 0), "Time: ")
 
     def reset_timer(self):
         self.match_time = MATCH_TIME
 
-    def update_time(self, dt):
+    def sync_time(self, match):
+        """
+        試合の経過ティックから残り時間(秒)を反映する。
+        """
+        self.match_time = match.match_time
+
+    def state_key(self):
         """
-        秒単位の時間を減少させる(dt は秒)。
+        上部表示(スコア・タイマー)の内容が変わったかを判定するためのキー。
         """
-        self.match_time = max(0, self.match_time - dt)
+        return (self.p1_wins, self.p2_wins, int(self.match_time))
+
+    def layer_rects(self):
+        """
+        HUD が描画する領域(上部のスコア・タイマー、ポーズボタン、下部の操作説明)。
+        """
+        return [pg.Rect(0, 0, WIDTH, 45), self.pause_rect, pg.Rect(0, HEIGHT - 40, WIDTH, 40)]
 
     def draw_top(self, screen):
         """
         上部中央に時間、左/右にスコア、右上にポーズボタンを描画する。
         """
         # スコア(左・右)
-        score_left = FONT_MED.render(f"P1 Wins: {self.p1_wins}", True, (255, 255, 255))
-        score_right = FONT_MED.render(f"P2 Wins: {self.p2_wins}", True, (255, 255, 255))
-        screen.blit(score_left, (10, 10))
-        screen.blit(score_right, (WIDTH - 10 - score_right.get_width(), 10))
+        self.p1_digits.draw(screen, self.p1_wins, (10, 10))
+        self.p2_digits.draw(screen, self.p2_wins,
+                            (WIDTH - 10 - self.p2_digits.width(self.p2_wins), 10))
 
         # タイマー(中央) - 秒表示(整数)
         time_sec = int(self.match_time)
 
         # 30秒以下で点滅(偶数秒:赤 / 奇数秒:白)
         if time_sec <= 30 and time_sec % 2 == 0:
-            time_color = (255, 0, 0)   # 赤
+            digits = self.time_digits_red   # 赤
         else:
-            time_color = (255, 255, 255)
+            digits = self.time_digits
 
-        time_text = FONT_MED.render(f"Time: {time_sec}", True, time_color)
-        screen.blit(time_text, (WIDTH // 2 - time_text.get_width() // 2, 10))
+        digits.draw(screen, time_sec, (WIDTH // 2 - digits.width(time_sec) // 2, 10))
 
         # ポーズボタン(右上)
         pg.draw.rect(screen, (180, 180, 180), self.pause_rect)
-        p_label = FONT_SMALL.render("PAUSE", True, (0, 0, 0))
+        p_label = render_text(get_font(None, FONT_SMALL), "PAUSE", (0, 0, 0))
         screen.blit(p_label, (self.pause_rect.centerx - p_label.get_width() // 2,
                               self.pause_rect.centery - p_label.get_height() // 2))
 
@@ -251,8 +237,8 @@ class HUD:
         # 1行の背面灰色長方形(視認性のため)
         rect = pg.Rect(0, HEIGHT - 40, WIDTH, 40)
         pg.draw.rect(screen, (40, 40, 40), rect)
-        left = FONT_SMALL.render(p1_keys_text, True, (220, 220, 220))
-        right = FONT_SMALL.render(p2_keys_text, True, (220, 220, 220))
+        left = render_text(get_font(None, FONT_SMALL), p1_keys_text, (220, 220, 220))
+        right = render_text(get_font(None, FONT_SMALL), p2_keys_text, (220, 220, 220))
         screen.blit(left, (10, HEIGHT - 32))
         screen.blit(right, (WIDTH - 10 - right.get_width(), HEIGHT - 32))
 
@@ -268,29 +254,45 @@ class PauseMenu:
         self.options = ["Continue", "Settings", "Quit"]
         self.selected = 0
         self.hud = hud
+        self.background = None
+
+    def open(self, battle_surface):
+        """
+        ポーズに入ったときのバトル画面を背景として受け取る(合成済み背景は作り直す)。
+        """
+        self.background = battle_surface
+        BACKDROPS.invalidate("pause")
+
+    def build_backdrop(self):
+        """
+        暗くしたバトル画面+タイトル+操作ガイドを1枚に合成する。
+        """
+        if self.background:
+            backdrop = darken(self.background, 160)
+        else:
+            backdrop = pg.Surface((WIDTH, HEIGHT))
+
+        title = render_text(get_font(None, FONT_BIG), "Paused", (255, 255, 255))
+        backdrop.blit(title, (WIDTH // 2 - title.get_width() // 2, 100))
+
+        # 操作ガイド
+        guide = render_text(get_font(None, FONT_SMALL), "↑↓ Select  ENTER Confirm  SPACE Continue", (200, 200, 200))
+        backdrop.blit(guide, (WIDTH // 2 - guide.get_width() // 2, 500))
+        return backdrop
 
     def draw(self, screen):
         """
         半透明の背景+メニュー描画。
         """
-        overlay = pg.Surface((WIDTH, HEIGHT), pg.SRCALPHA)
-        overlay.fill((0, 0, 0, 160))
-        screen.blit(overlay, (0, 0))
-
-        title = FONT_BIG.render("Paused", True, (255, 255, 255))
-        screen.blit(title, (WIDTH // 2 - title.get_width() // 2, 100))
+        screen.blit(BACKDROPS.get(("pause",), self.build_backdrop), (0, 0))
 
         # メニュー
         for i, opt in enumerate(self.options):
             color = (255, 255, 0) if i == self.selected else (220, 220, 220)
-            label = FONT_MED.render(opt, True, color)
+            label = render_text(get_font(None, FONT_MED), opt, color)
             rect = label.get_rect(center=(WIDTH // 2, 220 + i * 70))
             screen.blit(label, rect)
 
-        # 操作ガイド
-        guide = FONT_SMALL.render("↑↓ Select  ENTER Confirm  SPACE Continue", True, (200, 200, 200))
-        screen.blit(guide, (WIDTH // 2 - guide.get_width() // 2, 500))
-
     def handle_event(self, event):
         """
         キー入力でメニューを操作する。選択確定は呼び出し元で判定する。
@@ -308,8 +310,9 @@ class PauseMenu:
             # クリックで選択
             mx, my = event.pos
             for i, opt in enumerate(self.options):
-                label = FONT_MED.render(opt, True, (0, 0, 0))
-                rect = label.get_rect(center=(WIDTH // 2, 220 + i * 70))
+                # 判定には大きさだけあればよいので描画はしない
+                rect = pg.Rect((0, 0), get_font(None, FONT_MED).size(opt))
+                rect.center = (WIDTH // 2, 220 + i * 70)
                 if rect.collidepoint(mx, my):
                     return opt
         return None
@@ -320,47 +323,86 @@ class PauseMenu:
 # =====================
 class SettingsMenu:
     """
-    設定画面(音量調整)。
+    設定画面(音量調整・パーティクルの品質)。
     """
-    def __init__(self, hud):
+    def __init__(self, hud, audio, particles):
         self.hud = hud
+        self.audio = audio
+        self.particles = particles
+        self.background = None
+        self.back_rect = pg.Rect(WIDTH // 2 - 75, 480, 150, 50)
+        self.quality_rect = pg.Rect(WIDTH // 2 - 150, 355, 300, 32)
+
+    def open(self, battle_surface):
+        """
+        ポーズに入ったときのバトル画面を背景として受け取る(合成済み背景は作り直す)。
+        """
+        self.background = battle_surface
+        BACKDROPS.invalidate("settings")
+
+    def set_volume(self, volume):
+        """
+        音量を変更する。表示が変わるので合成済みの画面は作り直す。
+        """
+        self.hud.volume = volume
+        self.audio.set_volume(volume)
+        BACKDROPS.invalidate("settings")
+
+    def cycle_quality(self):
+        """
+        パーティクルの品質を次の段階にする(重い環境では下げると上限が小さくなる)。
+        """
+        self.particles.set_quality((self.particles.quality + 1) % len(PARTICLE_QUALITY))
+        BACKDROPS.invalidate("settings")
 
     def draw(self, screen):
         """
         設定画面の描画。
         """
-        overlay = pg.Surface((WIDTH, HEIGHT), pg.SRCALPHA)
-        overlay.fill((0, 0, 0, 180))
-        screen.blit(overlay, (0, 0))
+        screen.blit(BACKDROPS.get(("settings",), self.build_screen), (0, 0))
 
-        title = FONT_BIG.render("Settings", True, (255, 255, 255))
-        screen.blit(title, (WIDTH // 2 - title.get_width() // 2, 100))
+    def build_screen(self):
+        """
+        暗くしたバトル画面に、音量表示・バー・ガイド・戻るボタンを合成する。
+        """
+        if self.background:
+            surf = darken(self.background, 180)
+        else:
+            surf = pg.Surface((WIDTH, HEIGHT))
+
+        title = render_text(get_font(None, FONT_BIG), "Settings", (255, 255, 255))
+        surf.blit(title, (WIDTH // 2 - title.get_width() // 2, 100))
 
         # 音量表示
-        vol_text = FONT_MED.render(f"Music Volume: {int(self.hud.volume * 100)}%", True, (255, 255, 255))
-        screen.blit(vol_text, (WIDTH // 2 - vol_text.get_width() // 2, 250))
+        vol_text = render_text(get_font(None, FONT_MED), f"Music Volume: {int(self.hud.volume * 100)}%", (255, 255, 255))
+        surf.blit(vol_text, (WIDTH // 2 - vol_text.get_width() // 2, 250))
 
         # 音量バー
         bar_back = pg.Rect(WIDTH // 2 - 150, 320, 300, 20)
-        pg.draw.rect(screen, (80, 80, 80), bar_back)
+        pg.draw.rect(surf, (80, 80, 80), bar_back)
         fill = pg.Rect(bar_back.x, bar_back.y, int(300 * self.hud.volume), 20)
-        pg.draw.rect(screen, (0, 200, 100), fill)
+        pg.draw.rect(surf, (0, 200, 100), fill)
+
+        # パーティクルの品質(クリックか Q で切り替え)
+        quality_text = render_text(get_font(None, FONT_SMALL),
+                                   f"Particles: {self.particles.quality_name}", (255, 255, 255))
+        surf.blit(quality_text, (WIDTH // 2 - quality_text.get_width() // 2,
+                                 self.quality_rect.centery - quality_text.get_height() // 2))
 
         # 操作ガイド
-        guide1 = FONT_SMALL.render("←/→ to change volume", True, (200, 200, 200))
-        guide2 = FONT_SMALL.render("ESC or ENTER to return to pause menu", True, (200, 200, 200))
-        screen.blit(guide1, (WIDTH // 2 - guide1.get_width() // 2, 400))
-        screen.blit(guide2, (WIDTH // 2 - guide2.get_width() // 2, 430))
+        guide1 = render_text(get_font(None, FONT_SMALL), "←/→ to change volume  Q to change particles", (200, 200, 200))
+        guide2 = render_text(get_font(None, FONT_SMALL), "ESC or ENTER to return to pause menu", (200, 200, 200))
+        surf.blit(guide1, (WIDTH // 2 - guide1.get_width() // 2, 400))
+        surf.blit(guide2, (WIDTH // 2 - guide2.get_width() // 2, 430))
 
         # 戻るボタン
-        back_rect = pg.Rect(WIDTH // 2 - 75, 480, 150, 50)
-        pg.draw.rect(screen, (100, 100, 100), back_rect)
-        pg.draw.rect(screen, (200, 200, 200), back_rect, 2)
-        back_label = FONT_MED.render("Back", True, (255, 255, 255))
-        screen.blit(back_label, (back_rect.centerx - back_label.get_width() // 2,
+        back_rect = self.back_rect
+        pg.draw.rect(surf, (100, 100, 100), back_rect)
+        pg.draw.rect(surf, (200, 200, 200), back_rect, 2)
+        back_label = render_text(get_font(None, FONT_MED), "Back", (255, 255, 255))
+        surf.blit(back_label, (back_rect.centerx - back_label.get_width() // 2,
                                  back_rect.centery - back_label.get_height() // 2))
-
-        self.back_rect = back_rect
+        return surf
 
     def handle_event(self, event):
         """
@@ -368,11 +410,11 @@ class SettingsMenu:
         """
         if event.type == pg.KEYDOWN:
             if event.key == pg.K_LEFT:
-                self.hud.volume = max(0.0, self.hud.volume - 0.05)
-                pg.mixer.music.set_volume(self.hud.volume)
+                self.set_volume(max(0.0, self.hud.volume - 0.05))
             if event.key == pg.K_RIGHT:
-                self.hud.volume = min(1.0, self.hud.volume + 0.05)
-                pg.mixer.music.set_volume(self.hud.volume)
+                self.set_volume(min(1.0, self.hud.volume + 0.05))
+            if event.key == pg.K_q:
+                self.cycle_quality()
             if event.key == pg.K_ESCAPE or event.key == pg.K_RETURN:
                 return "Back"
         elif event.type == pg.MOUSEBUTTONDOWN and event.button == 1:
@@ -381,8 +423,9 @@ class SettingsMenu:
             bar = pg.Rect(WIDTH // 2 - 150, 320, 300, 20)
             if bar.collidepoint(mx, my):
                 rel = (mx - bar.x) / bar.width
-                self.hud.volume = min(1.0, max(0.0, rel))
-                pg.mixer.music.set_volume(self.hud.volume)
+                self.set_volume(min(1.0, max(0.0, rel)))
+            if self.quality_rect.collidepoint(mx, my):
+                self.cycle_quality()
             # 戻るボタン
             if self.back_rect.collidepoint(mx, my):
                 return "Back"
@@ -392,59 +435,67 @@ class SettingsMenu:
 # =====================
 # タイトル画面
 # =====================
-def draw_title():
-    screen.blit(TITLE_BG, (0, 0))
-
-    overlay = pg.Surface((WIDTH, HEIGHT))
-    overlay.set_alpha(120)
-    overlay.fill((0, 0, 0))
-    screen.blit(overlay, (0, 0))
+def build_title():
+    """
+    タイトル画面は動く要素が無いので、暗くした背景と文字を1枚に合成しておく。
+    """
+    surf = darken(ASSETS.wait("title"), 120)
 
     # フォントパスがNoneの場合はデフォルトフォントを使用
-    if FONT_PATH:
-        font = pg.font.Font(FONT_PATH, 80)
-        small = pg.font.Font(FONT_PATH, 36)
-    else:
-        font = pg.font.Font(None, 80)
-        small = pg.font.Font(None, 36)
+    font = get_font(FONT_PATH, 80)
+    small = get_font(FONT_PATH, 36)
+
+    title = render_text(font, "こうかとん ファイター", (255, 255, 255))
+    guide = render_text(small, "ENTERキーでスタート", (230, 230, 230))
 
-    title = font.render("こうかとん ファイター", True, (255, 255, 255))
-    guide = small.render("ENTERキーでスタート", True, (230, 230, 230))
+    surf.blit(title, (WIDTH//2 - title.get_width()//2, 220))
+    surf.blit(guide, (WIDTH//2 - guide.get_width()//2, 330))
+    return surf
 
-    screen.blit(title, (WIDTH//2 - title.get_width()//2, 220))
-    screen.blit(guide, (WIDTH//2 - guide.get_width()//2, 330))
+
+def draw_title(screen):
+    screen.blit(BACKDROPS.get(("title",), build_title), (0, 0))
 
 
 # =====================
 # バトル選択画面
 # =====================
-def draw_select(selected):
-    # 選択肢に応じた背景表示(ゲーム終了以外)
-    if selected < len(STAGES):
-        screen.blit(STAGES[selected]["bg"], (0, 0))
-    else:
-        screen.blit(STAGES[0]["bg"], (0, 0))
-
-    overlay = pg.Surface((WIDTH, HEIGHT))
-    overlay.set_alpha(150)
-    overlay.fill((0, 0, 0))
-    screen.blit(overlay, (0, 0))
+def build_select_backdrop(stage_index):
+    """
+    選択画面の背景(暗くしたステージ+見出し+操作ガイド)をステージごとに合成する。
+    """
+    surf = darken(stage_bg(stage_index).subsurface(stage_view(stage_index)), 150)
 
     # フォントパスがNoneの場合はデフォルトフォントを使用
-    if FONT_PATH:
-        font = pg.font.Font(FONT_PATH, 60)
-        small = pg.font.Font(FONT_PATH, 30)
-    else:
-        font = pg.font.Font(None, 60)
-        small = pg.font.Font(None, 30)
+    font = get_font(FONT_PATH, 60)
+    small = get_font(FONT_PATH, 30)
+
+    title = render_text(font, "バトルステージ選択", (255, 255, 255))
+    surf.blit(title, (WIDTH//2 - title.get_width()//2, 60))
 
-    title = font.render("バトルステージ選択", True, (255, 255, 255))
-    screen.blit(title, (WIDTH//2 - title.get_width()//2, 60))
+    guide = render_text(small, "↑↓で選択  ENTERで決定", (220, 220, 220))
+    surf.blit(guide, (WIDTH//2 - guide.get_width()//2, 500))
+    return surf
+
+
+def draw_select(screen, selected):
+    # 選択肢に応じた背景表示(ゲーム終了以外)
+    stage_index = selected if selected < len(STAGES) else 0
+    small = get_font(FONT_PATH, 30)
+    if stage_bg(stage_index) is not None:
+        screen.blit(BACKDROPS.get(("select", stage_index),
+                                  lambda: build_select_backdrop(stage_index)), (0, 0))
+    else:
+        # 読み込み中は仮の背景と進み具合を表示(合成結果はキャッシュしない)
+        screen.fill((20, 20, 20))
+        done, total = ASSETS.progress()
+        loading = render_text(small, f"Loading... {done}/{total}", (160, 160, 160))
+        screen.blit(loading, (WIDTH//2 - loading.get_width()//2, 60))
 
     # ステージ選択肢
     for i, stage in enumerate(STAGES):
         color = (255, 255, 0) if i == selected else (200, 200, 200)
-        label = small.render(stage["name"], True, color)
+        label = render_text(small, stage["name"], color)
 
         rect = pg.Rect(350, 180 + i * 80, 300, 50)
         pg.draw.rect(screen, color, rect, 2)
@@ -457,7 +508,7 @@ def draw_select(selected):
     # ゲーム終了ボタン
     quit_index = len(STAGES)
     color = (255, 255, 0) if quit_index == selected else (200, 200, 200)
-    label = small.render("ゲーム終了", True, color)
+    label = render_text(small, "ゲーム終了", color)
     rect = pg.Rect(350, 180 + quit_index * 80, 300, 50)
     pg.draw.rect(screen, color, rect, 2)
     screen.blit(
@@ -466,202 +517,654 @@ def draw_select(selected):
          rect.centery - label.get_height()//2)
     )
 
-    guide = small.render("↑↓で選択  ENTERで決定", True, (220, 220, 220))
-    screen.blit(guide, (WIDTH//2 - guide.get_width()//2, 500))
+
+# =====================
+# シーン: タイトル
+# =====================
+class TitleScene(Scene):
+    def handle_event(self, event):
+        if event.type == pg.KEYDOWN and event.key == pg.K_RETURN:
+            self.game.audio.play_sfx("menu")
+            self.game.scenes.switch(SELECT)
+
+    def draw(self, screen):
+        draw_title(screen)
 
 
 # =====================
-# メイン処理
+# シーン: バトル選択
 # =====================
-def main():
-    game_state = TITLE
-    selected_stage = 0
-    current_stage = 0
+class SelectScene(Scene):
+    def __init__(self, game):
+        super().__init__(game)
+        self.selected = 0
+
+    def handle_event(self, event):
+        if event.type != pg.KEYDOWN:
+            return
+        game = self.game
+        if event.key in (pg.K_UP, pg.K_DOWN, pg.K_RETURN):
+            game.audio.play_sfx("menu")
+        if event.key == pg.K_UP:
+            self.selected = (self.selected - 1) % (len(STAGES) + 1)
+        if event.key == pg.K_DOWN:
+            self.selected = (self.selected + 1) % (len(STAGES) + 1)
+        if event.key == pg.K_RETURN:
+            if self.selected == len(STAGES):  # ゲーム終了
+                game.running = False
+            else:
+                game.scenes.switch(BATTLE, stage=self.selected)
+
+    def draw(self, screen):
+        draw_select(screen, self.selected)
+
+
+# =====================
+# シーン: バトル
+# =====================
+class BattleScene(Scene):
+    """
+    試合を固定タイムステップで進め、BattleRenderer で描画する。
+    """
+    presents = True
+
+    def __init__(self, game):
+        super().__init__(game)
+        match = game.match
+        # 固定タイムステップ用の未消化時間と、プレイヤーごとの入力バッファ
+        self.accumulator = 0.0
+        self.players = {match.p1: PlayerInput(match.p1.keys), match.p2: PlayerInput(match.p2.keys)}
+        self.match_over = False
+        self.bg = None
+        self.stage = 0
+        self.recorder = None
+
+    def enter(self, stage=None):
+        """
+        stage を渡すとそのステージで試合を始める(ポーズからの復帰では渡さない)。
+        """
+        game = self.game
+        if stage is not None:
+            # 読み込みが終わっていなければここで待つ
+            self.bg = ASSETS.wait(("stage", stage))
+            self.stage = stage
+            # ステージの広さに合わせて開始位置に並べ、カメラを2人の間に合わせる
+            game.match.set_stage(STAGES[stage]["width"])
+            game.camera.set_stage(STAGES[stage]["width"])
+            game.camera.follow(game.match.fighters.sprites(), snap=True)
+            game.hud.reset_timer()
+            game.match.reset_timer()
+            self.accumulator = 0.0
+            game.audio.play_music("battle")
+            if RECORD_REPLAYS:
+                self.recorder = InputRecorder(game.match, stage)
+        game.renderer.invalidate()
+
+    def clear_inputs(self):
+        for player in self.players.values():
+            player.clear()
+        if self.game.cpu is not None:
+            self.game.cpu.reset()
+
+    def read_inputs(self, key_lst):
+        """
+        次のティックに渡す (P1 の入力, P2 の入力)。
+        攻撃は入力バッファから取り出す(撃てない間は BUFFER_WINDOW 秒まで持ち越す)。
+        コマンド(236+攻撃など)が成立した攻撃は、そのコマンドの技の番号を入力ビットに付ける。
+        CPU 対戦では P2 の入力は CPU が決める(思考は別スレッドなのでここでは待たない)。
+        """
+        game = self.game
+        match = game.match
+        now = time.perf_counter()
+        bits = []
+        for f in (match.p1, match.p2):
+            if f is match.p2 and game.cpu is not None:
+                bits.append(game.cpu(match, f, match.p1))
+                continue
+            fire, command, _ = self.players[f].tick(now, f.facing, match.can_attack(f),
+                                                     game.latency)
+            attack = IN_ATTACK | command_bits(command) if fire else 0
+            bits.append(f.read_input(key_lst) | attack)
+        in1, in2 = bits
+        if self.recorder is not None:
+            self.recorder.record(in1, in2)
+        return in1, in2
+
+    def finish_recording(self):
+        """
+        試合終了時に記録を replays/ に書き出す。
+        """
+        recorder = self.recorder
+        if recorder is None:
+            return
+        self.recorder = None
+        recorder.finish(self.game.match)
+        try:
+            os.makedirs(REPLAY_DIR, exist_ok=True)
+            recorder.save(os.path.join(REPLAY_DIR, time.strftime("%Y%m%d-%H%M%S") + ".kkr"))
+        except OSError as e:
+            print(f"[replay save error] {e}")
+
+    def pause(self):
+        """
+        今のバトル画面を背景にしてポーズ画面へ。
+        """
+        game = self.game
+        # ポーズ中に離したキーは届かないので、押しっぱなしの状態ごと捨てる
+        self.clear_inputs()
+        battle_surface = game.screen.copy()
+        game.pause_menu.open(battle_surface)
+        game.settings_menu.open(battle_surface)
+        game.scenes.switch(PAUSED)
+
+    def handle_event(self, event):
+        game = self.game
+        # ESCキーでポーズ
+        if event.type == pg.KEYDOWN and event.key == pg.K_ESCAPE:
+            self.pause()
+            return
+
+        # ポーズボタン(クリック判定)
+        if event.type == pg.MOUSEBUTTONDOWN and event.button == 1:
+            if game.hud.pause_rect.collidepoint(event.pos):
+                self.pause()
+                return
+
+        # キーの押す・離すは時刻付きで入力バッファへ(次のシミュレーションティックで読む)
+        if event.type in (pg.KEYDOWN, pg.KEYUP):
+            now = time.perf_counter()
+            for player in self.players.values():
+                player.handle_event(event, now)
+
+    def update(self, dt):
+        # シミュレーション(描画フレームに関係なく SIM_DT 刻みで進める)
+        game = self.game
+        match = game.match
+        key_lst = pg.key.get_pressed()
+
+        particles = game.particles
+        particles.update(dt)
+
+        self.accumulator += dt
+        self.match_over = False
+        while self.accumulator >= SIM_DT and not self.match_over:
+            self.accumulator -= SIM_DT
+
+            in1, in2 = self.read_inputs(key_lst)
+            self.match_over = match.step(in1, in2)
+            if game.broadcast is not None:
+                game.hud.sync_time(match)
+                game.broadcast.publish(match, game.hud, self.stage)
+            for f in match.hits:
+                game.audio.play_sfx("hit")
+                particles.hit(f.rect.center)
+            for f in (match.p1, match.p2):
+                if f.landed:
+                    particles.dust(f.rect.midbottom)
+
+        # 時間の経過を HUD に反映
+        game.hud.sync_time(match)
+
+    def draw(self, screen):
+        game = self.game
+        match = game.match
+        # 描画(前ティックと現ティックの間を補間)し、画面に反映
+        alpha = 1.0 if self.match_over else self.accumulator / SIM_DT
+        game.camera.follow(match.fighters.sprites(), alpha)
+        # 最後のフレームは結果画面の背景になるのでパーティクルを描かない(結果画面で重ねる)
+        game.renderer.draw(self.bg, (match.fighters, match.attacks), alpha,
+                           game.hud, P1_KEYS_TEXT, P2_KEYS_TEXT,
+                           None if self.match_over else game.particles, game.camera)
+
+        # 終了条件: HPが0か時間切れ
+        if self.match_over:
+            self.finish_recording()
+            if match.is_ko():
+                game.audio.play_sfx("ko")
+                for f in (match.p1, match.p2):
+                    if f.hp <= 0:
+                        game.particles.burst(f.rect.center)
+
+            # 勝者判定
+            winner = match.winner()
+            if winner == "P1":
+                game.hud.p1_wins += 1
+            elif winner == "P2":
+                game.hud.p2_wins += 1
+            if game.broadcast is not None:
+                game.broadcast.publish(match, game.hud, self.stage)
+            game.scenes.switch(RESULT, winner=winner, ko=match.is_ko())
 
-    # グループ
-    fighters = pg.sprite.Group()
-    attacks = pg.sprite.Group()
 
-    # プレイヤー作成
-    p1 = Fighter(200, (0, 0, 255), {
-        "left": pg.K_a,
-        "right": pg.K_d,
-        "jump": pg.K_w,
-        "attack": pg.K_f
-    }, name="P1")
+# =====================
+# シーン: リプレイ再生
+# =====================
+class ReplayScene(BattleScene):
+    """
+    記録した入力で試合を再生する(キー入力の代わりに記録を流し込む)。
+    seek を渡すとそのティックまで描画なしで早送りしてから再生する。ESC で終了。
+    """
+    def enter(self, replay, seek=0):
+        game = self.game
+        match = game.match
+        self.replay = replay
+        stage = replay.stage if 0 <= replay.stage < len(STAGES) else 0
+        self.bg = ASSETS.wait(("stage", stage))
+        self.stage = stage
+        # ステージの横幅は記録に入っている(古い記録は壁なしで、カメラは動かない)
+        game.camera.set_stage(match.stage_width)
+        # 今の STAGES と幅が違う版で記録したときは、映す範囲が背景からはみ出ないよう合わせる
+        if self.bg.get_width() < game.camera.stage_width:
+            self.bg = pg.transform.scale(self.bg, (game.camera.stage_width, HEIGHT))
+        # 描画なしで seek ティック目まで早送り(最後のティックは画面で見せる)
+        self.inputs = replay.inputs()
+        while match.tick < min(seek, replay.ticks - 1):
+            match.step(*next(self.inputs))
+        self.accumulator = 0.0
+        game.hud.sync_time(match)
+        game.camera.follow(match.fighters.sprites(), snap=True)
+        game.audio.play_music("battle")
+        game.renderer.invalidate()
+
+    def read_inputs(self, key_lst):
+        return next(self.inputs, (0, 0))
+
+    def finish_recording(self):
+        # 再生結果を記録時のハッシュと照合(ずれていれば報告)
+        got = self.game.match.state_hash()
+        if self.replay.end_hash is None:
+            print("[replay] no recorded hash")
+        elif got == self.replay.end_hash:
+            print("[replay] OK")
+        else:
+            print(f"[replay] DESYNC: recorded {self.replay.end_hash}, got {got}")
 
-    p2 = Fighter(700, (255, 0, 0), {
-        "left": pg.K_LEFT,
-        "right": pg.K_RIGHT,
-        "jump": pg.K_UP,
-        "attack": pg.K_RCTRL
-    }, name="P2")
+    def handle_event(self, event):
+        if event.type == pg.KEYDOWN and event.key == pg.K_ESCAPE:
+            self.game.running = False
 
-    fighters.add(p1, p2)
 
-    # HUD とメニュー
-    hud = HUD()
-    pause_menu = PauseMenu(hud)
-    settings_menu = SettingsMenu(hud)
+# =====================
+# シーン: 観戦(配信された試合状態を描くだけで、試合は進めない)
+# =====================
+class SpectatorScene(Scene):
+    """
+    --broadcast で起動したゲームから届く状態をそのまま描く。ESC で終了。
+    届いた状態のうち最新のものだけを使う(描画が遅れても古いフレームを溜めない)。
+    """
+    presents = True
+
+    def __init__(self, game):
+        super().__init__(game)
+        self.client = None
+        self.serial = 0
+        self.stage = None
+        self.bg = None
+        # 攻撃は見た目だけのスプライトを使い回す
+        self.attacks = pg.sprite.Group()
+        self.attack_sprites = []
+
+    def enter(self, address):
+        self.address = address
+        self.client = SpectatorClient(*address)
+        self.client.start()
+        self.game.audio.play_music("battle")
+        self.game.renderer.invalidate()
+
+    def exit(self):
+        if self.client is not None:
+            self.client.close()
+            self.client = None
 
-    # 初期BGM(タイトル/メニュー)
-    safe_load_and_play_bgm(MENU_BGM, hud.volume)
+    def handle_event(self, event):
+        if event.type == pg.KEYDOWN and event.key == pg.K_ESCAPE:
+            self.game.running = False
+
+    def update(self, dt):
+        game = self.game
+        game.particles.update(dt)
+        serial, fields = self.client.latest()
+        if fields is None or serial == self.serial:
+            return
+        self.serial = serial
+        (_, stage, time_cs, p1_wins, p2_wins), fighters, attacks = split_fields(fields)
+
+        if stage != self.stage:
+            self.stage = stage
+            index = stage if 0 <= stage < len(STAGES) else 0
+            self.bg = ASSETS.wait(("stage", index))
+            game.camera.set_stage(STAGES[index]["width"])
+            game.renderer.invalidate()
+        hud = game.hud
+        hud.match_time = time_cs / 100
+        hud.p1_wins = p1_wins
+        hud.p2_wins = p2_wins
+
+        particles = game.particles
+        for f, (x, y, w, h, hp, facing) in zip((game.match.p1, game.match.p2), fighters):
+            f.prev_pos = f.rect.topleft
+            f.vx = x - f.rect.x
+            f.rect.update(x, y, w, h)
+            on_ground = f.rect.bottom >= FLOOR
+            if on_ground and not f.on_ground:
+                particles.dust(f.rect.midbottom)
+            f.on_ground = on_ground
+            if hp < f.hp:
+                f.play("hit")
+                game.audio.play_sfx("hit")
+                particles.hit(f.rect.center)
+            f.hp = hp
+            f.facing = facing
+            if f.animator is not None:
+                f.image = f.animator.update(f)
+
+        sprites = self.attack_sprites
+        while len(sprites) < len(attacks):
+            spr = pg.sprite.Sprite()
+            spr.rect = pg.Rect(0, 0, 0, 0)
+            sprites.append(spr)
+        for spr, (x, y, w, h, _) in zip(sprites, attacks):
+            if spr.rect.size != (w, h):
+                spr.image = attack_image((w, h))
+            spr.rect = pg.Rect(x, y, w, h)
+            spr.prev_pos = spr.rect.topleft
+        self.attacks.empty()
+        self.attacks.add(sprites[:len(attacks)])
 
-    running = True
+    def draw(self, screen):
+        game = self.game
+        if self.bg is None:
+            host, port = self.address
+            screen.fill((0, 0, 0))
+            text = render_text(get_font(None, FONT_MED), f"Waiting for broadcast {host}:{port}",
+                               (220, 220, 220))
+            screen.blit(text, (WIDTH // 2 - text.get_width() // 2, HEIGHT // 2 - 20))
+            game.renderer.present(record=False)
+            return
+        game.camera.follow(game.match.fighters.sprites())
+        game.renderer.draw(self.bg, (game.match.fighters, self.attacks), 1.0,
+                           game.hud, P1_KEYS_TEXT, P2_KEYS_TEXT, game.particles, game.camera)
 
-    # 操作説明(下部)
-    p1_keys_text = "P1: A/D Move  W Jump  F Attack"
-    p2_keys_text = "P2: ←/→ Move  ↑ Jump  RCTRL Attack"
 
-    # バトル画面の保存用(ポーズ時に背景として使う)
-    battle_surface = None
+# =====================
+# シーン: 試合結果(RESULT_TIME 秒表示して選択画面へ)
+# =====================
+class ResultScene(Scene):
+    """
+    最後のバトル画面に結果を重ねて表示する。表示中もイベント処理と描画は止めない。
+    """
+    def enter(self, winner, ko):
+        self.winner = winner
+        self.ko = ko
+        self.game.scenes.switch_after(RESULT_TIME, SELECT)
+
+    def build_screen(self):
+        surf = self.game.screen.copy()
+        result_text = render_text(get_font(None, FONT_BIG), "K.O." if self.ko else "Time Up", (255, 255, 0))
+        surf.blit(result_text, (WIDTH // 2 - result_text.get_width() // 2, HEIGHT // 2 - 40))
+        winner_text = render_text(get_font(None, FONT_MED), f"Winner: {self.winner}", (255, 255, 255))
+        surf.blit(winner_text, (WIDTH // 2 - winner_text.get_width() // 2, HEIGHT // 2 + 30))
+        return surf
+
+    def exit(self):
+        # リセット
+        game = self.game
+        game.match.reset()
+        game.scenes.scenes[BATTLE].clear_inputs()
+        game.particles.clear()
+        game.hud.reset_timer()
+        game.audio.play_music("menu")
+        self.release()
+
+    def update(self, dt):
+        # KO の爆発などは結果表示中も動かす
+        self.game.particles.update(dt)
 
-    while running:
-        dt_ms = clock.tick(60)
-        dt = dt_ms / 1000.0
+    def draw(self, screen):
+        # 結果を重ねた画面は最初のフレームで1回だけ作る
+        screen.blit(self.resource("screen", self.build_screen), (0, 0))
+        self.game.particles.draw(screen, self.game.camera.x)
 
-        key_lst = pg.key.get_pressed()
 
-        for event in pg.event.get():
-            if event.type == pg.QUIT:
-                running = False
-
-            # ===== タイトル =====
-            if game_state == TITLE:
-                if event.type == pg.KEYDOWN and event.key == pg.K_RETURN:
-                    game_state = SELECT
-
-            # ===== バトル選択 =====
-            elif game_state == SELECT:
-                if event.type == pg.KEYDOWN:
-                    if event.key == pg.K_UP:
-                        selected_stage = (selected_stage - 1) % (len(STAGES) + 1)
-                    if event.key == pg.K_DOWN:
-                        selected_stage = (selected_stage + 1) % (len(STAGES) + 1)
-                    if event.key == pg.K_RETURN:
-                        if selected_stage == len(STAGES):  # ゲーム終了
-                            running = False
-                        else:
-                            current_stage = selected_stage
-                            game_state = BATTLE
-                            hud.reset_timer()
-                            safe_load_and_play_bgm(BATTLE_BGM, hud.volume)
-
-            # ===== バトル中の入力 =====
-            elif game_state == BATTLE:
-                # ESCキーでポーズ
-                if event.type == pg.KEYDOWN and event.key == pg.K_ESCAPE:
-                    game_state = PAUSED
-                    battle_surface = screen.copy()
-
-                # ポーズボタン(クリック判定)
-                if event.type == pg.MOUSEBUTTONDOWN and event.button == 1:
-                    if hud.pause_rect.collidepoint(event.pos):
-                        game_state = PAUSED
-                        battle_surface = screen.copy()
-
-                if event.type == pg.KEYDOWN:
-                    # 攻撃キーでAttack生成
-                    if event.key == p1.keys["attack"]:
-                        attacks.add(Attack(p1))
-                    if event.key == p2.keys["attack"]:
-                        attacks.add(Attack(p2))
-
-            # ===== ポーズ中の入力 =====
-            elif game_state == PAUSED:
-                result = pause_menu.handle_event(event)
-                if result == "Continue":
-                    game_state = BATTLE
-                elif result == "Settings":
-                    game_state = SETTINGS
-                elif result == "Quit":
-                    game_state = SELECT
-                    safe_load_and_play_bgm(MENU_BGM, hud.volume)
-
-            # ===== 設定画面の入力 =====
-            elif game_state == SETTINGS:
-                result = settings_menu.handle_event(event)
-                if result == "Back":
-                    game_state = PAUSED
-
-        # ===== 描画・更新 =====
-        if game_state == TITLE:
-            draw_title()
-
-        elif game_state == SELECT:
-            draw_select(selected_stage)
-
-        elif game_state == BATTLE:
-            # 背景描画
-            screen.blit(STAGES[current_stage]["bg"], (0, 0))
-
-            # 時間の経過更新
-            hud.update_time(dt)
-
-            # 更新
-            fighters.update(key_lst)
-            attacks.update()
-
-            # 攻撃判定(攻撃のownerが被弾相手と等しくないことを確認)
-            for atk in attacks.copy():
-                if atk.owner != p1 and atk.rect.colliderect(p1.rect):
-                    p1.hp -= 5
-                    atk.kill()
-                if atk.owner != p2 and atk.rect.colliderect(p2.rect):
-                    p2.hp -= 5
-                    atk.kill()
-
-            # 描画
-            fighters.draw(screen)
-            attacks.draw(screen)
-
-            # HUD 描画
-            hud.draw_top(screen)
-            hud.draw_bottom_controls(screen, p1_keys_text, p2_keys_text)
-
-            # 終了条件: HPが0か時間切れ
-            if p1.hp <= 0 or p2.hp <= 0 or hud.match_time <= 0:
-                # 勝者判定
-                if p1.hp > p2.hp:
-                    winner = "P1"
-                    hud.p1_wins += 1
-                elif p2.hp > p1.hp:
-                    winner = "P2"
-                    hud.p2_wins += 1
-                else:
-                    winner = "Draw"
-
-                # 表示
-                result_text = FONT_BIG.render("K.O." if (p1.hp <= 0 or p2.hp <= 0) else "Time Up", True, (255, 255, 0))
-                screen.blit(result_text, (WIDTH // 2 - result_text.get_width() // 2, HEIGHT // 2 - 40))
-                winner_text = FONT_MED.render(f"Winner: {winner}", True, (255, 255, 255))
-                screen.blit(winner_text, (WIDTH // 2 - winner_text.get_width() // 2, HEIGHT // 2 + 30))
-                pg.display.update()
-                pg.time.delay(2000)
-
-                # リセット
-                p1.hp = 100
-                p2.hp = 100
-                attacks.empty()
-                hud.reset_timer()
-                safe_load_and_play_bgm(MENU_BGM, hud.volume)
-                game_state = SELECT
-                continue
+# =====================
+# シーン: ポーズ・設定
+# =====================
+class PausedScene(Scene):
+    def handle_event(self, event):
+        game = self.game
+        if event.type == pg.KEYDOWN and event.key in (pg.K_UP, pg.K_DOWN, pg.K_RETURN):
+            game.audio.play_sfx("menu")
+        result = game.pause_menu.handle_event(event)
+        if result == "Continue":
+            game.scenes.switch(BATTLE)
+        elif result == "Settings":
+            game.scenes.switch(SETTINGS)
+        elif result == "Quit":
+            # 途中でやめた試合は持ち越さない(記録も捨てる)
+            game.match.reset()
+            game.scenes.scenes[BATTLE].recorder = None
+            game.scenes.scenes[BATTLE].clear_inputs()
+            game.particles.clear()
+            game.hud.reset_timer()
+            game.audio.play_music("menu")
+            game.scenes.switch(SELECT)
+
+    def draw(self, screen):
+        # バトル画面を暗くした背景ごと合成済みの画面を表示
+        self.game.pause_menu.draw(screen)
 
-        elif game_state == PAUSED:
-            # バトル画面を背景として表示
-            if battle_surface:
-                screen.blit(battle_surface, (0, 0))
-            pause_menu.draw(screen)
 
-        elif game_state == SETTINGS:
-            # バトル画面を背景として表示
-            if battle_surface:
-                screen.blit(battle_surface, (0, 0))
-            settings_menu.draw(screen)
+class SettingsScene(Scene):
+    def handle_event(self, event):
+        game = self.game
+        if game.settings_menu.handle_event(event) == "Back":
+            game.scenes.switch(PAUSED)
+
+    def draw(self, screen):
+        self.game.settings_menu.draw(screen)
 
-        pg.display.update()
 
+# =====================
+# ゲーム全体
+# =====================
+class Game:
+    """
+    試合・HUD・メニュー・音声など画面をまたいで使う状態と、シーンの切り替えを持つ。
+    """
+    def __init__(self, replay=None, seek=0, profile=False, profile_out=None, characters=None,
+                 cpu=None, capture=None, broadcast=None, spectate=None):
+        # 使う pygame の機能だけ初期化する(pg.init() はジョイスティックなども起動してしまう)
+        pg.display.init()
+        pg.font.init()
+        try:
+            pg.mixer.init()
+        except pg.error as e:
+            print(f"[audio init error] {e}")
+        self.screen = pg.display.set_mode((WIDTH, HEIGHT))
+        pg.display.set_caption("こうかとん ファイター")
+        self.clock = pg.time.Clock()
+
+        # タイトル背景を先頭に、ステージ背景はタイトル画面を表示している間に裏で読み込む
+        ASSETS.preload([("title", TITLE_FILE, (WIDTH, HEIGHT))]
+                       + [(("stage", i), stage["file"], (stage["width"], HEIGHT))
+                          for i, stage in enumerate(STAGES)])
+
+        # 試合状態(プレイヤー・攻撃グループ)。リプレイ再生時は記録開始時の状態から
+        self.replay = replay
+        self.seek = seek
+        # キャラクターの技の表はコンパイル済みのキャッシュから読む(リプレイは記録に埋め込まれたもの)
+        if replay:
+            self.match = replay.new_match()
+        else:
+            names = characters or FIGHTER_CHARACTERS
+            self.match = new_match(characters=tuple(
+                load_character(character_path(names[p])) for p in ("P1", "P2")))
+        # シートは起動時に1回だけ読み込み、左右反転も済ませておく
+        for f in (self.match.p1, self.match.p2):
+            path, color = FIGHTER_SHEETS[f.name]
+            attach(f, load_atlas(path, color))
+
+        # HUD とメニュー
+        self.hud = HUD()
+        self.pause_menu = PauseMenu(self.hud)
+        # BGM は裏で展開しておき、切り替え時はクロスフェードする
+        self.audio = AudioManager(self.hud.volume)
+        self.audio.preload_music({"menu": MENU_BGM, "battle": BATTLE_BGM})
+        self.audio.load_sfx(SFX_FILES)
+        # 火花・砂ぼこり・KO の演出(品質は設定画面で変えられる)
+        self.particles = ParticleSystem()
+        self.settings_menu = SettingsMenu(self.hud, self.audio, self.particles)
+        self.renderer = BattleRenderer(self.screen, DIRTY_RENDERING)
+        # 画面より広いステージで映す範囲(バトル・リプレイ・観戦で共有)
+        self.camera = Camera(WIDTH)
+
+        # フレームの区間ごとの処理時間(F3 でオーバーレイ表示、profile_out に終了時に書き出し)
+        self.profiler = FrameProfiler()
+        self.profile_out = profile_out
+        # キーを押してから画面に出るまでの時間(オーバーレイと終了時の表示用)
+        self.latency = LatencyStats()
+        # CPU 対戦なら P2 を操作する CPU(cpu は難易度の名前。リプレイ再生中は使わない)
+        self.cpu = CPUPlayer(cpu) if cpu and not replay else None
+        self.overlay = ProfilerOverlay(self.profiler, latency=self.latency, cpu=self.cpu)
+        self.show_overlay = profile
+        self.renderer.overlay = self.overlay if profile else None
+        self.profiler.set_enabled(profile or profile_out is not None)
+        self.match.profiler = self.profiler
+        self.renderer.profiler = self.profiler
+
+        # バトル画面の録画(capture は書き出し形式。F9 で始める・止める)。
+        # BattleRenderer が画面に反映する直前のフレームを渡すので、バトル・リプレイ・観戦の画面だけが入る
+        self.capture = FrameCapture(CAPTURE_DIR, capture or DEFAULT_FORMAT)
+        self.capture_on_start = capture is not None
+        self.renderer.capture = self.capture
+
+        # 観戦用の配信(broadcast は待ち受けるポート)と、観戦モードでつなぐ先 (host, port)
+        self.broadcast = None
+        if broadcast is not None:
+            server = BroadcastServer(port=broadcast)
+            try:
+                server.start()
+                self.broadcast = server
+                print(f"broadcasting on {server.host}:{server.port}")
+            except OSError as e:
+                print(f"[broadcast error] {e}")
+        self.spectate = spectate
+
+        self.scenes = SceneManager()
+        self.scenes.add(TITLE, TitleScene(self))
+        self.scenes.add(SELECT, SelectScene(self))
+        self.scenes.add(BATTLE, BattleScene(self))
+        self.scenes.add(RESULT, ResultScene(self))
+        self.scenes.add(PAUSED, PausedScene(self))
+        self.scenes.add(SETTINGS, SettingsScene(self))
+        self.scenes.add(REPLAY, ReplayScene(self))
+        self.scenes.add(SPECTATE, SpectatorScene(self))
+        self.running = True
+
+    def toggle_capture(self):
+        if self.capture.active:
+            self.capture.stop()
+        else:
+            self.capture.start(self.screen)
+
+    def toggle_overlay(self):
+        self.show_overlay = not self.show_overlay
+        # オーバーレイは画面に反映する前に重ねる(BattleRenderer.present / SceneManager.draw)
+        self.renderer.overlay = self.overlay if self.show_overlay else None
+        self.profiler.set_enabled(self.show_overlay or self.profile_out is not None)
+        self.overlay.invalidate()
+        # オーバーレイがあった場所を描き直す
+        self.renderer.invalidate()
+
+    def run(self, frames=None):
+        """
+        ゲームループ。frames を渡すとそのフレーム数で終わる(起動時間の計測などに使う)。
+        """
+        # 初期BGM(タイトル/メニュー)
+        self.audio.play_music("menu")
+        if self.spectate is not None:
+            self.scenes.switch(SPECTATE, address=self.spectate)
+        elif self.replay is not None:
+            self.scenes.switch(REPLAY, replay=self.replay, seek=self.seek)
+        else:
+            self.scenes.switch(TITLE)
+
+        if self.capture_on_start:
+            self.capture.start(self.screen)
+
+        prof = self.profiler
+        while self.running:
+            if frames is not None:
+                if frames <= 0:
+                    break
+                frames -= 1
+            prof.begin_frame()
+            dt_ms = self.clock.tick(FPS)
+            dt = min(dt_ms / 1000.0, MAX_FRAME_TIME)
+            prof.mark("wait")
+            self.audio.update()
+            prof.mark("audio")
+
+            for event in pg.event.get():
+                if event.type == pg.QUIT:
+                    self.running = False
+                if event.type == pg.KEYDOWN and event.key == PROFILER_KEY:
+                    self.toggle_overlay()
+                    continue
+                if event.type == pg.KEYDOWN and event.key == CAPTURE_KEY:
+                    self.toggle_capture()
+                    continue
+                self.scenes.handle_event(event)
+            prof.mark("events")
+
+            # ===== 描画・更新 =====
+            self.scenes.update(dt)
+            prof.mark("update")
+            self.scenes.draw(self.screen, self.renderer.overlay)
+            self.latency.presented()
+            prof.mark("draw")
+            prof.end_frame()
+
+        if self.cpu is not None:
+            self.cpu.close()
+        self.capture.stop()
+        if self.scenes.name == SPECTATE:
+            self.scenes.current.exit()
+        if self.broadcast is not None:
+            print(self.broadcast.summary())
+            self.broadcast.close()
+        if self.profile_out:
+            prof.dump(self.profile_out)
+            print(f"profile written to {self.profile_out}")
+            print(self.latency.summary())
+            if self.cpu is not None:
+                print(self.cpu.summary())
+
+
+# =====================
+# メイン処理
+# =====================
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--replay", help="記録した試合(.kkr)を再生する")
+    parser.add_argument("--seek", type=int, default=0, help="このティックまで早送りしてから再生する")
+    parser.add_argument("--profile", action="store_true", help="処理時間のオーバーレイを表示して起動する(F3 で切り替え)")
+    parser.add_argument("--profile-out", help="終了時に処理時間の記録を書き出す(.csv か Chrome トレースの .json)")
+    parser.add_argument("--p1", default=FIGHTER_CHARACTERS["P1"], help="P1 のキャラクター(characters/ の JSON の名前)")
+    parser.add_argument("--p2", default=FIGHTER_CHARACTERS["P2"], help="P2 のキャラクター")
+    parser.add_argument("--cpu", nargs="?", const="normal", choices=list(CPU_LEVELS),
+                        help="P2 を CPU にする(難易度。省略すると normal)")
+    parser.add_argument("--capture", nargs="?", const=DEFAULT_FORMAT, choices=CAPTURE_FORMATS,
+                        help="バトル画面を captures/ に録画する(ffmpeg: 動画、png: 連番 PNG。F9 で切り替え)")
+    parser.add_argument("--broadcast", nargs="?", const=BROADCAST_PORT, type=int, metavar="PORT",
+                        help=f"試合を localhost の観戦クライアントに配信する(既定のポート {BROADCAST_PORT})")
+    parser.add_argument("--spectate", nargs="?", const="", metavar="HOST:PORT",
+                        help="配信中の試合を観戦する(自分では試合を進めない)")
+    args = parser.parse_args()
+    replay = Replay.load(args.replay) if args.replay else None
+    spectate = parse_address(args.spectate) if args.spectate is not None else None
+    Game(replay, args.seek, args.profile, args.profile_out,
+         {"P1": args.p1, "P2": args.p2}, args.cpu, args.capture, args.broadcast, spectate).run()
     pg.quit()
     sys.exit()
 
@@ -0,0 +1,261 @@
+import hashlib
+import json
+import marshal
+import os
+import sys
+import time
+
+# キャラクター定義(JSON)を置く場所と、コンパイル済みの表のキャッシュ
+CHARACTER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "characters")
+MOVE_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".move_cache")
+# コンパイル結果の形式を変えたら上げる(古いキャッシュは別のファイル名になって使われない)
+MOVE_CACHE_VERSION = 1
+
+# 攻撃ボタンで出す技の名前(それ以外の技は engine.COMMAND_MOVES の名前ならコマンド入力で出る)
+PRIMARY_MOVE = "attack"
+STAT_NAMES = ("move_speed", "jump_speed", "gravity", "max_hp")
+
+# キャラクター定義の例(characters/kouka.json と同じ。engine.Rules の既定値と一致する):
+# {
+#   "name": "こうかとん",
+#   "stats": {"move_speed": 6, "jump_speed": 20, "gravity": 1, "max_hp": 100},
+#   "moves": {
+#     "attack": {"startup": 0, "active": 1, "recovery": 0, "damage": 5,
+#                "projectile": {"speed": 12, "life": 30, "size": [40, 20]}}
+#   }
+# }
+# startup / active / recovery: 発生・持続・硬直のティック数。飛び道具は持続の最初のティックに出る
+# hitbox: [前方向のずれ, 上からのずれ, 幅, 高さ]。持続中だけファイターの前に出る攻撃判定
+# lock: true なら技の間は移動・ジャンプできない
+
+
+# =====================
+# コンパイル済みの技
+# =====================
+class MoveTable:
+    """
+    1つの技をティックごとの表にしたもの。試合中は move_frame 番目の要素を引くだけで、
+    辞書や分岐で定義を解釈しない。
+    spawn[i]: i ティック目に飛び道具を出すか / hitbox[i]: i ティック目の攻撃判定(無ければ None)
+    lock[i]: i ティック目は移動できないか
+    """
+    __slots__ = ("name", "index", "frames", "damage", "projectile", "spawn", "hitbox", "lock")
+
+    def __init__(self, name, index, frames, damage, projectile, spawn, hitbox, lock):
+        self.name = name
+        self.index = index
+        self.frames = frames
+        self.damage = damage
+        self.projectile = projectile     # (速さ, 寿命, 幅, 高さ) か None
+        self.spawn = spawn
+        self.hitbox = hitbox
+        self.lock = lock
+
+    def to_tuple(self):
+        return (self.name, self.frames, self.damage, self.projectile,
+                self.spawn, self.hitbox, self.lock)
+
+
+class Character:
+    """
+    キャラクター1人分の能力値とコンパイル済みの技。
+    moves[i] は MoveTable(i は試合状態のスナップショットに保存する技の番号)。
+    source: 元の定義(JSON のバイト列。リプレイに埋め込んで同じキャラクターを再現する)。
+    Rules から作ったものは source が None。
+    """
+    def __init__(self, name, stats, moves, source=None):
+        self.name = name
+        self.move_speed, self.jump_speed, self.gravity, self.max_hp = stats
+        self.moves = [MoveTable(m[0], i, *m[1:]) for i, m in enumerate(moves)]
+        self.by_name = {m.name: m for m in self.moves}
+        self.attack = self.by_name[PRIMARY_MOVE]
+        self.source = source
+
+    @property
+    def projectile_life(self):
+        """
+        飛び道具の寿命の最大値(飛び道具の技が無ければ 0)。同時に出ていられる数の上限になる。
+        """
+        return max((m.projectile[1] for m in self.moves if m.projectile is not None), default=0)
+
+    def to_tuple(self):
+        return (self.name, (self.move_speed, self.jump_speed, self.gravity, self.max_hp),
+                [m.to_tuple() for m in self.moves])
+
+
+# =====================
+# コンパイル
+# =====================
+def _int(value, what, minimum=0):
+    if not isinstance(value, int) or isinstance(value, bool) or value < minimum:
+        raise ValueError(f"{what} must be an integer >= {minimum}")
+    return value
+
+
+def compile_move(name, spec):
+    """
+    技の定義(dict)を MoveTable の中身のタプルにする。
+    """
+    what = f"move {name!r}"
+    startup = _int(spec.get("startup", 0), f"{what}: startup")
+    active = _int(spec.get("active", 1), f"{what}: active", 1)
+    recovery = _int(spec.get("recovery", 0), f"{what}: recovery")
+    damage = _int(spec.get("damage", 0), f"{what}: damage")
+    frames = startup + active + recovery
+
+    projectile = None
+    if "projectile" in spec:
+        p = spec["projectile"]
+        w, h = p.get("size", (40, 20))
+        projectile = (_int(p.get("speed", 12), f"{what}: projectile speed"),
+                      _int(p.get("life", 30), f"{what}: projectile life", 1),
+                      _int(w, f"{what}: projectile width", 1),
+                      _int(h, f"{what}: projectile height", 1))
+    box = None
+    if "hitbox" in spec:
+        dx, dy, w, h = spec["hitbox"]
+        box = (_int(dx, f"{what}: hitbox x", -1000), _int(dy, f"{what}: hitbox y", -1000),
+               _int(w, f"{what}: hitbox width", 1), _int(h, f"{what}: hitbox height", 1))
+    if projectile is None and box is None:
+        raise ValueError(f"{what} needs a projectile or a hitbox")
+    locked = 1 if spec.get("lock", False) else 0
+
+    spawn = bytes(1 if projectile is not None and i == startup else 0 for i in range(frames))
+    hitbox = tuple(box if startup <= i < startup + active else None for i in range(frames))
+    lock = bytes([locked]) * frames
+    return (name, frames, damage, projectile, spawn, hitbox, lock)
+
+
+def compile_character(data):
+    """
+    キャラクター定義(dict)を Character.to_tuple() と同じ形のタプルにする。
+    """
+    stats = data.get("stats", {})
+    values = tuple(_int(stats[s], f"stats: {s}", 1 if s == "max_hp" else 0) for s in STAT_NAMES)
+    moves = data.get("moves", {})
+    if PRIMARY_MOVE not in moves:
+        raise ValueError(f"moves must define {PRIMARY_MOVE!r}")
+    # 攻撃ボタンの技を 0 番にし、残りは名前順(番号がファイルの書き方で変わらないように)
+    names = [PRIMARY_MOVE] + sorted(n for n in moves if n != PRIMARY_MOVE)
+    return (str(data.get("name", "")), values, [compile_move(n, moves[n]) for n in names])
+
+
+_from_rules = {}
+
+
+def character_from_rules(rules):
+    """
+    engine.Rules の数値そのままのキャラクター(攻撃は発生 0・持続 1 の飛び道具)。
+    """
+    key = (rules.move_speed, rules.jump_speed, rules.gravity, rules.max_hp,
+           rules.attack_speed, rules.attack_life, tuple(rules.attack_size), rules.damage)
+    character = _from_rules.get(key)
+    if character is None:
+        w, h = rules.attack_size
+        move = compile_move(PRIMARY_MOVE, {
+            "startup": 0, "active": 1, "recovery": 0, "damage": rules.damage,
+            "projectile": {"speed": rules.attack_speed, "life": max(1, rules.attack_life),
+                           "size": [w, h]}})
+        character = Character("", key[:4], [move])
+        _from_rules[key] = character
+    return character
+
+
+# =====================
+# 読み込み(ファイルのハッシュをキーにしたキャッシュ付き)
+# =====================
+_loaded = {}
+
+
+def cache_path(digest, cache_dir=MOVE_CACHE_DIR):
+    return os.path.join(cache_dir, f"{digest}.bin")
+
+
+def character_from_source(source, cache_dir=MOVE_CACHE_DIR, name="<source>"):
+    """
+    JSON のバイト列からキャラクターを作る。同じ内容はメモリ → ディスクのキャッシュから返し、
+    どちらにも無いときだけ JSON を解釈してコンパイルする。
+    """
+    digest = hashlib.sha1(b"%d|" % MOVE_CACHE_VERSION + source).hexdigest()
+    character = _loaded.get(digest)
+    if character is not None:
+        return character
+
+    compiled = None
+    path = cache_path(digest, cache_dir)
+    try:
+        with open(path, "rb") as f:
+            compiled = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        compiled = None
+    if compiled is None:
+        try:
+            compiled = compile_character(json.loads(source))
+        except (ValueError, KeyError, TypeError) as e:
+            raise ValueError(f"{name}: {e}") from None
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                marshal.dump(compiled, f)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"[move cache error] {name} : {e}")
+
+    character = Character(*compiled, source=source)
+    _loaded[digest] = character
+    return character
+
+
+def load_character(path, cache_dir=MOVE_CACHE_DIR):
+    """
+    キャラクター定義ファイルを読み込む(中身が同じなら2回目以降は解釈・コンパイルしない)。
+    """
+    with open(path, "rb") as f:
+        return character_from_source(f.read(), cache_dir, os.path.basename(path))
+
+
+def character_path(name):
+    return os.path.join(CHARACTER_DIR, f"{name}.json")
+
+
+# =====================
+# 実行(コンパイルとキャッシュからの読み込みの速さ)
+# =====================
+if __name__ == "__main__":
+    import tempfile
+
+    # 使い方: python moves.py [キャラクター数]
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    for name in sorted(os.listdir(CHARACTER_DIR)):
+        c = load_character(os.path.join(CHARACTER_DIR, name))
+        print(f"{name}: {c.name} hp {c.max_hp}, moves "
+              + ", ".join(f"{m.name}({m.frames}f, {m.damage}dmg)" for m in c.moves))
+
+    # 名前だけ違う count 人分の定義を、キャッシュなし → ディスクキャッシュ → メモリの順に読む
+    with open(character_path("kouka"), "rb") as f:
+        base = json.loads(f.read())
+    sources = []
+    for i in range(count):
+        base["name"] = f"roster {i}"
+        sources.append(json.dumps(base).encode())
+    with tempfile.TemporaryDirectory() as tmp:
+        for label in ("compile", "disk cache", "memory"):
+            if label == "disk cache":
+                _loaded.clear()
+            start = time.perf_counter()
+            for src in sources:
+                character_from_source(src, tmp)
+            print(f"{label:>10}: {(time.perf_counter() - start) / count * 1e6:.1f} us per character")
+
+    # 寿命の長い飛び道具も、撃った数だけ同時に出ていられる(rules.attack_life で切り詰められない)
+    from engine import IN_ATTACK, new_match
+    base["moves"] = {PRIMARY_MOVE: {"startup": 0, "active": 1, "recovery": 0, "damage": 0,
+                                    "projectile": {"speed": 1, "life": 120, "size": [10, 10]}}}
+    shooter = character_from_source(json.dumps(base).encode(), name="long life")
+    match = new_match(characters=(shooter, None))
+    for _ in range(100):
+        match.step(IN_ATTACK, 0)
+    live = sum(atk.owner is match.p1 for atk in match.attacks)
+    print(f"long-life projectile: {live} live after 100 shots (cap {match.pool.per_fighter})")
+    assert live == 100, "projectiles were capped below their life"
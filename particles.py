@@ -0,0 +1,251 @@
+import pygame as pg
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:  # NumPy が無ければパーティクルは出さない(ゲームはそのまま動く)
+    np = None
+
+# 同時に出しておけるパーティクルの上限(品質 High のとき)。超えたら古いものから使い回す
+PARTICLE_BUDGET = 2048
+# 品質設定: (表示名, 上限に掛ける割合)。設定画面で切り替える
+PARTICLE_QUALITY = (("Off", 0.0), ("Low", 0.25), ("Medium", 0.5), ("High", 1.0))
+DEFAULT_QUALITY = 3
+# パーティクルは描画フレームに関係なくこの速さで進める
+PARTICLE_HZ = 60
+# 寿命に応じて小さくなる段階の数(段階ごとに画像を作っておく)
+PARTICLE_STAGES = 4
+
+# 種類ごとの見た目と動き: 色, 最大半径, 重力, 減速率, 寿命(ティック), 速さ, 飛ぶ向き(度), 広がり(度)
+PARTICLE_KINDS = {
+    "spark": ((255, 230, 120), 4, 0.3, 0.90, 18, 7.0, -90, 360),
+    "dust": ((190, 170, 140), 6, -0.05, 0.85, 24, 2.5, -90, 160),
+    "ko": ((255, 120, 40), 7, 0.15, 0.95, 50, 10.0, -90, 360),
+}
+# 1回に出す数(品質の割合を掛ける)
+HIT_SPARKS = 24
+LANDING_DUST = 12
+KO_BURST = 300
+
+
+def particle_sprites(kinds=PARTICLE_KINDS, stages=PARTICLE_STAGES):
+    """
+    種類 × 段階ごとの画像と、中心に合わせるためのずらし幅。段階 0 が一番小さい。
+    """
+    sprites = []
+    offsets = []
+    convert = pg.display.get_surface() is not None
+    for color, radius, *_ in kinds.values():
+        for stage in range(stages):
+            r = max(1, round(radius * (stage + 1) / stages))
+            surf = pg.Surface((2 * r, 2 * r))
+            surf.fill((0, 0, 0))
+            pg.draw.circle(surf, color, (r, r), r)
+            if convert:
+                surf = surf.convert()
+            surf.set_colorkey((0, 0, 0), pg.RLEACCEL)
+            sprites.append(surf)
+            offsets.append(r)
+    return sprites, offsets
+
+
+# =====================
+# パーティクル
+# =====================
+class ParticleSystem:
+    """
+    火花・着地の砂ぼこり・KO の爆発などのパーティクル。
+    位置・速度・寿命・種類を NumPy の配列で持ち、更新は配列演算でまとめて行う。
+    配列は上限(budget)の長さで確保したリングで、出すたびに次の枠へ書くので、
+    上限を超えると一番古いものから上書きされる。
+    描画は寿命の段階ごとに作っておいた画像を Surface.blits() でまとめて描く。
+    """
+    def __init__(self, budget=PARTICLE_BUDGET, quality=DEFAULT_QUALITY, seed=None):
+        self.max_budget = budget
+        self.kind_names = list(PARTICLE_KINDS)
+        self.kind_index = {name: i for i, name in enumerate(self.kind_names)}
+        self.params = list(PARTICLE_KINDS.values())
+        self.sprites = None
+        self.offsets = None
+        self.rng = np.random.default_rng(seed) if np is not None else None
+        self.accumulator = 0.0
+
+        # 統計
+        self.emitted = 0
+        self.recycled = 0
+        self.peak = 0
+        self.set_quality(quality)
+
+    def set_quality(self, quality):
+        """
+        品質(PARTICLE_QUALITY の番号)を変える。配列を作り直すので今出ているものは消える。
+        """
+        self.quality = quality
+        self.scale = PARTICLE_QUALITY[quality][1] if np is not None else 0.0
+        self.budget = int(self.max_budget * self.scale)
+        n = self.budget
+        if np is not None:
+            self.pos = np.zeros((n, 2), np.float32)
+            self.vel = np.zeros((n, 2), np.float32)
+            self.life = np.zeros(n, np.int16)
+            self.max_life = np.ones(n, np.int16)
+            self.kind = np.zeros(n, np.uint8)
+            self.gravity = np.array([p[2] for p in self.params], np.float32)
+            self.drag = np.array([p[3] for p in self.params], np.float32)
+        self.next = 0
+        self.live = 0
+
+    @property
+    def quality_name(self):
+        return PARTICLE_QUALITY[self.quality][0]
+
+    def emit(self, kind, pos, count):
+        """
+        pos を中心に kind のパーティクルを count 個(品質の割合を掛けた数)出す。
+        """
+        if not self.budget:
+            return
+        count = min(self.budget, max(1, round(count * self.scale)))
+        k = self.kind_index[kind]
+        _, _, _, _, life, speed, angle, spread = self.params[k]
+        slots = (self.next + np.arange(count)) % self.budget
+        self.next = (self.next + count) % self.budget
+        self.recycled += int(np.count_nonzero(self.life[slots] > 0))
+
+        rng = self.rng
+        theta = np.radians(angle + (rng.random(count, np.float32) - 0.5) * spread)
+        v = speed * (0.4 + 0.6 * rng.random(count, np.float32))
+        self.pos[slots] = pos
+        self.vel[slots, 0] = np.cos(theta) * v
+        self.vel[slots, 1] = np.sin(theta) * v
+        lives = (life * (0.6 + 0.4 * rng.random(count))).astype(np.int16) + 1
+        self.life[slots] = lives
+        self.max_life[slots] = lives
+        self.kind[slots] = k
+        self.emitted += count
+        self.live = min(self.budget, self.live + count)
+        self.peak = max(self.peak, self.live)
+
+    def hit(self, pos):
+        self.emit("spark", pos, HIT_SPARKS)
+
+    def dust(self, pos):
+        self.emit("dust", pos, LANDING_DUST)
+
+    def burst(self, pos):
+        self.emit("ko", pos, KO_BURST)
+
+    def step(self):
+        """
+        1ティック分まとめて動かす。
+        """
+        if not self.live:
+            return
+        alive = self.life > 0
+        self.vel *= self.drag[self.kind][:, None]
+        self.vel[:, 1] += self.gravity[self.kind]
+        self.pos += self.vel
+        self.life -= alive
+        self.live = int(np.count_nonzero(self.life))
+
+    def update(self, dt):
+        """
+        経過時間 dt(秒)ぶん PARTICLE_HZ のティックで進める。
+        """
+        if not self.live:
+            self.accumulator = 0.0
+            return
+        self.accumulator += dt
+        while self.accumulator >= 1 / PARTICLE_HZ:
+            self.accumulator -= 1 / PARTICLE_HZ
+            self.step()
+
+    def batch(self, dx=0, width=None):
+        """
+        描画する (画像, 位置) のリストと、全体を囲む Rect(無ければ ([], None))。
+        dx: カメラの左端(位置から引く) / width: 画面の幅(与えると画面の外の粒は除く)
+        """
+        if not self.live:
+            return [], None
+        if self.sprites is None:
+            self.sprites, offsets = particle_sprites()
+            self.offsets = np.array(offsets, np.int32)
+        idx = np.flatnonzero(self.life)
+        life = self.life[idx].astype(np.int32)
+        stage = (life * PARTICLE_STAGES - 1) // self.max_life[idx]
+        sprite = self.kind[idx].astype(np.int32) * PARTICLE_STAGES + stage
+        off = self.offsets[sprite]
+        x = self.pos[idx, 0].astype(np.int32) - off - dx
+        y = self.pos[idx, 1].astype(np.int32) - off
+        if width is not None:
+            keep = (x + 2 * off > 0) & (x < width)
+            if not keep.all():
+                if not keep.any():
+                    return [], None
+                sprite, off, x, y = sprite[keep], off[keep], x[keep], y[keep]
+        sprites = self.sprites
+        seq = [(sprites[s], (px, py)) for s, px, py in zip(sprite.tolist(), x.tolist(), y.tolist())]
+        size = 2 * int(off.max())
+        left, top = int(x.min()), int(y.min())
+        return seq, pg.Rect(left, top, int(x.max()) - left + size, int(y.max()) - top + size)
+
+    def draw(self, surface, dx=0):
+        """
+        生きているパーティクルをまとめて描き、描いた範囲を囲む Rect を返す(無ければ None)。
+        dx: カメラの左端(ステージ上の位置から引いて surface 上の位置にする)
+        """
+        seq, rect = self.batch(dx, surface.get_width())
+        if seq:
+            surface.blits(seq, False)
+        return rect
+
+    def clear(self):
+        if self.budget:
+            self.life[:] = 0
+        self.live = 0
+
+    def stats(self):
+        return {"live": self.live, "peak": self.peak, "budget": self.budget,
+                "emitted": self.emitted, "recycled": self.recycled,
+                "quality": self.quality_name}
+
+
+# =====================
+# 実行(生きている数ごとの更新・描画のコスト)
+# =====================
+if __name__ == "__main__":
+    import os
+
+    # 使い方: python particles.py [繰り返し回数]
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    if np is None:
+        print("NumPy が無いのでパーティクルは無効")
+        sys.exit()
+    pg.display.init()
+    screen = pg.display.set_mode((1000, 600))
+    print(f"{'live':>6} {'step us':>10} {'draw us':>10}")
+    for n in (100, 500, 1000, 2048):
+        ps = ParticleSystem(seed=0)
+        for i in range(n // 64):
+            ps.emit("ko", (100 + i * 30, 300), 64)
+        # 計測中に消えないよう寿命を延ばす
+        ps.life[:ps.live] = 10000
+        ps.max_life[:ps.live] = 10000
+        start = time.perf_counter()
+        for _ in range(repeat):
+            ps.step()
+        step_us = (time.perf_counter() - start) / repeat * 1e6
+        ps.pos[:, 0] = np.linspace(0, 990, ps.budget)
+        ps.pos[:, 1] = 300
+        start = time.perf_counter()
+        for _ in range(repeat):
+            ps.draw(screen)
+        draw_us = (time.perf_counter() - start) / repeat * 1e6
+        print(f"{ps.live:>6} {step_us:>10.1f} {draw_us:>10.1f}")
+
+    ps = ParticleSystem(budget=256, seed=0)
+    for _ in range(10):
+        ps.burst((500, 300))
+    print(ps.stats())
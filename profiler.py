@@ -0,0 +1,290 @@
+import pygame as pg
+import json
+import time
+from array import array
+
+from fonts import get_font
+
+# 計測する区間(フレームの中での大まかな順番)
+PHASES = ("wait", "audio", "events", "update", "sim", "collision",
+          "draw", "background", "sprites", "hud", "present", "capture", "overlay")
+# 待ち時間(clock.tick)は処理時間に含めない
+IDLE_PHASES = ("wait",)
+# 何フレーム分の記録を残すか
+PROFILE_FRAMES = 600
+# オーバーレイを描き直す間隔(フレーム)。毎フレーム文字を描くと計測結果に響くので間引く
+OVERLAY_REFRESH = 15
+OVERLAY_SIZE = (330, 282)
+
+
+# =====================
+# フレームプロファイラ
+# =====================
+class FrameProfiler:
+    """
+    1フレームを区間(PHASES)に分けて所要時間を測り、直近 size フレーム分をリングバッファに残す。
+    begin_frame() → mark(区間名) を区間の終わりごとに呼ぶ → end_frame()。
+    mark() は前回の mark() からの経過時間をその区間に足す(1フレームに何回呼んでもよい)。
+    無効のときは何も測らず、`if profiler:` が False になる(呼び出し側はこれで分岐を省ける)。
+    """
+    def __init__(self, phases=PHASES, size=PROFILE_FRAMES):
+        self.phases = phases
+        self.size = size
+        self.index = {name: i for i, name in enumerate(phases)}
+        self.samples = [array("d", bytes(8 * size)) for _ in phases]
+        self.totals = array("d", bytes(8 * size))
+        self.work = array("d", bytes(8 * size))
+        self.starts = array("d", bytes(8 * size))
+        self.idle = [self.index[p] for p in IDLE_PHASES if p in self.index]
+        self.current = [0.0] * len(phases)
+        self.count = 0
+        self.enabled = False
+        self.want = False
+        self.origin = time.perf_counter()
+        self.frame_start = 0.0
+        self.last = 0.0
+
+    def __bool__(self):
+        return self.enabled
+
+    def set_enabled(self, on):
+        """
+        計測の有効/無効を切り替える(次の begin_frame() から反映)。
+        """
+        self.want = on
+
+    def begin_frame(self):
+        self.enabled = self.want
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.frame_start = now
+        self.last = now
+        current = self.current
+        for i in range(len(current)):
+            current[i] = 0.0
+
+    def mark(self, phase):
+        """
+        前回の mark() からここまでを phase の時間として足す。
+        """
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.current[self.index[phase]] += now - self.last
+        self.last = now
+
+    def end_frame(self):
+        if not self.enabled:
+            return
+        slot = self.count % self.size
+        total = time.perf_counter() - self.frame_start
+        current = self.current
+        for i, value in enumerate(current):
+            self.samples[i][slot] = value
+        self.totals[slot] = total
+        self.work[slot] = total - sum(current[i] for i in self.idle)
+        self.starts[slot] = self.frame_start - self.origin
+        self.count += 1
+
+    def frames(self):
+        """
+        残っているフレームのスロット番号(古い順)。
+        """
+        n = min(self.count, self.size)
+        first = self.count - n
+        return [(first + i) % self.size for i in range(n)]
+
+    def percentiles(self, qs=(50, 95, 99)):
+        """
+        処理時間(待ち時間を除く)のパーセンタイル(秒)。
+        """
+        values = sorted(self.work[s] for s in self.frames())
+        if not values:
+            return [0.0 for _ in qs]
+        return [values[min(len(values) - 1, int(len(values) * q / 100))] for q in qs]
+
+    def averages(self):
+        """
+        区間ごとの平均時間(秒)。
+        """
+        slots = self.frames()
+        if not slots:
+            return {name: 0.0 for name in self.phases}
+        return {name: sum(self.samples[i][s] for s in slots) / len(slots)
+                for i, name in enumerate(self.phases)}
+
+    def worst(self, n=5):
+        """
+        処理時間が長かったフレーム [(フレーム番号, 秒, 一番長かった区間, その秒), ...]。
+        """
+        base = self.count - min(self.count, self.size)
+        slots = self.frames()
+        order = sorted(range(len(slots)), key=lambda i: self.work[slots[i]], reverse=True)[:n]
+        result = []
+        for i in order:
+            s = slots[i]
+            phase = max((p for p in range(len(self.phases)) if p not in self.idle),
+                        key=lambda p: self.samples[p][s])
+            result.append((base + i, self.work[s], self.phases[phase], self.samples[phase][s]))
+        return result
+
+    def dump(self, path):
+        """
+        記録を書き出す。拡張子が .json なら Chrome のトレース形式(chrome://tracing, Perfetto)、
+        それ以外は CSV。
+        """
+        if path.endswith(".json"):
+            self.dump_chrome(path)
+        else:
+            self.dump_csv(path)
+
+    def dump_csv(self, path):
+        base = self.count - min(self.count, self.size)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(",".join(("frame", "start_ms", "total_ms", "work_ms")
+                             + tuple(f"{p}_ms" for p in self.phases)) + "\n")
+            for i, s in enumerate(self.frames()):
+                row = [str(base + i), f"{self.starts[s] * 1e3:.3f}",
+                       f"{self.totals[s] * 1e3:.3f}", f"{self.work[s] * 1e3:.3f}"]
+                row.extend(f"{self.samples[p][s] * 1e3:.3f}" for p in range(len(self.phases)))
+                f.write(",".join(row) + "\n")
+
+    def dump_chrome(self, path):
+        """
+        区間はフレームの中で合計した時間なので、フレームの先頭から順に並べて出力する。
+        """
+        events = []
+        base = self.count - min(self.count, self.size)
+        for i, s in enumerate(self.frames()):
+            ts = self.starts[s] * 1e6
+            events.append({"name": f"frame {base + i}", "ph": "X", "pid": 1, "tid": 1,
+                           "ts": ts, "dur": self.totals[s] * 1e6})
+            for p, name in enumerate(self.phases):
+                dur = self.samples[p][s] * 1e6
+                if dur > 0:
+                    events.append({"name": name, "ph": "X", "pid": 1, "tid": 2,
+                                   "ts": ts, "dur": dur})
+                    ts += dur
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+# =====================
+# 画面表示
+# =====================
+class ProfilerOverlay:
+    """
+    フレーム時間のグラフ・パーセンタイル・区間ごとの平均・重かったフレームを画面の右上に重ねる。
+    latency(inputs.LatencyStats)を渡すと入力遅延のパーセンタイルも、
+    cpu(cpu.CPUPlayer)を渡すと CPU の思考時間と読めた深さも出す。
+    パネルは OVERLAY_REFRESH フレームごとに作り直し、それ以外は同じものを blit するだけ。
+    """
+    def __init__(self, profiler, pos=(None, 50), budget=1 / 60, latency=None, cpu=None):
+        self.profiler = profiler
+        self.latency = latency
+        self.cpu = cpu
+        self.pos = pos
+        self.budget = budget
+        self.font = get_font(None, 20)
+        self.panel = None
+        self.age = 0
+
+    def build(self):
+        prof = self.profiler
+        w, h = OVERLAY_SIZE
+        panel = pg.Surface((w, h))
+        panel.fill((20, 20, 20))
+        font = self.font
+        y = 4
+
+        def line(text, color=(230, 230, 230), value=None):
+            nonlocal y
+            panel.blit(font.render(text, True, color), (6, y))
+            if value is not None:
+                surf = font.render(value, True, color)
+                panel.blit(surf, (150 - surf.get_width(), y))
+            y += 16
+
+        p50, p95, p99 = (v * 1e3 for v in prof.percentiles())
+        line(f"work ms  p50 {p50:.2f}  p95 {p95:.2f}  p99 {p99:.2f}", (255, 255, 0))
+        if self.latency is not None:
+            p50, p95, p99 = (v * 1e3 for v in self.latency.percentiles())
+            line(f"input ms p50 {p50:.1f}  p95 {p95:.1f}  p99 {p99:.1f}", (120, 220, 255))
+        if self.cpu is not None:
+            p50, p95, _ = (v * 1e3 for v in self.cpu.percentiles())
+            line(f"cpu ms   p50 {p50:.1f}  p95 {p95:.1f}  depth {self.cpu.mean_depth():.1f}",
+                 (255, 160, 220))
+
+        # フレームごとの処理時間のグラフ(横線は1フレームの予算)
+        graph = pg.Rect(6, y + 2, w - 12, 60)
+        pg.draw.rect(panel, (45, 45, 45), graph)
+        scale = graph.height / (2 * self.budget)
+        budget_y = graph.bottom - int(self.budget * scale)
+        pg.draw.line(panel, (90, 90, 160), (graph.left, budget_y), (graph.right - 1, budget_y))
+        slots = prof.frames()[-graph.width:]
+        x = graph.right - len(slots)
+        for s in slots:
+            value = prof.work[s]
+            top = max(graph.top, graph.bottom - int(value * scale))
+            color = (220, 80, 80) if value > self.budget else (90, 200, 90)
+            pg.draw.line(panel, color, (x, graph.bottom - 1), (x, top))
+            x += 1
+        y = graph.bottom + 4
+
+        # 区間ごとの平均(長い順)
+        averages = prof.averages()
+        busy = sorted(((t, name) for name, t in averages.items() if name not in IDLE_PHASES),
+                      reverse=True)[:6]
+        for t, name in busy:
+            line(name, value=f"{t * 1e3:.2f} ms")
+
+        line("worst frames", (255, 200, 120))
+        for frame, t, phase, pt in prof.worst(3):
+            line(f"#{frame}  {t * 1e3:.2f} ms  ({phase} {pt * 1e3:.2f})")
+        return panel
+
+    def draw(self, surface):
+        """
+        パネルを描いて、描いた範囲の Rect を返す。
+        """
+        if self.panel is None or self.age >= OVERLAY_REFRESH:
+            self.panel = self.build()
+            self.age = 0
+        self.age += 1
+        return surface.blit(self.panel, self.rect(surface))
+
+    def rect(self, surface):
+        """
+        パネルを描く範囲(描く前に下の画素を取っておくのに使う)。
+        """
+        x, y = self.pos
+        if x is None:
+            x = surface.get_width() - OVERLAY_SIZE[0] - 10
+        return pg.Rect((x, y), OVERLAY_SIZE)
+
+    def invalidate(self):
+        self.panel = None
+
+
+def overhead(enabled=False, n=100000):
+    """
+    begin_frame/mark × 8/end_frame 1フレーム分のコスト(秒)。
+    """
+    prof = FrameProfiler()
+    prof.set_enabled(enabled)
+    start = time.perf_counter()
+    for _ in range(n):
+        prof.begin_frame()
+        for name in PHASES[:8]:
+            prof.mark(name)
+        prof.end_frame()
+    return (time.perf_counter() - start) / n
+
+
+# =====================
+# 実行(計測そのもののコスト)
+# =====================
+if __name__ == "__main__":
+    print(f"disabled: {overhead(False) * 1e6:.2f}us per frame")
+    print(f"enabled:  {overhead(True) * 1e6:.2f}us per frame")
@@ -0,0 +1,300 @@
+import pygame as pg
+
+
+# =====================
+# 描画ユーティリティ
+# =====================
+def lerp_pos(sprite, alpha, dx=0):
+    """
+    前ティックと現ティックの位置を alpha(0.0〜1.0) で補間した描画座標を返す。
+    dx: カメラの左端(ステージ上の座標から引いて画面上の座標にする)
+    """
+    px, py = sprite.prev_pos
+    x, y = sprite.rect.topleft
+    return (round(px + (x - px) * alpha) - dx, round(py + (y - py) * alpha))
+
+
+def draw_interpolated(surface, group, alpha, dx=0):
+    """
+    グループ内のスプライトを補間位置に描画する(シミュレーション上の rect は変更しない)。
+    描画した矩形のリストを返す。
+    """
+    return [surface.blit(spr.image, lerp_pos(spr, alpha, dx)) for spr in group]
+
+
+def draw_overlay(screen, overlay):
+    """
+    overlay(rect(surface) と draw(surface) を持つもの)を重ね、(範囲, 下にあった画素) を返す。
+    画面に反映したら restore_overlay() で screen を重ねる前に戻す(screen.copy() で作る
+    ポーズ画面や結果画面の背景にオーバーレイが映り込まないように)。
+    """
+    area = overlay.rect(screen).clip(screen.get_rect())
+    under = screen.subsurface(area).copy()
+    overlay.draw(screen)
+    return area, under
+
+
+def restore_overlay(screen, saved):
+    area, under = saved
+    screen.blit(under, area)
+
+
+# =====================
+# カメラ(画面より広いステージの横スクロール)
+# =====================
+# カメラを動かさずに済むよう、ファイターと画面の端の間に残す余白
+CAMERA_MARGIN = 120
+
+
+class Camera:
+    """
+    ステージ上で画面に映す範囲の左端 x を決める。両ファイターが余白(CAMERA_MARGIN)付きで
+    映っている間は動かさず、はみ出しそうなときだけ最小限ずらす(止まっている間は差分描画が効く)。
+    余白付きで収まらないほど離れたら中点に合わせ、ステージの端より外は映さない。
+    """
+    def __init__(self, view_width, stage_width=None):
+        self.view_width = view_width
+        self.x = 0
+        self.set_stage(stage_width)
+
+    def set_stage(self, stage_width):
+        """
+        ステージの横幅を変える(None なら画面と同じ幅で、カメラは動かない)。
+        """
+        self.stage_width = stage_width or self.view_width
+        self.x = 0
+
+    def follow(self, fighters, alpha=1.0, snap=False):
+        """
+        fighters(の補間位置)が映るように x を更新して返す。snap なら余白を無視して中点に合わせる。
+        """
+        limit = self.stage_width - self.view_width
+        if limit <= 0:
+            self.x = 0
+            return 0
+        xs = [lerp_pos(f, alpha)[0] for f in fighters]
+        left = min(xs)
+        right = max(x + f.rect.width for x, f in zip(xs, fighters))
+        lo = right + CAMERA_MARGIN - self.view_width
+        hi = left - CAMERA_MARGIN
+        x = self.x
+        if snap or lo > hi:
+            x = (left + right - self.view_width) // 2
+        elif x < lo:
+            x = lo
+        elif x > hi:
+            x = hi
+        self.x = min(max(x, 0), limit)
+        return self.x
+
+    def view(self, height):
+        """
+        ステージ上で今映している範囲の Rect。
+        """
+        return pg.Rect(self.x, 0, self.view_width, height)
+
+
+# =====================
+# バトル画面の描画(差分矩形 / 全画面)
+# =====================
+class BattleRenderer:
+    """
+    バトル画面を描画して画面に反映する。
+    dirty=True のときは前フレームから変化した矩形(動いたスプライト、表示が変わった HUD)
+    だけ背景を塗り直して pg.display.update(rects) に渡す。
+    dirty=False のときは従来どおり毎フレーム全画面を描き直す。
+    背景は画面より広くてもよく、camera(Camera)が映している範囲だけを blit の area で切り出して描く
+    (背景全体の拡大・複製はしない)。画面の外のスプライトは描かない。
+    """
+    def __init__(self, screen, dirty=True):
+        self.screen = screen
+        self.dirty = dirty
+        # 区間ごとの時間計測(profiler.FrameProfiler。None なら測らない)
+        self.profiler = None
+        # 画面に反映する直前のフレームを渡す録画(capture.FrameCapture。None なら録画しない)
+        self.capture = None
+        # 画面に反映する直前に重ねるオーバーレイ(draw(surface) -> Rect を持つもの。None なら重ねない)
+        self.overlay = None
+        self.invalidate()
+
+    def invalidate(self):
+        """
+        次のフレームを全画面で描き直す(ステージ変更・ポーズ復帰など画面全体が変わったとき)。
+        """
+        self.full = True
+        self.drawn = {}
+        self.hud_key = None
+        self.particle_rect = None
+        self.camera_x = None
+
+    def draw(self, bg, groups, alpha, hud, p1_keys_text, p2_keys_text, particles=None, camera=None):
+        """
+        背景・スプライト・HUD を描画して画面を更新する。
+        groups: 描画順に並べたスプライトグループ
+        particles: スプライトの上に重ねる particles.ParticleSystem(差分描画では全体を囲む矩形で扱う)
+        camera: ステージ上の映す位置(Camera)。None なら背景の左端から映す
+        """
+        screen = self.screen
+        prof = self.profiler
+        hud_key = hud.state_key()
+        cx = camera.x if camera is not None else 0
+        view = screen.get_rect()
+
+        # 映す範囲の背景(area で切り出すだけなので、背景が何画面分あってもコストは同じ)
+        back = view.move(cx, 0)
+        # 今回スプライトを描く矩形(補間位置。画面に入らないものは除く)
+        placed = []
+        for group in groups:
+            items = []
+            for spr in group:
+                r = spr.image.get_rect(topleft=lerp_pos(spr, alpha, cx))
+                if r.colliderect(view):
+                    items.append((spr, r))
+            placed.append(items)
+        particle_seq, particle_rect = (particles.batch(cx, view.width) if particles is not None
+                                       else ([], None))
+
+        # カメラが動いたら画面全体がずれるので全画面で描き直す
+        if not self.dirty or self.full or cx != self.camera_x:
+            screen.blit(bg, (0, 0), back)
+            if prof:
+                prof.mark("background")
+            drawn = {}
+            for items in placed:
+                for spr, r in items:
+                    drawn[spr] = screen.blit(spr.image, r)
+            if particle_seq:
+                screen.blits(particle_seq, False)
+            self.particle_rect = particle_rect
+            if prof:
+                prof.mark("sprites")
+            hud.draw_top(screen)
+            hud.draw_bottom_controls(screen, p1_keys_text, p2_keys_text)
+            if prof:
+                prof.mark("hud")
+            self.present()
+            self.drawn = drawn
+            self.hud_key = hud_key
+            self.full = False
+            self.camera_x = cx
+            return
+
+        dirty = list(self.drawn.values())
+        for items in placed:
+            dirty.extend(r for _, r in items)
+
+        # 前フレームでスプライト・パーティクルがあった場所を背景で塗りつぶす
+        # (スプライトは毎フレームすべて描き直すので、広めに塗っても消えたままにはならない)
+        for r in self.drawn.values():
+            screen.blit(bg, r, r.move(cx, 0))
+        if self.particle_rect is not None:
+            r = self.particle_rect.clip(view)
+            screen.blit(bg, r, r.move(cx, 0))
+            dirty.append(r)
+        if particle_rect is not None:
+            particle_rect = particle_rect.clip(view)
+            dirty.append(particle_rect)
+
+        # HUD の表示が変わったか、スプライトが HUD に重なったら HUD 全体を描き直す
+        hud_rects = hud.layer_rects()
+        hud_dirty = hud_key != self.hud_key or any(
+            r.collidelist(dirty) != -1 for r in hud_rects)
+        if hud_dirty:
+            for r in hud_rects:
+                screen.blit(bg, r, r.move(cx, 0))
+        if prof:
+            prof.mark("background")
+
+        drawn = {}
+        for items in placed:
+            for spr, r in items:
+                drawn[spr] = screen.blit(spr.image, r)
+        if particle_seq:
+            screen.blits(particle_seq, False)
+        self.particle_rect = particle_rect
+        if prof:
+            prof.mark("sprites")
+
+        if hud_dirty:
+            hud.draw_top(screen)
+            hud.draw_bottom_controls(screen, p1_keys_text, p2_keys_text)
+            dirty.extend(hud_rects)
+        if prof:
+            prof.mark("hud")
+
+        self.present(dirty)
+        self.drawn = drawn
+        self.hud_key = hud_key
+
+    def present(self, rects=None, record=True):
+        """
+        描き終えた画面を録画に渡し(録画中で record なら)、オーバーレイを重ねてから
+        rects(None なら全画面)を画面に反映する。オーバーレイの範囲も同じ更新に含める。
+        反映後は screen をオーバーレイを重ねる前に戻す(録画にもポーズ画面の背景にも入らない)。
+        試合が終わるフレームもシーンが切り替わる前にここを通るので、最後の一撃まで録画される。
+        """
+        prof = self.profiler
+        capture = self.capture
+        if record and capture is not None and capture.active:
+            capture.capture(self.screen)
+            if prof:
+                prof.mark("capture")
+        saved = None
+        if self.overlay is not None:
+            saved = draw_overlay(self.screen, self.overlay)
+            if rects is not None:
+                rects.append(saved[0])
+            if prof:
+                prof.mark("overlay")
+        if rects is None:
+            pg.display.update()
+        else:
+            pg.display.update(rects)
+        if saved is not None:
+            restore_overlay(self.screen, saved)
+        if prof:
+            prof.mark("present")
+
+
+# =====================
+# 静的な画面の事前合成
+# =====================
+def darken(surface, alpha):
+    """
+    surface に黒を alpha(0〜255) で重ねた不透明な Surface を新しく作る。
+    """
+    out = surface.convert() if pg.display.get_surface() else surface.copy()
+    shade = pg.Surface(out.get_size())
+    shade.fill((0, 0, 0))
+    shade.set_alpha(alpha)
+    out.blit(shade, (0, 0))
+    return out
+
+
+class CompositionCache:
+    """
+    暗くした背景や固定の文字などを合成済みの Surface として保持する。
+    キーはタプルで、先頭の要素(画面の種類)ごとにまとめて破棄できる。
+    """
+    def __init__(self):
+        self.surfaces = {}
+
+    def get(self, key, build):
+        """
+        key の合成結果を返す。無ければ build() を1回だけ呼んで作る。
+        """
+        surf = self.surfaces.get(key)
+        if surf is None:
+            surf = build()
+            self.surfaces[key] = surf
+        return surf
+
+    def invalidate(self, kind=None):
+        """
+        kind の画面の合成結果を破棄する(None なら全部)。
+        """
+        if kind is None:
+            self.surfaces.clear()
+            return
+        for key in [k for k in self.surfaces if k[0] == kind]:
+            del self.surfaces[key]
@@ -0,0 +1,278 @@
+import struct
+import sys
+import time
+
+from engine import DEFAULT_RULES, INPUT_BITS, Rules, new_match, random_policy
+from moves import character_from_source
+
+# リプレイファイルの形式
+# ヘッダ: マジック, ステージ番号, 予約(0。古い版は使われない seed を書いていた), ティック数,
+#         終了時ハッシュの有無, 終了時ハッシュ(sha1)
+# 試合は乱数を使わないので、開始状態と入力だけで再現できる(seed は持たない)
+REPLAY_MAGIC = b"KKR4"
+# 古い形式(読み込みだけできる)。KKR1: キャラクターが無い(ルールの数値だけ) / KKR2: ステージの横幅が無い /
+# KKR3: 入力が1人4ビット(コマンド技のビットが無い)
+REPLAY_MAGIC_V1 = b"KKR1"
+REPLAY_MAGIC_V2 = b"KKR2"
+REPLAY_MAGIC_V3 = b"KKR3"
+REPLAY_HEADER = struct.Struct("<4siIIB20s")
+# ルール: move_speed, jump_speed, gravity, max_hp, attack_speed, attack_life,
+#         attack_size(w, h), damage, match_time, max_attacks(None は -1)
+REPLAY_RULES = struct.Struct("<9idi")
+# (KKR3 以降)ステージの横幅(engine.Match.set_stage。0 は壁なし)
+REPLAY_STAGE = struct.Struct("<i")
+# 開始時のファイター: x, y, vx, vy, hp, facing, on_ground(engine.Match.state_hash と同じ並び)
+REPLAY_FIGHTER = struct.Struct("<6ib")
+# (KKR2 以降)P1・P2 のキャラクター定義: バイト数 varint, moves の JSON そのもの
+#   (0 バイトはルールの数値から作ったキャラクター。別の PC でも同じ技の表で再生できるように埋め込む)
+# 以降ファイル末尾まで、(連続ティック数 varint, P1 の入力 | P2 の入力 << INPUT_BITS の varint) の繰り返し
+#   (KKR3 までは P1 の入力 | P2 の入力 << 4 の1バイト)
+
+# 1ティックの入力は IN_* とコマンド技の番号(engine.INPUT_BITS ビット)
+INPUT_MASK = (1 << INPUT_BITS) - 1
+OLD_INPUT_BITS = 4
+OLD_INPUT_MASK = (1 << OLD_INPUT_BITS) - 1
+
+
+def write_varint(out, value):
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data, pos):
+    value = shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        value |= (b & 0x7F) << shift
+        if b < 0x80:
+            return value, pos
+        shift += 7
+
+
+def fighter_state(f):
+    return (f.rect.x, f.rect.y, f.vx, f.vy, f.hp, f.facing, f.on_ground)
+
+
+def apply_fighter_state(f, state):
+    f.rect.x, f.rect.y, f.vx, f.vy, f.hp, f.facing, on_ground = state
+    f.on_ground = bool(on_ground)
+    f.prev_pos = f.rect.topleft
+
+
+# =====================
+# 記録
+# =====================
+class InputRecorder:
+    """
+    試合開始時の状態(ルール・ファイターの位置)と、毎ティックの両プレイヤーの入力ビットを記録する。
+    同じ入力が続く間は回数だけ数える(ランレングス)ので、長時間でも数KBに収まる。
+    """
+    def __init__(self, match, stage=0):
+        self.stage = stage
+        self.rules = match.rules
+        self.stage_width = match.stage_width
+        self.start = [fighter_state(f) for f in (match.p1, match.p2)]
+        self.sources = [f.character.source or b"" for f in (match.p1, match.p2)]
+        self.runs = []       # [[入力バイト, 連続ティック数], ...]
+        self.ticks = 0
+        self.end_hash = None
+
+    def record(self, in1, in2):
+        """
+        1ティック分の入力を追加する(match.step() に渡したものと同じ値)。
+        """
+        code = (in1 & INPUT_MASK) | (in2 & INPUT_MASK) << INPUT_BITS
+        if self.runs and self.runs[-1][0] == code:
+            self.runs[-1][1] += 1
+        else:
+            self.runs.append([code, 1])
+        self.ticks += 1
+
+    def finish(self, match):
+        """
+        試合終了時に呼ぶ。最終状態のハッシュを残し、再生時のずれ(desync)検出に使う。
+        """
+        self.end_hash = match.state_hash()
+
+    def to_bytes(self):
+        r = self.rules
+        out = bytearray(REPLAY_HEADER.pack(
+            REPLAY_MAGIC, self.stage, 0, self.ticks,
+            self.end_hash is not None,
+            bytes.fromhex(self.end_hash) if self.end_hash else bytes(20)))
+        out += REPLAY_RULES.pack(
+            r.move_speed, r.jump_speed, r.gravity, r.max_hp, r.attack_speed, r.attack_life,
+            r.attack_size[0], r.attack_size[1], r.damage, r.match_time,
+            -1 if r.max_attacks is None else r.max_attacks)
+        out += REPLAY_STAGE.pack(self.stage_width or 0)
+        for state in self.start:
+            out += REPLAY_FIGHTER.pack(*state)
+        for source in self.sources:
+            write_varint(out, len(source))
+            out += source
+        for code, count in self.runs:
+            write_varint(out, count)
+            write_varint(out, code)
+        return bytes(out)
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+
+# =====================
+# 再生
+# =====================
+class Replay:
+    """
+    記録した入力を engine.Match にそのまま流し込んで試合を再現する。
+    run(): 描画なしで最大速度で進める(途中のティックまで飛ばすのにも使う)
+    verify(): 最後まで進めて、記録時のハッシュと一致するか調べる
+    """
+    def __init__(self, stage, rules, start, runs, ticks, end_hash=None, characters=(None, None),
+                 stage_width=None):
+        self.stage = stage
+        self.rules = rules
+        self.stage_width = stage_width
+        self.start = start
+        self.characters = characters
+        self.runs = runs
+        self.ticks = ticks
+        self.end_hash = end_hash
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, stage, _, ticks, has_hash, digest = REPLAY_HEADER.unpack_from(data)
+        if magic not in (REPLAY_MAGIC, REPLAY_MAGIC_V3, REPLAY_MAGIC_V2, REPLAY_MAGIC_V1):
+            raise ValueError("not a replay file")
+        pos = REPLAY_HEADER.size
+        (move_speed, jump_speed, gravity, max_hp, attack_speed, attack_life,
+         attack_w, attack_h, damage, match_time, max_attacks) = REPLAY_RULES.unpack_from(data, pos)
+        pos += REPLAY_RULES.size
+        rules = Rules(move_speed, jump_speed, gravity, max_hp, attack_speed, attack_life,
+                      (attack_w, attack_h), damage, match_time,
+                      None if max_attacks < 0 else max_attacks)
+        stage_width = None
+        if magic in (REPLAY_MAGIC, REPLAY_MAGIC_V3):
+            stage_width = REPLAY_STAGE.unpack_from(data, pos)[0] or None
+            pos += REPLAY_STAGE.size
+        start = []
+        for _ in range(2):
+            start.append(REPLAY_FIGHTER.unpack_from(data, pos))
+            pos += REPLAY_FIGHTER.size
+        characters = [None, None]
+        if magic != REPLAY_MAGIC_V1:
+            for i in range(2):
+                size, pos = read_varint(data, pos)
+                if size:
+                    characters[i] = character_from_source(data[pos:pos + size], name=f"P{i + 1}")
+                pos += size
+        runs = []
+        while pos < len(data):
+            count, pos = read_varint(data, pos)
+            if magic == REPLAY_MAGIC:
+                code, pos = read_varint(data, pos)
+            else:
+                old = data[pos]
+                pos += 1
+                code = (old & OLD_INPUT_MASK) | (old >> OLD_INPUT_BITS) << INPUT_BITS
+            runs.append([code, count])
+        return cls(stage, rules, start, runs, ticks,
+                   digest.hex() if has_hash else None, tuple(characters), stage_width)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+    def new_match(self):
+        """
+        記録開始時と同じ状態の試合を作る。
+        """
+        match = new_match(self.rules, self.characters)
+        match.set_stage(self.stage_width)
+        for f, state in zip((match.p1, match.p2), self.start):
+            apply_fighter_state(f, state)
+        return match
+
+    def inputs(self):
+        """
+        (P1 の入力, P2 の入力) を1ティックずつ返す。
+        """
+        for code, count in self.runs:
+            pair = (code & INPUT_MASK, code >> INPUT_BITS)
+            for _ in range(count):
+                yield pair
+
+    def run(self, match=None, until=None):
+        """
+        描画なしで until ティック目(None なら最後)まで進めた試合を返す。
+        """
+        if match is None:
+            match = self.new_match()
+        limit = self.ticks if until is None else min(until, self.ticks)
+        for in1, in2 in self.inputs():
+            if match.tick >= limit:
+                break
+            match.step(in1, in2)
+        return match
+
+    def verify(self):
+        """
+        最後まで再生し (一致したか, 再生後のハッシュ) を返す。ハッシュが記録されていなければ一致扱い。
+        """
+        got = self.run().state_hash()
+        return self.end_hash is None or got == self.end_hash, got
+
+
+def record_match(policy1, policy2, rules=DEFAULT_RULES, stage=0, characters=(None, None),
+                 stage_width=None):
+    """
+    ポリシー同士の試合を1つ記録する(動作確認・ベンチマーク用)。
+    """
+    match = new_match(rules, characters)
+    match.set_stage(stage_width)
+    rec = InputRecorder(match, stage)
+    while True:
+        in1 = policy1(match, match.p1, match.p2)
+        in2 = policy2(match, match.p2, match.p1)
+        rec.record(in1, in2)
+        if match.step(in1, in2):
+            break
+    rec.finish(match)
+    return rec
+
+
+# =====================
+# 実行(リプレイの検証・早送り)
+# =====================
+if __name__ == "__main__":
+    # 使い方: python replay.py ファイル [ティック]
+    #   ティックを省略すると最後まで再生して記録時のハッシュと照合する
+    #   画面付きで再生するときは python kakutou_koukaton.py --replay ファイル
+    if len(sys.argv) < 2:
+        # ファイル指定なし: ランダム入力の試合を記録→再生して往復を確認
+        rec = record_match(random_policy(1), random_policy(2))
+        data = rec.to_bytes()
+        replay = Replay.from_bytes(data)
+        print(f"recorded {rec.ticks} ticks in {len(data)} bytes ({len(rec.runs)} runs)")
+    else:
+        replay = Replay.load(sys.argv[1])
+        print(f"stage {replay.stage}, {replay.ticks} ticks")
+
+    start = time.perf_counter()
+    if len(sys.argv) > 2:
+        match = replay.run(until=int(sys.argv[2]))
+        print(f"tick {match.tick}: P1 hp {match.p1.hp}, P2 hp {match.p2.hp}, "
+              f"hash={match.state_hash()}")
+    else:
+        ok, got = replay.verify()
+        elapsed = time.perf_counter() - start
+        print(f"replayed in {elapsed:.3f}s ({replay.ticks / elapsed:.0f} ticks/s)  hash={got}")
+        if not ok:
+            print(f"DESYNC: recorded hash {replay.end_hash}")
+            sys.exit(1)
+        print("OK" if replay.end_hash else "OK (no recorded hash)")
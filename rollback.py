@@ -0,0 +1,295 @@
+import random
+import socket
+import struct
+import sys
+import time
+from collections import deque
+
+from engine import IN_ATTACK, IN_COMMAND_MASK, SIM_HZ, Rules, new_match, random_policy
+
+# 巻き戻せる最大ティック数(これ以上相手の入力が遅れたら待つ)
+MAX_ROLLBACK = 8
+# 1パケットに入れる直近の入力数(パケットが落ちても次のパケットで届く)
+INPUT_REDUNDANCY = 8
+# パケット: 先頭ティック, 入力数, 入力ビット × 入力数
+PACKET_HEADER = struct.Struct("<IB")
+
+
+# =====================
+# スナップショットのリングバッファ
+# =====================
+class SnapshotRing:
+    """
+    直近 size ティック分の試合状態を、あらかじめ確保したバッファに保存しておく。
+    save(): 今の状態を match.tick の枠に書く / load(tick): その時点に戻す
+    """
+    def __init__(self, match, size):
+        self.match = match
+        self.size = size
+        self.buffers = [bytearray(match.state_size()) for _ in range(size)]
+        self.ticks = [-1] * size
+
+    def save(self):
+        tick = self.match.tick
+        slot = tick % self.size
+        self.match.save_state(self.buffers[slot])
+        self.ticks[slot] = tick
+
+    def has(self, tick):
+        return self.ticks[tick % self.size] == tick
+
+    def load(self, tick):
+        slot = tick % self.size
+        if self.ticks[slot] != tick:
+            raise KeyError(f"snapshot for tick {tick} is gone")
+        self.match.load_state(self.buffers[slot])
+
+
+# =====================
+# 通信(ローカルの UDP ソケット)
+# =====================
+class LoopbackTransport:
+    """
+    localhost の UDP ソケットで相手とパケットをやり取りする(2台の PC 間通信の代わり)。
+    delay / jitter / loss を指定すると、送信をその分遅らせたり落としたりして回線を再現する
+    (単位は poll() の呼び出し回数 = ティック)。
+    """
+    def __init__(self, port=0, delay=0, jitter=0, loss=0.0, seed=0):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", port))
+        self.sock.setblocking(False)
+        self.address = self.sock.getsockname()
+        self.peer = None
+        self.delay = delay
+        self.jitter = jitter
+        self.loss = loss
+        self.rng = random.Random(seed)
+        self.outbox = []     # [(送信するティック, パケット), ...]
+        self.now = 0
+
+    def connect(self, address):
+        self.peer = address
+
+    def send(self, packet):
+        if self.loss and self.rng.random() < self.loss:
+            return
+        due = self.now + self.delay + (self.rng.randint(0, self.jitter) if self.jitter else 0)
+        self.outbox.append((due, packet))
+
+    def poll(self):
+        """
+        送信時刻になったパケットを送り、届いているパケットをすべて返す。
+        """
+        self.now += 1
+        if self.outbox:
+            waiting = []
+            for due, packet in self.outbox:
+                if due <= self.now:
+                    self.sock.sendto(packet, self.peer)
+                else:
+                    waiting.append((due, packet))
+            self.outbox = waiting
+        packets = []
+        while True:
+            try:
+                packet, _ = self.sock.recvfrom(512)
+            except (BlockingIOError, InterruptedError):
+                return packets
+            packets.append(packet)
+
+    def close(self):
+        self.sock.close()
+
+
+# =====================
+# ロールバック
+# =====================
+class RollbackSession:
+    """
+    相手の入力を予測して先に進め、遅れて届いた入力が予測と違えば
+    その時点のスナップショットに戻して今のティックまで計算し直す。
+    player: 自分が操作するファイター(0 = P1, 1 = P2)
+    advance(): 自分の入力を渡して1ティック進める。相手が MAX_ROLLBACK 以上遅れていたら進めずに False
+    """
+    def __init__(self, match, player, transport, max_rollback=MAX_ROLLBACK):
+        self.match = match
+        self.player = player
+        self.transport = transport
+        self.max_rollback = max_rollback
+        self.ring = SnapshotRing(match, max_rollback + 2)
+        self.local = {}          # tick -> 自分の入力
+        self.remote = {}         # tick -> 届いた相手の入力
+        self.predicted = {}      # tick -> 計算に使った相手の入力(予測を含む)
+        self.confirmed = -1      # ここまでのティックは相手の入力がすべて届いている
+        self.rollback_from = None
+
+        # 統計
+        self.rollbacks = 0
+        self.resimulated = 0
+        self.max_depth = 0
+        self.stalls = 0
+        self.resim_times = deque(maxlen=600)   # ティックごとの計算し直しにかかった秒
+
+    def _receive(self):
+        for packet in self.transport.poll():
+            first, count = PACKET_HEADER.unpack_from(packet)
+            for i in range(count):
+                tick = first + i
+                if tick <= self.confirmed or tick in self.remote:
+                    continue
+                bits = packet[PACKET_HEADER.size + i]
+                self.remote[tick] = bits
+                guess = self.predicted.get(tick)
+                if guess is not None and guess != bits:
+                    if self.rollback_from is None or tick < self.rollback_from:
+                        self.rollback_from = tick
+        while self.confirmed + 1 in self.remote:
+            self.confirmed += 1
+
+    def _send(self, tick):
+        first = max(0, tick - INPUT_REDUNDANCY + 1)
+        bits = bytes(self.local[t] for t in range(first, tick + 1))
+        self.transport.send(PACKET_HEADER.pack(first, len(bits)) + bits)
+
+    def predict(self, tick):
+        """
+        まだ届いていない相手の入力の予測: 最後に届いた入力を押し続けているとみなす
+        (攻撃とコマンド技は押した瞬間だけなので続けない)。
+        """
+        bits = self.remote.get(tick)
+        if bits is not None:
+            return bits
+        last = self.remote.get(self.confirmed, 0)
+        return last & ~(IN_ATTACK | IN_COMMAND_MASK)
+
+    def _step(self, tick):
+        remote = self.predict(tick)
+        self.predicted[tick] = remote
+        local = self.local[tick]
+        if self.player == 0:
+            return self.match.step(local, remote)
+        return self.match.step(remote, local)
+
+    def _resimulate(self):
+        """
+        予測が外れたティックに戻して、今のティックまで計算し直す。
+        """
+        start = time.perf_counter()
+        back = self.rollback_from
+        if back is not None:
+            self.rollback_from = None
+            tick = self.match.tick
+            self.ring.load(back)
+            for t in range(back, tick):
+                self.ring.save()
+                self._step(t)
+            self.rollbacks += 1
+            self.resimulated += tick - back
+            self.max_depth = max(self.max_depth, tick - back)
+        self.resim_times.append(time.perf_counter() - start)
+
+    def advance(self, bits):
+        """
+        自分の入力 bits で1ティック進める。進めたら True、相手を待つ場合は False。
+        """
+        match = self.match
+        tick = match.tick
+        self._receive()
+        self._resimulate()
+
+        if tick - self.confirmed > self.max_rollback:
+            self.stalls += 1
+            if tick > 0:
+                self._send(tick - 1)
+            return False
+
+        self.local[tick] = bits
+        self._send(tick)
+        self.ring.save()
+        self._step(tick)
+
+        # 巻き戻しで使わなくなった古い入力を捨てる
+        old = tick - self.max_rollback - INPUT_REDUNDANCY
+        self.local.pop(old, None)
+        self.predicted.pop(old, None)
+        if old < self.confirmed:
+            self.remote.pop(old, None)
+        return True
+
+    def idle(self):
+        """
+        進めずに通信だけ行う(試合終了後に残りの入力を確定させる用)。
+        自分の最後の入力を送り直し、届いた入力で予測が外れていれば計算し直す。
+        """
+        self._receive()
+        self._resimulate()
+        if self.match.tick > 0:
+            self._send(self.match.tick - 1)
+
+    def stats(self):
+        times = self.resim_times
+        return {"tick": self.match.tick, "rollbacks": self.rollbacks,
+                "resimulated": self.resimulated, "max_depth": self.max_depth,
+                "stalls": self.stalls,
+                "resim_avg_us": sum(times) / len(times) * 1e6 if times else 0.0,
+                "resim_max_us": max(times) * 1e6 if times else 0.0}
+
+
+# =====================
+# 実行(localhost で2つのセッションを対戦させ、結果が一致するか確認)
+# =====================
+if __name__ == "__main__":
+    # 使い方: python rollback.py [遅延ティック] [揺らぎ] [パケットロス率] [ティック数]
+    delay = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    jitter = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    loss = float(sys.argv[3]) if len(sys.argv) > 3 else 0.05
+    ticks = int(sys.argv[4]) if len(sys.argv) > 4 else 3000
+
+    # スナップショットの保存・復元の速さ
+    match = new_match()
+    policy = random_policy(0)
+    for _ in range(120):
+        match.step(policy(match, match.p1, match.p2), policy(match, match.p2, match.p1))
+    buf = bytearray(match.state_size())
+    n = 20000
+    start = time.perf_counter()
+    for _ in range(n):
+        match.save_state(buf)
+    save_us = (time.perf_counter() - start) / n * 1e6
+    start = time.perf_counter()
+    for _ in range(n):
+        match.load_state(buf)
+    load_us = (time.perf_counter() - start) / n * 1e6
+    print(f"snapshot {match.state_size()} bytes, {len(match.attacks)} attacks: "
+          f"save {save_us:.1f}us, load {load_us:.1f}us")
+
+    # 2つのセッションを同じプロセスで交互に進める(入力は各自の乱数ポリシー)
+    rules = Rules(match_time=ticks / SIM_HZ)
+    transports = [LoopbackTransport(delay=delay, jitter=jitter, loss=loss, seed=s) for s in (1, 2)]
+    transports[0].connect(transports[1].address)
+    transports[1].connect(transports[0].address)
+    sessions = [RollbackSession(new_match(rules), player, transports[player]) for player in (0, 1)]
+    policies = [random_policy(10), random_policy(11)]
+
+    start = time.perf_counter()
+    while any(s.match.tick < ticks for s in sessions):
+        for player, s in enumerate(sessions):
+            m = s.match
+            if m.tick >= ticks:
+                s.idle()
+                continue
+            me, enemy = (m.p1, m.p2) if player == 0 else (m.p2, m.p1)
+            s.advance(policies[player](m, me, enemy))
+    # 残りの入力が届いて両者の予測が確定するまで通信だけ続ける
+    while any(s.confirmed < ticks - 1 or s.rollback_from is not None for s in sessions):
+        for s in sessions:
+            s.idle()
+    elapsed = time.perf_counter() - start
+
+    for player, s in enumerate(sessions):
+        print(f"P{player + 1}: {s.stats()}")
+    hashes = [s.match.state_hash() for s in sessions]
+    print(f"{ticks} ticks in {elapsed:.2f}s  delay {delay}+{jitter} loss {loss:.0%}")
+    print("in sync" if hashes[0] == hashes[1] else f"DESYNC {hashes}")
+    for t in transports:
+        t.close()
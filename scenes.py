@@ -0,0 +1,108 @@
+import pygame as pg
+
+from render import draw_overlay, restore_overlay
+
+
+# =====================
+# シーン(画面)の基本クラス
+# =====================
+class Scene:
+    """
+    1つの画面(タイトル・選択・バトルなど)。
+    enter()/exit() で出入りし、毎フレーム handle_event() → update() → draw() が呼ばれる。
+    presents = True のシーンは draw() の中で自分で画面を更新する
+    (それ以外はマネージャが pg.display.update() を呼ぶ)。
+    """
+    presents = False
+
+    def __init__(self, game):
+        self.game = game
+        self.resources = {}
+
+    def resource(self, key, build):
+        """
+        シーン専用の使い回す資源(合成済みの Surface など)。release() するまで保持する。
+        """
+        res = self.resources.get(key)
+        if res is None:
+            res = build()
+            self.resources[key] = res
+        return res
+
+    def release(self):
+        self.resources.clear()
+
+    def enter(self, **kwargs):
+        pass
+
+    def exit(self):
+        pass
+
+    def handle_event(self, event):
+        pass
+
+    def update(self, dt):
+        pass
+
+    def draw(self, screen):
+        pass
+
+
+# =====================
+# シーンの切り替え
+# =====================
+class SceneManager:
+    """
+    名前で登録したシーンを切り替える。
+    switch_after() で「一定時間後に切り替える」予約ができ、その間もフレームは止まらない。
+    """
+    def __init__(self):
+        self.scenes = {}
+        self.current = None
+        self.name = None
+        self.timer = None   # (残り秒, 次のシーン名, enter に渡す引数)
+
+    def add(self, name, scene):
+        self.scenes[name] = scene
+
+    def switch(self, name, **kwargs):
+        """
+        すぐにシーンを切り替える(予約されていた切り替えは取り消す)。
+        """
+        self.timer = None
+        if self.current is not None:
+            self.current.exit()
+        self.name = name
+        self.current = self.scenes[name]
+        self.current.enter(**kwargs)
+
+    def switch_after(self, seconds, name, **kwargs):
+        """
+        seconds 秒後にシーンを切り替える。
+        """
+        self.timer = (seconds, name, kwargs)
+
+    def handle_event(self, event):
+        self.current.handle_event(event)
+
+    def update(self, dt):
+        if self.timer is not None:
+            remaining, name, kwargs = self.timer
+            remaining -= dt
+            if remaining <= 0:
+                self.switch(name, **kwargs)
+            else:
+                self.timer = (remaining, name, kwargs)
+        self.current.update(dt)
+
+    def draw(self, screen, overlay=None):
+        """
+        今のシーンを描く。自分で画面を更新しないシーンは overlay(render.draw_overlay() に渡せるもの)を
+        重ねてから全画面を更新し、screen はオーバーレイを重ねる前に戻す。
+        """
+        self.current.draw(screen)
+        if not self.current.presents:
+            saved = draw_overlay(screen, overlay) if overlay is not None else None
+            pg.display.update()
+            if saved is not None:
+                restore_overlay(screen, saved)
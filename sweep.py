@@ -0,0 +1,289 @@
+import argparse
+import inspect
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from engine import (
+    IN_LEFT, IN_RIGHT, IN_JUMP, IN_ATTACK, Rules, random_policy, run_match,
+)
+
+# ダメージヒストグラムの刻み(HP)
+DAMAGE_BIN = 10
+
+
+# =====================
+# 入力ポリシー(試合を自動で進めるためのスクリプト入力)
+# policy(match, me, enemy) -> 入力ビット
+# =====================
+def idle_policy(seed):
+    """
+    何もしない。
+    """
+    def policy(match, me, enemy):
+        return 0
+    return policy
+
+
+def aggressive_policy(seed):
+    """
+    相手に近づきながら一定間隔で攻撃する。
+    """
+    rng = random.Random(seed)
+
+    def policy(match, me, enemy):
+        bits = IN_RIGHT if enemy.rect.centerx > me.rect.centerx else IN_LEFT
+        if abs(enemy.rect.centerx - me.rect.centerx) < 300 and rng.random() < 0.2:
+            bits |= IN_ATTACK
+        return bits
+    return policy
+
+
+def zoning_policy(seed):
+    """
+    距離を取りつつ相手の方を向いて撃ち、近づかれたらジャンプする。
+    """
+    rng = random.Random(seed)
+
+    def policy(match, me, enemy):
+        dx = enemy.rect.centerx - me.rect.centerx
+        toward = IN_RIGHT if dx > 0 else IN_LEFT
+        away = IN_LEFT if dx > 0 else IN_RIGHT
+        if abs(dx) < 250:
+            bits = away | (IN_JUMP if rng.random() < 0.05 else 0)
+        else:
+            bits = toward if (me.facing > 0) != (dx > 0) else 0
+        if rng.random() < 0.15:
+            bits |= IN_ATTACK
+        return bits
+    return policy
+
+
+POLICIES = {
+    "idle": idle_policy,
+    "random": random_policy,
+    "aggressive": aggressive_policy,
+    "zoning": zoning_policy,
+}
+
+
+# =====================
+# ジョブ(パラメータ1点 × ポリシー組 × 試合のまとまり)
+# =====================
+def job_key(params, policies, chunk, seed, total, chunk_size):
+    """
+    再開時に完了済みかを判定するためのジョブの一意なキー。
+    seed・1組の試合数・1ジョブの試合数も含めるので、設定を変えて同じ結果ファイルに流すと
+    別の実験として最初から回り、集計(最後の | より前でまとめる)でも混ざらない。
+    """
+    items = ",".join(f"{k}={params[k]}" for k in sorted(params))
+    return (f"{items}|{policies[0]}-{policies[1]}"
+            f"|seed={seed},matches={total},chunk={chunk_size}|{chunk}")
+
+
+def run_job(params, policies, chunk, seed, total, chunk_size):
+    """
+    chunk 番目のジョブ(chunk * chunk_size 番目から最大 chunk_size 試合)を表示なしで回して集計する
+    (ワーカープロセスで実行)。試合の乱数の番号は seed ごとに total 試合ぶんの別の区間を使うので、
+    seed を変えても同じ試合が重ならない。
+    """
+    rules = Rules(**params)
+    first = chunk * chunk_size
+    matches = min(chunk_size, total - first)
+    stats = {
+        "key": job_key(params, policies, chunk, seed, total, chunk_size),
+        "params": params,
+        "policies": list(policies),
+        "seed": seed,
+        "chunk": chunk,
+        "first": first,
+        "matches": matches,
+        "wins": {"P1": 0, "P2": 0, "Draw": 0},
+        "ko": 0,
+        "time_up": 0,
+        "ticks_total": 0,
+        "ticks_min": None,
+        "ticks_max": 0,
+        "damage_hist": {},
+    }
+    start = time.perf_counter()
+    for i in range(matches):
+        n = (seed * total + first + i) * 2
+        match = run_match(POLICIES[policies[0]](n), POLICIES[policies[1]](n + 1), rules)
+        ticks = match.tick
+        stats["wins"][match.winner()] += 1
+        stats["ko" if match.is_ko() else "time_up"] += 1
+        stats["ticks_total"] += ticks
+        stats["ticks_max"] = max(stats["ticks_max"], ticks)
+        if stats["ticks_min"] is None or ticks < stats["ticks_min"]:
+            stats["ticks_min"] = ticks
+        # 各プレイヤーが受けたダメージを DAMAGE_BIN 刻みで数える
+        for f in (match.p1, match.p2):
+            b = str((rules.max_hp - max(0, f.hp)) // DAMAGE_BIN * DAMAGE_BIN)
+            stats["damage_hist"][b] = stats["damage_hist"].get(b, 0) + 1
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+def parse_number(text):
+    return float(text) if "." in text else int(text)
+
+
+def parse_value(name, text, default):
+    """
+    グリッドの値1つを Rules の既定値と同じ形にする。
+    数値はそのまま、(幅, 高さ) のような組は 40x20、None が既定の値は none か数値で書く。
+    書けない値は ValueError。
+    """
+    try:
+        if isinstance(default, tuple):
+            parts = text.split("x")
+            if len(parts) != len(default):
+                raise ValueError
+            return tuple(parse_number(v) for v in parts)
+        if default is None and text.lower() == "none":
+            return None
+        return parse_number(text)
+    except ValueError:
+        if isinstance(default, tuple):
+            form = "x".join(["N"] * len(default))
+        elif default is None:
+            form = "none or a number"
+        else:
+            form = "a number"
+        raise ValueError(f"bad value for {name}: {text!r} (expected {form})") from None
+
+
+def parse_grid(specs):
+    """
+    ["attack_speed=8,12", "attack_size=40x20,60x30", "max_attacks=none,3"] を
+    {"attack_speed": [8, 12], "attack_size": [(40, 20), (60, 30)], "max_attacks": [None, 3]} にする。
+    Rules に無い名前や形の合わない値は ValueError。
+    """
+    # Rules の引数になるものだけ(match_ticks などの読み取り専用の値は変えられない)
+    defaults = {name: p.default for name, p in inspect.signature(Rules.__init__).parameters.items()
+                if name != "self"}
+    grid = {}
+    for spec in specs:
+        name, _, values = spec.partition("=")
+        if name not in defaults:
+            raise ValueError(f"unknown rule: {name} (choose from {', '.join(defaults)})")
+        grid[name] = [parse_value(name, v, defaults[name]) for v in values.split(",")]
+    return grid
+
+
+def load_done(path):
+    """
+    結果ファイルから完了済みジョブのキーを読む。
+    中断で途中まで書かれた最終行は、追記で壊れないよう切り詰める。
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)["key"])
+            except (ValueError, KeyError):
+                pass
+    return done
+
+
+def summarize(path):
+    """
+    結果ファイルのジョブをパラメータ点・ポリシー組ごとにまとめて表示する。
+    """
+    table = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            key = rec["key"].rsplit("|", 1)[0]
+            row = table.setdefault(key, {"matches": 0, "P1": 0, "P2": 0, "Draw": 0,
+                                         "ko": 0, "ticks": 0, "hist": {}})
+            row["matches"] += rec["matches"]
+            for w in ("P1", "P2", "Draw"):
+                row[w] += rec["wins"][w]
+            row["ko"] += rec["ko"]
+            row["ticks"] += rec["ticks_total"]
+            for b, c in rec["damage_hist"].items():
+                row["hist"][b] = row["hist"].get(b, 0) + c
+
+    for key, row in sorted(table.items()):
+        n = row["matches"]
+        hist = " ".join(f"{b}:{row['hist'][b]}" for b in sorted(row["hist"], key=int))
+        print(f"{key}\n  matches={n}  P1={row['P1'] / n:.1%}  P2={row['P2'] / n:.1%}  "
+              f"Draw={row['Draw'] / n:.1%}  KO={row['ko'] / n:.1%}  "
+              f"avg_len={row['ticks'] / n:.0f}ticks\n  damage_hist {hist}")
+
+
+# =====================
+# 実行
+# =====================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="パラメータグリッド × ポリシーの総当たり試合を全コアで回す")
+    parser.add_argument("--grid", action="append", default=[],
+                        help="ルールの値の列挙 (例: attack_speed=8,12,16 / attack_size=40x20,60x30 / "
+                             "max_attacks=none,3)。複数指定可")
+    parser.add_argument("--policies", default="random,aggressive",
+                        help=f"使うポリシー(カンマ区切り、全組み合わせ): {','.join(POLICIES)}")
+    parser.add_argument("--matches", type=int, default=100, help="1組あたりの試合数")
+    parser.add_argument("--chunk", type=int, default=25, help="1ジョブあたりの試合数")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="sweep_results.jsonl",
+                        help="結果ファイル(1ジョブ1行で追記。既存のジョブはスキップして再開)")
+    parser.add_argument("--summary", action="store_true", help="結果ファイルを集計して表示するだけ")
+    args = parser.parse_args(argv)
+
+    if args.summary:
+        summarize(args.out)
+        return
+
+    try:
+        grid = parse_grid(args.grid)
+    except ValueError as e:
+        parser.error(str(e))
+    names = sorted(grid)
+    policies = args.policies.split(",")
+    for p in policies:
+        if p not in POLICIES:
+            parser.error(f"unknown policy: {p}")
+
+    chunks = (args.matches + args.chunk - 1) // args.chunk
+    done = load_done(args.out)
+    jobs = []
+    for values in itertools.product(*(grid[n] for n in names)):
+        params = dict(zip(names, values))
+        for pair in itertools.product(policies, repeat=2):
+            for c in range(chunks):
+                job = (params, pair, c, args.seed, args.matches, args.chunk)
+                if job_key(*job) in done:
+                    continue
+                jobs.append(job)
+
+    print(f"{len(jobs)} jobs to run ({len(done)} already done), {args.workers} workers")
+    start = time.perf_counter()
+    with open(args.out, "a", encoding="utf-8") as out, \
+            ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(run_job, *job) for job in jobs]
+        for i, fut in enumerate(as_completed(futures), 1):
+            out.write(json.dumps(fut.result(), ensure_ascii=False) + "\n")
+            out.flush()
+            print(f"\r{i}/{len(jobs)} jobs", end="", file=sys.stderr)
+    print(f"\nfinished in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    summarize(args.out)
+
+
+if __name__ == "__main__":
+    main()